@@ -0,0 +1,172 @@
+"""Stage-level benchmark of the comparison pipeline on synthetic workbooks.
+
+Each stage of ``compare_excels`` is run on its own, timed, and (unless
+``--no-memory``) run under tracemalloc to record its peak Python/NumPy
+allocation. tracemalloc slows allocation-heavy stages down, so use
+``--no-memory`` for timings you want to compare against each other.
+
+    python benchmarks/bench_stages.py                      # 10k, 100k and 1M rows
+    python benchmarks/bench_stages.py --rows 10000 --json now.json
+    python benchmarks/bench_stages.py --rows 10000 --baseline before.json
+
+With ``--baseline``, stages that got slower than the baseline by more than
+``--tolerance`` are listed and the exit code is 1. Workbooks are generated
+once into ``--data`` and reused by later runs.
+"""
+
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from desk_comparator.compare import (  # noqa: E402
+    aggregate_by_desk,
+    blank_desks,
+    common_serial_rooms,
+    desk_anti_join,
+    desk_rooms,
+    encode_pairs,
+    mismatch_rows,
+    report_labels,
+    resolve_desks,
+    unique_serial_desks,
+)
+from desk_comparator.engine import compare_excels  # noqa: E402
+from desk_comparator.prepare import prepare_input  # noqa: E402
+from desk_comparator.reader import read_inventory  # noqa: E402
+from desk_comparator.writer import save_csv, save_formatted_excel  # noqa: E402
+
+from synthetic import generate_pair  # noqa: E402
+
+DEFAULT_ROWS = [10_000, 100_000, 1_000_000]
+
+
+class StageTimer:
+    """Runs stages, recording wall time and (optionally) peak traced memory."""
+
+    def __init__(self, memory=True):
+        self.memory = memory
+        self.stages = {}
+
+    def run(self, name, func, *args):
+        gc.collect()
+        if self.memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            result = func(*args)
+        finally:
+            seconds = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1] if self.memory else None
+            if self.memory:
+                tracemalloc.stop()
+        self.stages[name] = {'seconds': round(seconds, 4), 'peak_mb': None if peak is None else round(peak / 2 ** 20, 1)}
+        return result
+
+
+def _lookups(desks, serials, df1, df2):
+    blank = blank_desks(desks)
+    room_codes, rooms = desk_rooms(desks)
+    return (blank, rooms, unique_serial_desks(df1, blank, len(serials)), unique_serial_desks(df2, blank, len(serials)),
+            common_serial_rooms(blank, room_codes, rooms, len(serials), df1, df2))
+
+
+def _resolve(only1, only2, blank, rooms, to_desk_1, to_desk_2, to_room):
+    only1 = only1.assign(Desk_ID=resolve_desks(only1, blank, to_desk_2, to_room, len(rooms)), Side=1)
+    only2 = only2.assign(Desk_ID=resolve_desks(only2, blank, to_desk_1, to_room, len(rooms)), Side=2)
+    return pd.concat([only1, only2], ignore_index=True)
+
+
+def bench(rows, data_folder, memory=True):
+    """Benchmark one input size; returns ``{'rows': ..., 'stages': {...}}``."""
+    file1, file2 = generate_pair(rows, data_folder)
+    timer = StageTimer(memory)
+
+    timer.run('read', lambda: (read_inventory(file1), read_inventory(file2)))
+    prepared1, prepared2 = timer.run('read+normalize', lambda: (prepare_input(file1), prepare_input(file2)))
+    desks, serials, (df1, df2) = timer.run('encode', encode_pairs, prepared1.pairs, prepared2.pairs)
+    blank, rooms, to_desk_1, to_desk_2, to_room = timer.run('lookups', _lookups, desks, serials, df1, df2)
+    only1, only2 = timer.run('anti_join', desk_anti_join, df1, df2)
+    long_rows = timer.run('resolve', _resolve, only1, only2, blank, rooms, to_desk_1, to_desk_2, to_room)
+    details = timer.run('mismatch_rows', mismatch_rows, long_rows, report_labels(desks, rooms), serials)
+    report = timer.run('aggregate', aggregate_by_desk, details)
+    with tempfile.TemporaryDirectory() as tmp:
+        timer.run('write_xlsx', save_formatted_excel, report, os.path.join(tmp, 'report.xlsx'))
+        timer.run('write_csv', save_csv, report, os.path.join(tmp, 'report.csv'))
+    timer.run('end_to_end', lambda: compare_excels(file1, file2, None, parallel=False))
+
+    stages = timer.stages
+    stages['normalize'] = {
+        'seconds': round(stages['read+normalize']['seconds'] - stages['read']['seconds'], 4),
+        'peak_mb': stages['read+normalize']['peak_mb'],
+    }
+    return {
+        'rows': rows,
+        'rows_file2': prepared2.rows,
+        'mismatch_rows': len(report),
+        'memory_traced': memory,
+        'stages': stages,
+    }
+
+
+def regressions(results, baseline, tolerance):
+    """(rows, stage, before, now) for stages slower than ``baseline`` by more than ``tolerance``."""
+    before = {r['rows']: r['stages'] for r in baseline}
+    slower = []
+    for result in results:
+        for stage, now in result['stages'].items():
+            old = before.get(result['rows'], {}).get(stage)
+            # sub-10ms stages are all noise
+            if old and old['seconds'] >= 0.01 and now['seconds'] > old['seconds'] * (1 + tolerance):
+                slower.append((result['rows'], stage, old['seconds'], now['seconds']))
+    return slower
+
+
+def _print_result(result):
+    print(f"\n{result['rows']:,} rows ({result['mismatch_rows']:,} report rows)")
+    for stage, m in result['stages'].items():
+        peak = '' if m['peak_mb'] is None else f"{m['peak_mb']:>10.1f} MB"
+        print(f"  {stage:<16}{m['seconds']:>10.3f} s{peak}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time and memory-profile each comparison stage.')
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_ROWS)
+    parser.add_argument('--data', default=os.path.join(tempfile.gettempdir(), 'desk_comparator_bench'),
+                        help='folder for the generated workbooks (reused between runs)')
+    parser.add_argument('--no-memory', action='store_true', help='do not trace memory (faster, cleaner timings)')
+    parser.add_argument('--json', help='write the results to this file')
+    parser.add_argument('--baseline', help='results file of an earlier run to check for regressions')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed slowdown vs baseline (default 0.2 = 20%%)')
+    args = parser.parse_args(argv)
+
+    results = []
+    for rows in args.rows:
+        result = bench(rows, args.data, memory=not args.no_memory)
+        _print_result(result)
+        results.append(result)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            slower = regressions(results, json.load(f), args.tolerance)
+        for rows, stage, old, now in slower:
+            print(f'REGRESSION {rows:,} rows {stage}: {old:.3f} s -> {now:.3f} s')
+        if slower:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
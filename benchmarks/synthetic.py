@@ -0,0 +1,142 @@
+"""Synthetic inventory workbooks for benchmarking.
+
+``generate_inventory`` builds an export shaped like the real ones: rooms with
+3- and 4-digit desk numbers written in several styles, two ``S.N*`` columns,
+skan/skan2 scans for serials that were typed with a leading zero, blank
+desks (some with only a Place), Dom rows and a mix of Type values.
+``perturb`` turns it into the "other" export of a comparison by moving,
+dropping and adding a share of the serials. Generation is vectorized, so a
+1M-row frame takes seconds; writing the workbook is what takes time.
+
+    python benchmarks/synthetic.py 100000 -o bench_data
+"""
+
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook
+
+COLUMNS = ['Desk_ID', 'Place', 'Type', 'S.N1', 'S.N2', 'skan', 'skan2', 'Comment']
+ROOMS = ['Biuro', 'Open Space', 'Sala', 'Magazyn', 'Recepcja', 'Dom']
+TYPES = ['MNTR', 'PC', 'DOCK', 'PHONE']
+TYPE_WEIGHTS = [0.75, 0.15, 0.06, 0.04]
+_ALNUM = np.array(list('ABCDEFGHJKLMNPRSTUVWXYZ0123456789'))
+
+
+def _serials(rnd, n):
+    # 'V' + 7 characters: the monitor serial format the normalization expects
+    body = _ALNUM[rnd.integers(0, len(_ALNUM), size=(n, 7))]
+    return np.char.add('V', np.array([''.join(r) for r in body]))
+
+
+def _desk_ids(rnd, n, n_desks):
+    room = np.array(ROOMS)[rnd.integers(0, len(ROOMS), size=n)]
+    number = rnd.integers(100, 100 + n_desks // len(ROOMS) + 1, size=n).astype(str)
+    style = rnd.integers(0, 4, size=n)
+    sep = np.array([' ', '_', '.', ''])[style]
+    desk = np.char.add(np.char.add(room.astype(str), sep), number)
+    # some exports use upper case or already padded 4-digit numbers
+    desk = np.where(rnd.random(n) < 0.1, np.char.upper(desk), desk)
+    desk = np.where(rnd.random(n) < 0.2, np.char.add(desk, '0'), desk)
+    return desk.astype(object), room
+
+
+def generate_inventory(rows, seed=0, blank_share=0.03, dom_share=0.02, zero_share=0.02, single_share=0.3):
+    """Return a DataFrame with ``rows`` rows in the COLUMNS layout."""
+    rnd = np.random.default_rng(seed)
+    n_desks = max(rows // 2, 10)
+    desk, room = _desk_ids(rnd, rows, n_desks)
+    place = np.full(rows, None, dtype=object)
+
+    # Dom rows: a share of the rows belong to the 'Dom' (home office) room
+    dom = rnd.random(rows) < dom_share
+    desk[dom] = np.char.add('Dom ', rnd.integers(100, 200, size=dom.sum()).astype(str)).astype(object)
+
+    # blank desks, half of them with only the room in Place
+    blank = rnd.random(rows) < blank_share
+    desk[blank] = None
+    with_place = blank & (rnd.random(rows) < 0.5)
+    place[with_place] = room[with_place]
+
+    sn1 = _serials(rnd, rows).astype(object)
+    sn2 = _serials(rnd, rows).astype(object)
+    sn2[rnd.random(rows) < single_share] = None
+
+    # serials typed with a leading zero; the right one is in the scan columns
+    # (S.N1 is repaired from skan2, S.N2 from skan)
+    skan = np.full(rows, None, dtype=object)
+    skan2 = np.full(rows, None, dtype=object)
+    for col, scans in ((sn1, skan2), (sn2, skan)):
+        zero = (rnd.random(rows) < zero_share) & pd.notna(col)
+        true = col[zero].astype(str)
+        as_digits = rnd.random(zero.sum()) < 0.3
+        scans[zero] = np.where(as_digits, np.char.add('S', np.char.add('6', rnd.integers(10 ** 6, 10 ** 7, size=zero.sum()).astype(str))),
+                               np.char.add('SCN', true)).astype(object)
+        col[zero] = np.char.add('0', np.char.lstrip(true, 'V')).astype(object)
+
+    # formatting noise that normalization has to undo
+    noisy = rnd.random(rows) < 0.05
+    sn1[noisy] = np.array([f' {str(s).lower()[:4]}-{str(s)[4:]} ' for s in sn1[noisy]], dtype=object)
+
+    kind = np.array(TYPES)[rnd.choice(len(TYPES), size=rows, p=TYPE_WEIGHTS)]
+    return pd.DataFrame({
+        'Desk_ID': desk,
+        'Place': place,
+        'Type': kind.astype(object),
+        'S.N1': sn1,
+        'S.N2': sn2,
+        'skan': skan,
+        'skan2': skan2,
+        'Comment': np.where(rnd.random(rows) < 0.1, 'checked', None),
+    }, columns=COLUMNS)
+
+
+def perturb(df, seed=1, move_share=0.02, drop_share=0.01, add_share=0.01, blank_share=0.01):
+    """Second export of the same inventory: moved, dropped, added and blanked rows."""
+    rnd = np.random.default_rng(seed)
+    out = df.copy()
+    n = len(out)
+    moved = rnd.random(n) < move_share
+    out.loc[moved, 'Desk_ID'] = out['Desk_ID'].sample(frac=1, random_state=seed).to_numpy()[moved]
+    blanked = rnd.random(n) < blank_share
+    out.loc[blanked, 'Desk_ID'] = None
+    out = out[rnd.random(n) >= drop_share]
+    added = generate_inventory(max(int(n * add_share), 1), seed=seed + 1000)
+    return pd.concat([out, added], ignore_index=True)
+
+
+def write_workbook(df, path):
+    """Write ``df`` as a single-sheet .xlsx (streaming, constant memory)."""
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet('Inventory')
+    ws.append(list(df.columns))
+    for row in df.itertuples(index=False):
+        ws.append([None if v is None or v != v else v for v in row])
+    wb.save(path)
+
+
+def generate_pair(rows, folder, seed=0):
+    """Write ``inventory_<rows>_<seed>_a.xlsx`` / ``_b.xlsx`` to ``folder`` unless present; return both paths."""
+    os.makedirs(folder, exist_ok=True)
+    paths = [os.path.join(folder, f'inventory_{rows}_{seed}_{side}.xlsx') for side in ('a', 'b')]
+    if not all(os.path.exists(p) for p in paths):
+        first = generate_inventory(rows, seed=seed)
+        write_workbook(first, paths[0])
+        write_workbook(perturb(first, seed=seed + 1), paths[1])
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Write a pair of synthetic inventory workbooks.')
+    parser.add_argument('rows', type=int, help='rows in the first workbook')
+    parser.add_argument('-o', '--output-folder', default='bench_data')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    for path in generate_pair(args.rows, args.output_folder, args.seed):
+        print(path)
+
+
+if __name__ == '__main__':
+    main()
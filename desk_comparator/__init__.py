@@ -0,0 +1,33 @@
+"""Headless desk/serial comparison engine behind the Desk Comparator GUI.
+
+Importing this package is cheap on purpose: pandas and openpyxl are only loaded
+by ``desk_comparator.engine`` (and the helpers it uses), never by the package
+itself or by the command-line entry point, so ``python -m desk_comparator``
+starts fast and never needs a display.
+"""
+
+from .errors import (
+    ComparisonCancelled,
+    ComparisonError,
+    EmptyInputError,
+    InputFileError,
+    NoSerialColumnsError,
+    OutputFolderError,
+    ReadError,
+    SaveError,
+)
+
+from .progress import CancelToken, ProgressChannel
+
+__all__ = [
+    'CancelToken',
+    'ComparisonCancelled',
+    'ComparisonError',
+    'EmptyInputError',
+    'InputFileError',
+    'NoSerialColumnsError',
+    'OutputFolderError',
+    'ProgressChannel',
+    'ReadError',
+    'SaveError',
+]
@@ -0,0 +1,7 @@
+import sys
+
+from .cli import main
+
+# Guarded so spawned worker processes, which re-import the main module, do not re-run the CLI.
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,123 @@
+"""On-disk cache of prepared (normalized) inputs.
+
+A typical workflow compares one big master export against a new daily export
+every day; re-parsing the unchanged master is most of the run time. Entries
+are keyed by the SHA-256 of the file content plus ``NORMALIZATION_VERSION``,
+so renaming/copying a file still hits and any change to the data or to the
+normalization rules misses. Pairs are stored as Parquet (dictionary-encoded
+columns) when pyarrow is installed, otherwise as a pandas pickle. The least
+recently used entries are evicted once the cache grows past ``max_bytes``.
+"""
+
+import hashlib
+import json
+import os
+
+import pandas as pd
+
+from .prepare import NORMALIZATION_VERSION, PreparedInput
+from .storage import file_digest, user_data_dir
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+try:
+    import pyarrow  # noqa: F401
+    _PAIRS_EXT = '.parquet'
+except ImportError:
+    _PAIRS_EXT = '.pkl'
+
+
+def default_cache_dir():
+    """Per-user cache folder; DESK_COMPARATOR_CACHE overrides it."""
+    return os.environ.get('DESK_COMPARATOR_CACHE') or user_data_dir('inputs')
+
+
+class InputCache:
+    """Directory of ``<key><ext>`` pair files with a ``<key>.json`` metadata sidecar."""
+
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def key_for(self, path):
+        return f'v{NORMALIZATION_VERSION}-{file_digest(path)}'
+
+    @staticmethod
+    def sheet_key(key, sheet):
+        """Key of one sheet of the file with key ``key`` (``key`` itself for the default first sheet)."""
+        if sheet is None:
+            return key
+        return f"{key}-{hashlib.sha256(sheet.encode('utf-8')).hexdigest()[:16]}"
+
+    def _paths(self, key):
+        base = os.path.join(self.directory, key)
+        return base + _PAIRS_EXT, base + '.json'
+
+    def load(self, key, path):
+        """Return the cached ``PreparedInput`` for ``key``, or None on a miss."""
+        pairs_path, meta_path = self._paths(key)
+        if not (os.path.exists(pairs_path) and os.path.exists(meta_path)):
+            return None
+        try:
+            with open(meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+            if _PAIRS_EXT == '.parquet':
+                pairs = pd.read_parquet(pairs_path)
+            else:
+                pairs = pd.read_pickle(pairs_path)
+        except Exception:
+            # unreadable/partial entry: treat as a miss, it will be rewritten
+            return None
+        # mark as recently used for eviction
+        for p in (pairs_path, meta_path):
+            os.utime(p)
+        meta['messages'] = list(meta.get('messages', [])) + [f'{os.path.basename(path)}: loaded from cache']
+        return PreparedInput(path=path, pairs=pairs, **{k: meta[k] for k in (
+            'rows', 'serial_columns', 'skan_replaced', 'skan_samples', 'messages')})
+
+    def store(self, key, prepared):
+        pairs_path, meta_path = self._paths(key)
+        meta = {
+            'rows': prepared.rows,
+            'serial_columns': [str(c) for c in prepared.serial_columns],
+            'skan_replaced': prepared.skan_replaced,
+            'skan_samples': [[str(v) for v in sample] for sample in prepared.skan_samples],
+            'messages': prepared.messages,
+        }
+        # write to temporary names first so a crash never leaves a half entry;
+        # the metadata file is the commit marker and is written last. The names
+        # are per process: service workers may store the same baseline at once
+        tmp = f'.{os.getpid()}.tmp'
+        tmp_pairs, tmp_meta = pairs_path + tmp, meta_path + tmp
+        if _PAIRS_EXT == '.parquet':
+            prepared.pairs.to_parquet(tmp_pairs, index=False)
+        else:
+            prepared.pairs.to_pickle(tmp_pairs)
+        with open(tmp_meta, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(tmp_pairs, pairs_path)
+        os.replace(tmp_meta, meta_path)
+        self.evict()
+
+    def evict(self):
+        """Delete least recently used entries until the cache fits in ``max_bytes``."""
+        entries = {}
+        for name in os.listdir(self.directory):
+            full = os.path.join(self.directory, name)
+            if name.endswith('.tmp') or not os.path.isfile(full):
+                continue
+            key = os.path.splitext(name)[0]
+            st = os.stat(full)
+            files, size, used = entries.get(key, ([], 0, 0))
+            entries[key] = (files + [full], size + st.st_size, max(used, st.st_mtime))
+        total = sum(size for _, size, _ in entries.values())
+        for files, size, _ in sorted(entries.values(), key=lambda entry: entry[2]):
+            if total <= self.max_bytes:
+                break
+            for full in files:
+                try:
+                    os.remove(full)
+                except FileNotFoundError:
+                    pass
+            total -= size
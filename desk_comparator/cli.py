@@ -0,0 +1,343 @@
+"""Command-line entry point: ``python -m desk_comparator compare FILE1 FILE2``.
+
+Nothing here imports tkinter, and the engine (with pandas/openpyxl) is only
+imported once a command actually runs, so ``--help`` and argument errors are
+instant and the tool works on display-less servers and in cron jobs.
+"""
+
+import argparse
+import os
+import sys
+
+from .errors import ComparisonError
+from .instrument import RunReport
+
+
+def _print_progress(percent, message):
+    print(f'[{percent:3d}%] {message}', file=sys.stderr)
+
+
+def _run_report(args):
+    return RunReport(memory=args.trace_memory, profile=args.profile or (), profile_dir=args.profile_dir)
+
+
+def _save_run_report(args, report):
+    if args.run_report and report is not None:
+        report.save(args.run_report)
+        print(f'Run report saved to: {args.run_report}', file=sys.stderr)
+
+
+def _add_instrumentation_args(parser):
+    group = parser.add_argument_group('instrumentation')
+    group.add_argument('--run-report', metavar='FILE', help='write per-stage timings/row counts as JSON to FILE')
+    group.add_argument('--trace-memory', action='store_true', help='record peak memory per stage (slower)')
+    group.add_argument('--profile', metavar='STAGE', action='append',
+                       help='run STAGE under cProfile (repeatable; e.g. read, normalize_serials, compare)')
+    group.add_argument('--profile-dir', help='folder for the .prof files (default: current directory)')
+
+
+def _cmd_compare(args):
+    from .cache import default_cache_dir
+    from .engine import compare_excels
+    from .history import default_history_path
+
+    sheets = 'all' if args.all_sheets else args.sheet
+    if sheets and (args.snapshot or args.out_of_core):
+        print('--sheet/--all-sheets cannot be combined with --snapshot or --out-of-core', file=sys.stderr)
+        return 2
+    if (args.history is not None or args.near_matches) and (args.snapshot or args.out_of_core):
+        print('--history/--near-matches cannot be combined with --snapshot or --out-of-core', file=sys.stderr)
+        return 2
+    if args.snapshot:
+        return _compare_incremental(args)
+    if args.out_of_core:
+        if args.partitions < 1:
+            print('--partitions must be at least 1', file=sys.stderr)
+            return 2
+        return _compare_out_of_core(args)
+    result = compare_excels(
+        args.file1,
+        args.file2,
+        args.output_folder,
+        progress_callback=None if args.quiet else _print_progress,
+        parallel=False if args.no_parallel else None,
+        cache_dir=None if args.no_cache else (args.cache_dir or default_cache_dir()),
+        output_format=args.format,
+        report=_run_report(args),
+        sheets=sheets,
+        history=None if args.history is None else (args.history or default_history_path()),
+        near_matches=args.near_matches,
+    )
+    _print_comparison(args, result)
+    return 0
+
+
+def _compare_out_of_core(args):
+    from .partition import compare_partitioned
+
+    result = compare_partitioned(
+        args.file1,
+        args.file2,
+        args.output_folder,
+        partitions=args.partitions,
+        work_dir=args.work_dir,
+        progress_callback=None if args.quiet else _print_progress,
+        output_format=args.format,
+        report=_run_report(args),
+    )
+    _print_comparison(args, result)
+    return 0
+
+
+def _print_comparison(args, result):
+    for warning in result.warnings:
+        print(f'Warning: {warning}', file=sys.stderr)
+    print(f"Mismatch rows: {result.stats['mismatch_rows']} "
+          f"(only in file 1: {result.stats['only_in_file1']}, only in file 2: {result.stats['only_in_file2']})")
+    print(f'Results saved to: {result.output_path}')
+    if result.near_matches is not None:
+        print(f'Likely misread serial pairs: {len(result.near_matches)}'
+              + (f', saved to: {result.near_matches_path}' if result.near_matches_path else ''))
+    _save_run_report(args, result.report)
+
+
+def _compare_incremental(args):
+    from .cache import default_cache_dir
+    from .snapshot import check_snapshot_name, compare_incremental
+
+    try:
+        check_snapshot_name(args.snapshot)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    result = compare_incremental(
+        args.file1,
+        args.file2,
+        args.output_folder,
+        name=args.snapshot,
+        snapshot_dir=args.snapshot_dir,
+        progress_callback=None if args.quiet else _print_progress,
+        parallel=False if args.no_parallel else None,
+        cache_dir=None if args.no_cache else (args.cache_dir or default_cache_dir()),
+        output_format=args.format,
+        report=_run_report(args),
+    )
+    for warning in result.warnings:
+        print(f'Warning: {warning}', file=sys.stderr)
+    since = f'since {result.previous_run}' if result.previous_run else '(first run)'
+    print(f"Serial mismatches {since}: new {result.stats['new']}, resolved {result.stats['resolved']}, "
+          f"unchanged {result.stats['unchanged']}")
+    if result.output_path:
+        print(f'Changes saved to: {result.output_path}')
+    else:
+        print('No changes to save.')
+    _save_run_report(args, result.report)
+    return 0
+
+
+def _cmd_reconcile(args):
+    from .cache import default_cache_dir
+    from .multi import MAX_SOURCES, compare_many
+
+    if not 2 <= len(args.files) <= MAX_SOURCES:
+        print(f'reconcile needs between 2 and {MAX_SOURCES} files, got {len(args.files)}', file=sys.stderr)
+        return 2
+    if args.label and len(args.label) != len(args.files):
+        print(f'Give one -l/--label per file ({len(args.files)}), got {len(args.label)}', file=sys.stderr)
+        return 2
+    result = compare_many(
+        args.files,
+        args.output_folder,
+        labels=args.label,
+        progress_callback=None if args.quiet else _print_progress,
+        parallel=False if args.no_parallel else None,
+        cache_dir=None if args.no_cache else (args.cache_dir or default_cache_dir()),
+        output_format=args.format,
+        report=_run_report(args),
+    )
+    for warning in result.warnings:
+        print(f'Warning: {warning}', file=sys.stderr)
+    print(f"Serials missing from at least one source: {result.stats['mismatch_rows']} "
+          f"({len(args.files)} sources, {result.stats['desks_compared']} desks)")
+    print(f'Results saved to: {result.output_path}')
+    _save_run_report(args, result.report)
+    return 0
+
+
+def _cmd_history(args):
+    from .history import SerialHistory, default_history_path
+
+    path = args.db or default_history_path()
+    if not os.path.exists(path):
+        print(f'No serial history at {path} (run compare with --history first)', file=sys.stderr)
+        return 1
+    with SerialHistory(path) as history:
+        for serial in args.serials:
+            seen = history.where(serial)
+            if not seen:
+                print(f'{serial}: never seen')
+                continue
+            print(f'{serial}:')
+            for row in seen:
+                print(f"  {row['desk']:<16} last seen {row['last_seen']} in {row['last_path']}"
+                      f" (first {row['first_seen']}, {row['sources']} file(s))")
+    return 0
+
+
+def _cmd_watch(args):
+    from .cache import default_cache_dir
+    from .watch import FolderWatcher
+
+    if not os.path.isdir(args.folder):
+        print(f'Not a folder: {args.folder}', file=sys.stderr)
+        return 2
+    if os.path.realpath(args.folder) == os.path.realpath(args.output_folder):
+        print('The output folder must differ from the watched folder (use -o)', file=sys.stderr)
+        return 2
+    if args.queue_size < 1:
+        print('--queue-size must be at least 1', file=sys.stderr)
+        return 2
+    watcher = FolderWatcher(
+        args.folder,
+        args.baseline,
+        args.output_folder,
+        interval=args.interval,
+        queue_size=args.queue_size,
+        output_format=args.format,
+        cache_dir=None if args.no_cache else (args.cache_dir or default_cache_dir()),
+        process_existing=args.process_existing,
+        log=lambda message: print(message, flush=True),
+    )
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
+    stats = watcher.stats
+    print(f"Stopped: {stats['done']} compared, {stats['failed']} failed, "
+          f"{stats['queued'] - stats['done'] - stats['failed']} not started", file=sys.stderr)
+    return 0
+
+
+def _cmd_serve(args):
+    from .cache import default_cache_dir
+    from .service import serve
+
+    if args.max_baselines < 1:
+        print('--max-baselines must be at least 1', file=sys.stderr)
+        return 2
+    try:
+        serve(
+            host=args.host,
+            port=args.port,
+            verbose=args.verbose,
+            log=lambda message: print(message, file=sys.stderr, flush=True),
+            work_dir=args.work_dir,
+            workers=args.workers,
+            max_baselines=args.max_baselines,
+            cache_dir=None if args.no_cache else (args.cache_dir or default_cache_dir()),
+        )
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='python -m desk_comparator',
+        description='Compare desk/serial inventory exports without the GUI.',
+    )
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    compare = sub.add_parser('compare', help='compare two inventory workbooks')
+    compare.add_argument('file1', help='first workbook')
+    compare.add_argument('file2', help='second workbook')
+    compare.add_argument('-o', '--output-folder', default=os.getcwd(),
+                         help='folder for desk_mismatches_<timestamp>.<format> (default: current directory)')
+    compare.add_argument('-f', '--format', choices=('xlsx', 'csv', 'parquet'), default='xlsx',
+                         help='report format: formatted Excel (default), or CSV/Parquet for scripts')
+    compare.add_argument('-q', '--quiet', action='store_true', help='do not print progress messages')
+    compare.add_argument('--no-parallel', action='store_true',
+                         help='read both files in this process instead of two worker processes')
+    compare.add_argument('--cache-dir', help='parsed-input cache folder (default: per-user cache, or $DESK_COMPARATOR_CACHE)')
+    compare.add_argument('--no-cache', action='store_true', help='always parse both files, do not read or write the cache')
+    sheet = compare.add_mutually_exclusive_group()
+    sheet.add_argument('--sheet', action='append',
+                       help='compare this sheet of the workbooks (repeatable; default: the first sheet only); '
+                            'a workbook with a single sheet is read whole')
+    sheet.add_argument('--all-sheets', action='store_true',
+                       help='compare every sheet of both workbooks; the report gets a Sheet column')
+    mode = compare.add_mutually_exclusive_group()
+    mode.add_argument('--snapshot', metavar='NAME',
+                      help='incremental mode: report only new/resolved mismatches since the last run with this name')
+    mode.add_argument('--out-of-core', action='store_true',
+                      help='for files larger than memory: stream them into on-disk buckets and compare bucket by bucket')
+    compare.add_argument('--history', nargs='?', metavar='DB', const='',
+                         help='use and update the serial history: blank desks neither file resolves take the desk the '
+                              'serial was last seen at (default DB: per-user file, or $DESK_COMPARATOR_HISTORY)')
+    compare.add_argument('--near-matches', action='store_true',
+                         help='pair up serials that differ only by O/0-style misreads or one character and report '
+                              'them in desk_near_matches_<timestamp>.<format> instead of as mismatches')
+    compare.add_argument('--snapshot-dir', help='snapshot folder (default: per-user folder, or $DESK_COMPARATOR_SNAPSHOTS)')
+    compare.add_argument('--partitions', type=int, default=16,
+                         help='--out-of-core: number of buckets; more buckets use less memory each (default: 16)')
+    compare.add_argument('--work-dir', help='--out-of-core: folder for the temporary bucket files (default: system temp)')
+    _add_instrumentation_args(compare)
+    compare.set_defaults(func=_cmd_compare)
+
+    reconcile = sub.add_parser('reconcile', help='reconcile two or more sources in one pass')
+    reconcile.add_argument('files', nargs='+', metavar='FILE', help='inventory workbooks (at least two)')
+    reconcile.add_argument('-l', '--label', action='append',
+                           help='source name for the report, once per file in order (default: file names)')
+    reconcile.add_argument('-o', '--output-folder', default=os.getcwd(),
+                           help='folder for desk_sources_<timestamp>.<format> (default: current directory)')
+    reconcile.add_argument('-f', '--format', choices=('xlsx', 'csv', 'parquet'), default='xlsx', help='report format')
+    reconcile.add_argument('-q', '--quiet', action='store_true', help='do not print progress messages')
+    reconcile.add_argument('--no-parallel', action='store_true', help='read the files in this process')
+    reconcile.add_argument('--cache-dir', help='parsed-input cache folder')
+    reconcile.add_argument('--no-cache', action='store_true', help='always parse the files')
+    _add_instrumentation_args(reconcile)
+    reconcile.set_defaults(func=_cmd_reconcile)
+
+    history = sub.add_parser('history', help='show where serials were seen in earlier comparisons (see compare --history)')
+    history.add_argument('serials', nargs='+', metavar='SERIAL', help='serial number(s) to look up')
+    history.add_argument('--db', help='serial history database (default: per-user file, or $DESK_COMPARATOR_HISTORY)')
+    history.set_defaults(func=_cmd_history)
+
+    watch = sub.add_parser('watch', help='compare every new export dropped into a folder against a baseline')
+    watch.add_argument('folder', help='drop folder to watch (not recursive)')
+    watch.add_argument('-b', '--baseline', required=True, help='workbook every new export is compared against')
+    watch.add_argument('-o', '--output-folder', required=True,
+                       help='folder for desk_mismatches_<export>_<timestamp>.<format> (not the watched folder)')
+    watch.add_argument('-f', '--format', choices=('xlsx', 'csv', 'parquet'), default='xlsx', help='report format')
+    watch.add_argument('--interval', type=float, default=2.0, help='seconds between folder polls (default: 2)')
+    watch.add_argument('--queue-size', type=int, default=8,
+                       help='exports waiting to be compared at most; more stay in the folder until there is room (default: 8)')
+    watch.add_argument('--process-existing', action='store_true',
+                       help='also compare the files already in the folder at start')
+    watch.add_argument('--cache-dir', help='parsed-input cache folder')
+    watch.add_argument('--no-cache', action='store_true', help='always parse the exports')
+    watch.set_defaults(func=_cmd_watch)
+
+    serve = sub.add_parser('serve', help='run the local HTTP comparison service (see desk_comparator.service)')
+    serve.add_argument('--host', default='127.0.0.1', help='loopback address to bind (default: 127.0.0.1)')
+    serve.add_argument('--port', type=int, default=8765, help='port (default: 8765; 0 picks a free one)')
+    serve.add_argument('--workers', type=int, help='comparison worker processes (default: CPU count, at most 4)')
+    serve.add_argument('--max-baselines', type=int, default=4,
+                       help='parsed baselines each worker keeps in memory, least recently used dropped first (default: 4)')
+    serve.add_argument('--work-dir', help='folder for uploads and reports (default: a temporary folder, removed on exit)')
+    serve.add_argument('--cache-dir', help='parsed-input cache folder')
+    serve.add_argument('--no-cache', action='store_true', help='always parse uploads')
+    serve.add_argument('-v', '--verbose', action='store_true', help='log every request')
+    serve.set_defaults(func=_cmd_serve)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        return args.func(args)
+    except ComparisonError as e:
+        print(f'{e.title}: {e}', file=sys.stderr)
+        return 1
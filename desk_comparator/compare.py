@@ -0,0 +1,251 @@
+"""Comparison kernels working on whole (Desk_ID, Serial_Number) pair tables.
+
+Both files' pairs are first encoded against one shared, sorted dictionary of
+desks and one of serials (``encode_pairs``). Every kernel below then works on
+int32 code arrays: joins, duplicate checks and counts hash small integers
+instead of re-hashing the same strings at each stage, and because the
+dictionaries are sorted, ordering by code is ordering by text. Strings only
+come back in ``aggregate_by_desk`` when the report cells are built.
+"""
+
+import numpy as np
+import pandas as pd
+
+from .normalize import split_desk_series
+from .prepare import PAIR_COLUMNS
+
+UNASSIGNED = 'Unassigned'
+
+
+def _categorical(values):
+    return values if isinstance(values.dtype, pd.CategoricalDtype) else values.astype('category')
+
+
+def _shared_dictionary(columns):
+    uniques = [c.cat.categories.to_numpy(dtype=object) for c in columns]
+    return pd.Index(np.concatenate(uniques), dtype=object).unique().sort_values()
+
+
+def _recode(column, dictionary):
+    # only the distinct values are looked up; rows are remapped by array indexing
+    remap = dictionary.get_indexer(column.cat.categories).astype(np.int32)
+    return remap[column.cat.codes.to_numpy()]
+
+
+def encode_pairs(*pair_tables):
+    """Encode several pair tables against shared Desk_ID and serial dictionaries.
+
+    The tables must not contain missing values (prepared pairs never do).
+    Returns ``(desks, serials, coded_tables)``: two sorted Indexes and, per
+    input table, a DataFrame of int32 codes into them with the PAIR_COLUMNS.
+    """
+    columns = {col: [_categorical(t[col]) for t in pair_tables] for col in PAIR_COLUMNS}
+    desks = _shared_dictionary(columns['Desk_ID'])
+    serials = _shared_dictionary(columns['Serial_Number'])
+    coded = [
+        pd.DataFrame({'Desk_ID': _recode(desk, desks), 'Serial_Number': _recode(serial, serials)})
+        for desk, serial in zip(columns['Desk_ID'], columns['Serial_Number'])
+    ]
+    return desks, serials, coded
+
+
+def encode_sheets(*pair_tables):
+    """Encode the tables' categorical 'Sheet' columns against one list of sheet names.
+
+    Returns ``(sheets, codes)``: the names in order of first appearance (the
+    first table's sheets in workbook order, then new names from the others)
+    and an int32 code array per table.
+    """
+    names = dict.fromkeys(name for t in pair_tables for name in t['Sheet'].cat.categories)
+    sheets = pd.Index(list(names), dtype=object)
+    return sheets, [_recode(t['Sheet'], sheets) for t in pair_tables]
+
+
+def first_sheets(only_pairs, pairs):
+    """Sheet code of each pair of ``only_pairs``: the first sheet of ``pairs`` (coded, with 'Sheet') listing it."""
+    first = pairs[PAIR_COLUMNS + ['Sheet']].drop_duplicates(subset=PAIR_COLUMNS)
+    return only_pairs[PAIR_COLUMNS].merge(first, on=PAIR_COLUMNS, how='left', sort=False)['Sheet'].to_numpy()
+
+
+def blank_desks(desks):
+    """Boolean array over a desk dictionary: True for 'Blanks' desks.
+
+    The dictionary holds normalized Desk_IDs, where every blank became 'Blanks'.
+    """
+    return np.asarray(pd.Index(desks, dtype=object) == 'Blanks', dtype=bool)
+
+
+def desk_anti_join(pairs1, pairs2):
+    """Pairs only present in one of the two tables.
+
+    One outer merge on (Desk_ID, Serial_Number) with ``indicator=True`` gives,
+    for every desk at once, the same result as the per-desk set differences
+    ``serials1 - serials2`` and ``serials2 - serials1``.
+    Returns ``(only_in_1, only_in_2)`` pair DataFrames.
+    """
+    merged = pd.merge(pairs1[PAIR_COLUMNS].drop_duplicates(), pairs2[PAIR_COLUMNS].drop_duplicates(),
+                      on=PAIR_COLUMNS, how='outer', indicator=True, sort=False)
+    side = merged.pop('_merge')
+    only_in_1 = merged[side == 'left_only'].reset_index(drop=True)
+    only_in_2 = merged[side == 'right_only'].reset_index(drop=True)
+    return only_in_1, only_in_2
+
+
+def _single_valued(keys, values, size):
+    """Lookup array key -> value for keys paired with exactly one value; -1 elsewhere."""
+    pairs = pd.DataFrame({'key': keys, 'value': values}).drop_duplicates()
+    counts = np.bincount(pairs['key'].to_numpy(), minlength=size)
+    single = pairs[counts[pairs['key'].to_numpy()] == 1]
+    lookup = np.full(size, -1, dtype=np.int32)
+    lookup[single['key'].to_numpy()] = single['value'].to_numpy()
+    return lookup
+
+
+def unique_serial_desks(pairs, blank, n_serials):
+    """Serial code -> desk code for serials seen at exactly one non-blank desk (-1 otherwise).
+
+    Serials seen at several desks are ambiguous and left out on purpose.
+    """
+    assigned = pairs[~blank[pairs['Desk_ID'].to_numpy()]]
+    return _single_valued(assigned['Serial_Number'].to_numpy(), assigned['Desk_ID'].to_numpy(), n_serials)
+
+
+def desk_rooms(desks):
+    """Room of every desk in a dictionary: ``(room_codes, rooms)``, a code per desk plus the room names."""
+    room_codes, rooms = pd.factorize(split_desk_series(pd.Series(desks, dtype=object))['Room'])
+    return room_codes.astype(np.int32), pd.Index(rooms, dtype=object)
+
+
+def common_serial_rooms(blank, room_codes, rooms, n_serials, *pair_tables):
+    """Serial code -> room code for serials whose non-blank desks (across all tables) share one room.
+
+    Desks with an empty room do not count; -1 where no single room exists.
+    """
+    assigned = pd.concat([p[~blank[p['Desk_ID'].to_numpy()]] for p in pair_tables], ignore_index=True)
+    serial_rooms = pd.DataFrame({
+        'Serial_Number': assigned['Serial_Number'].to_numpy(),
+        'Room': room_codes[assigned['Desk_ID'].to_numpy()],
+    })
+    non_empty = ~np.asarray(rooms == '', dtype=bool)
+    serial_rooms = serial_rooms[non_empty[serial_rooms['Room'].to_numpy()]]
+    return _single_valued(serial_rooms['Serial_Number'].to_numpy(), serial_rooms['Room'].to_numpy(), n_serials)
+
+
+def report_labels(desks, rooms, history_desks=None):
+    """Desk labels a mismatch can be reported under: the desks, then the rooms, then 'Unassigned'.
+
+    ``history_desks`` (desks known from the serial history) follow at the
+    end. ``resolve_desks`` returns codes into this list.
+    """
+    labels = desks.append(rooms).append(pd.Index([UNASSIGNED], dtype=object))
+    return labels if history_desks is None else labels.append(history_desks)
+
+
+def history_serial_desks(serials, candidates, history, n_serials):
+    """Serial code -> code into the desks the history knows (``history_desks``), -1 where it knows none.
+
+    Only the ``candidates`` serial codes are looked up (one indexed query
+    per batch, see ``SerialHistory.latest_desks``). Returns
+    ``(lookup, history_desks)``.
+    """
+    candidates = np.unique(candidates)
+    found = history.latest_desks(serials.to_numpy(dtype=object)[candidates].tolist())
+    lookup = np.full(n_serials, -1, dtype=np.int32)
+    if not found:
+        return lookup, pd.Index([], dtype=object)
+    desk_codes, history_desks = pd.factorize(pd.Series(found.values(), dtype=object))
+    lookup[serials.get_indexer(list(found))] = desk_codes
+    return lookup, pd.Index(history_desks, dtype=object)
+
+
+def resolve_desks(only_pairs, blank, other_unique, common_rooms, n_rooms, history=None):
+    """Report label code (see ``report_labels``) for each mismatch pair.
+
+    Non-blank desks are kept. For blank ('Blanks') desks, in order: the desk
+    the serial uniquely maps to in the other file, the room all observed desks
+    of the serial share, the desk the serial history last saw it at alone
+    (``history``, from ``history_serial_desks``) and finally 'Unassigned'.
+    """
+    n_desks = len(blank)
+    desk = only_pairs['Desk_ID'].to_numpy().copy()
+    is_blank = blank[desk]
+    if not is_blank.any():
+        return desk
+    serials = only_pairs['Serial_Number'].to_numpy()[is_blank]
+    by_desk = other_unique[serials]
+    by_room = common_rooms[serials]
+    fallback = n_desks + n_rooms
+    if history is not None:
+        by_history = history[serials]
+        fallback = np.where(by_history >= 0, n_desks + n_rooms + 1 + by_history, fallback)
+    desk[is_blank] = np.where(by_desk >= 0, by_desk,
+                              np.where(by_room >= 0, n_desks + by_room, fallback))
+    return desk
+
+
+def report_keys(labels):
+    """Split each label once into its report key: ``(key_of_label, keys)``.
+
+    ``keys`` is a sorted (Room, Desk_Number) MultiIndex and ``key_of_label``
+    the position of every label's key in it, so key codes sort like the keys.
+    """
+    parts = split_desk_series(pd.Series(labels, dtype=object))
+    return pd.MultiIndex.from_arrays([parts['Room'], parts['Desk_Number']]).factorize(sort=True)
+
+
+def mismatch_rows(long_rows, labels, serials, sheets=None):
+    """Long-form mismatches: one row per reported (Room, Desk_Number, Serial_Number, Side).
+
+    ``long_rows`` has Desk_ID (a code into ``labels``), Serial_Number (a code
+    into ``serials``) and Side (1 or 2). A serial listed on both sides for
+    the same Room/Desk_Number (possible once blank desks were inferred) is
+    not a mismatch and is dropped here, before any string is built. Rows come
+    back sorted by Room, Desk_Number and serial. With ``sheets``,
+    ``long_rows`` also has a Sheet code into it and the result starts with a
+    categorical Sheet column.
+    """
+    key_of_label, keys = report_keys(labels)
+    rows = pd.DataFrame({
+        'Key': key_of_label[long_rows['Desk_ID'].to_numpy()],
+        'Serial_Number': long_rows['Serial_Number'].to_numpy(),
+        'Side': long_rows['Side'].to_numpy(),
+    })
+    if sheets is not None:
+        rows['Sheet'] = long_rows['Sheet'].to_numpy()
+    rows = rows.drop_duplicates(subset=['Key', 'Serial_Number', 'Side'])
+    rows = rows[~rows.duplicated(subset=['Key', 'Serial_Number'], keep=False)]
+    # codes sort like the strings they stand for
+    rows = rows.sort_values(['Key', 'Serial_Number'])
+    key_values = keys[rows['Key'].to_numpy()]
+    result = pd.DataFrame({
+        'Room': key_values.get_level_values(0).to_numpy(dtype=object),
+        'Desk_Number': key_values.get_level_values(1).to_numpy(dtype=object),
+        'Serial_Number': serials.to_numpy(dtype=object)[rows['Serial_Number'].to_numpy()],
+        'Side': rows['Side'].to_numpy(),
+    })
+    if sheets is not None:
+        result.insert(0, 'Sheet', pd.Categorical.from_codes(rows['Sheet'].to_numpy(), categories=sheets))
+    return result
+
+
+def aggregate_by_desk(rows):
+    """Collapse long-form mismatch rows into one report row per Room/Desk_Number.
+
+    Each cell is joined once, in the row order (``mismatch_rows`` sorts the
+    serials); the result is sorted by Room / Desk_Number. Rows with a Sheet
+    column are grouped per sheet first, sheets in their category order.
+    """
+    keys = ['Room', 'Desk_Number']
+    if 'Sheet' in rows.columns:
+        keys = ['Sheet'] + keys
+    if rows.empty:
+        return pd.DataFrame(columns=keys + ['Only_in_File1', 'Only_in_File2'])
+    joined = (rows.groupby(keys + ['Side'], sort=True, observed=True)['Serial_Number']
+              .agg(', '.join)
+              .unstack('Side', fill_value=''))
+    joined = joined.reindex(columns=[1, 2], fill_value='')
+    joined.columns = ['Only_in_File1', 'Only_in_File2']
+    joined = joined.reset_index()
+    if 'Sheet' in joined.columns:
+        joined['Sheet'] = joined['Sheet'].astype(object)
+    return joined
@@ -0,0 +1,408 @@
+"""Headless comparison engine.
+
+``compare_excels`` reads two inventory workbooks, normalizes Desk_IDs and
+serials, computes the per-desk mismatches and (optionally) saves the formatted
+report. It never touches tkinter: failures are raised as ``ComparisonError``
+subclasses and the outcome is returned as a ``ComparisonResult``.
+"""
+
+import os
+from dataclasses import dataclass, field
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from .cache import InputCache
+from .compare import (
+    aggregate_by_desk,
+    blank_desks,
+    common_serial_rooms,
+    desk_anti_join,
+    desk_rooms,
+    encode_pairs,
+    encode_sheets,
+    first_sheets,
+    history_serial_desks,
+    mismatch_rows,
+    report_labels,
+    resolve_desks,
+    unique_serial_desks,
+)
+from .errors import (
+    ComparisonCancelled,
+    ComparisonError,
+    InputFileError,
+    NoSerialColumnsError,
+    OutputFolderError,
+    SaveError,
+)
+from .history import SerialHistory
+from .instrument import RunReport
+from .nearmatch import find_near_matches
+from .prepare import prepare_inputs
+from .progress import CancelToken
+from .writer import OUTPUT_FORMATS, save_report
+
+RESULT_COLUMNS = ['Room', 'Desk_Number', 'Only_in_File1', 'Only_in_File2']
+SHEET_RESULT_COLUMNS = ['Sheet'] + RESULT_COLUMNS
+
+
+@dataclass
+class ComparisonResult:
+    """Outcome of a comparison run.
+
+    ``mismatches`` has the RESULT_COLUMNS layout (SHEET_RESULT_COLUMNS when
+    sheets were selected, SOURCE_COLUMNS for ``multi.compare_many``), ``output_path`` is None when
+    the run was not asked to save a report, and ``warnings`` collects the
+    non-fatal problems the GUI used to show in a warning box.
+    ``serial_mismatches`` is the long form of ``mismatches``: one row per
+    (Room, Desk_Number, Serial_Number, Side) with Side 1 or 2 (and Sheet first), and
+    ``report`` holds the per-stage timings of the run. ``near_matches``
+    (NEAR_MATCH_COLUMNS) lists likely misread pairs when they were looked
+    for; those serials are then left out of ``mismatches``.
+    """
+
+    mismatches: pd.DataFrame
+    stats: dict = field(default_factory=dict)
+    output_path: str = None
+    warnings: list = field(default_factory=list)
+    serial_mismatches: pd.DataFrame = None
+    report: RunReport = None
+    near_matches: pd.DataFrame = None
+    near_matches_path: str = None
+
+
+def _check_readable(path):
+    if not os.path.exists(path):
+        raise InputFileError(f"File not found: {path}")
+    try:
+        with open(path, 'rb'):
+            pass
+    except PermissionError:
+        raise InputFileError(f"Cannot read file (permission denied):\n{path}")
+    except Exception as e:
+        raise InputFileError(f"Cannot access file:\n{path}\n{e}")
+
+
+def _check_writable(output_folder):
+    try:
+        os.makedirs(output_folder, exist_ok=True)
+        test_file = os.path.join(output_folder, '.test_write')
+        with open(test_file, 'w') as f:
+            f.write('test')
+        os.remove(test_file)
+    except Exception as e:
+        raise OutputFolderError(f"Cannot write to output folder:\n{output_folder}\n{e}")
+
+
+def _validate_paths(paths, output_folder, cb):
+    # Validate file paths and readability
+    cb(0, 'Validating paths...')
+    for path in paths:
+        try:
+            _check_readable(path)
+        except InputFileError:
+            cb(0, f'Cannot access file: {path}')
+            raise
+
+    # Ensure output folder exists and is writable
+    if output_folder is not None:
+        try:
+            _check_writable(output_folder)
+        except OutputFolderError:
+            cb(0, f'Output folder not writable: {output_folder}')
+            raise
+
+
+def _save_timestamped(dataframe, output_folder, prefix, output_format, cb):
+    """Save a report as ``<prefix>_<timestamp>.<format>``; returns the path or raises SaveError."""
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    output_path = os.path.join(output_folder, f'{prefix}_{timestamp}.{output_format}')
+    try:
+        save_report(dataframe, output_path, output_format)
+    except PermissionError as e:
+        cb(0, 'Cannot save - file may be open')
+        raise SaveError(f"Cannot save results - the output file may be open in Excel.\n\nPlease close any open Excel files and try again.\n\nOutput path:\n{output_path}") from e
+    except Exception as e:
+        cb(0, f'Failed to save results: {e}')
+        raise SaveError(f"Failed to save results:\n{e}\n\nOutput path:\n{output_path}") from e
+    return output_path
+
+
+def compare_excels(file1, file2, output_folder, progress_callback=None, parallel=None, cache_dir=None,
+                   output_format='xlsx', report=None, cancel=None, sheets=None, history=None, near_matches=False):
+    """Compares two Excel files and calls progress_callback(percentage, message).
+
+    The progress_callback is optional and is called from the thread running
+    compare_excels; the GUI wrapper arranges for it to safely update the UI.
+    Pass ``output_folder=None`` to skip saving the report. Both files are read
+    and normalized in separate worker processes when they are large enough to
+    pay for it; ``parallel=True``/``False`` overrides that choice. With a
+    ``cache_dir``, a file whose content was already prepared by an earlier run
+    is loaded from the on-disk cache instead of being parsed again.
+    ``output_format`` is one of ``OUTPUT_FORMATS`` ('xlsx', 'csv', 'parquet').
+    Stage timings go to ``report`` (a ``RunReport``; a plain one is made when
+    not given) and come back as ``result.report``. ``cancel`` (a
+    ``CancelToken``) is checked at every progress step and while the files
+    are read; once it is cancelled the run raises ``ComparisonCancelled``.
+    ``sheets`` compares more than the first sheet of each workbook: ``'all'``
+    or a list of sheet names (see ``prepare_inputs``). The sheets are read in
+    parallel, compared as one inventory per file, and the report gets a
+    leading Sheet column (the sheet each mismatch was listed on) and is
+    grouped by it.
+    ``history`` is the path of a serial history database (``history.SerialHistory``):
+    blank desks that neither file resolves take the desk the history last saw
+    the serial at, and both files' pairs are recorded in it once the report is saved.
+    With ``near_matches``, mismatched serials of the two files that are
+    likely the same device misread (O/0 and similar, or one character off;
+    see ``nearmatch``) are paired up, reported separately as
+    ``desk_near_matches_<timestamp>.<format>`` and left out of the mismatches.
+
+    Returns a ``ComparisonResult``; raises a ``ComparisonError`` subclass on failure.
+    """
+    cancel = cancel if cancel is not None else CancelToken()
+
+    def cb(percent, msg):
+        cancel.check()
+        if progress_callback:
+            progress_callback(percent, msg)
+
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format {output_format!r}; expected one of {', '.join(OUTPUT_FORMATS)}")
+
+    report = report if report is not None else RunReport()
+    report.summary.update(files=[file1, file2], output_format=output_format)
+
+    _validate_paths([file1, file2], output_folder, cb)
+
+    # Read, filter and normalize both files (in parallel worker processes for large inputs)
+    cb(5, 'Reading and normalizing both files...')
+    try:
+        cache = InputCache(cache_dir) if cache_dir else None
+        with report.stage('prepare') as st:
+            prepared1, prepared2 = prepare_inputs([file1, file2], labels=['File 1', 'File 2'], parallel=parallel,
+                                                  cache=cache, report=report, cancel=cancel, sheets=sheets)
+            st['rows_out'] = len(prepared1.pairs) + len(prepared2.pairs)
+    except ComparisonCancelled:
+        raise
+    except ComparisonError as e:
+        cb(0, str(e).splitlines()[0])
+        raise
+    if history is None:
+        return _compare_prepared(prepared1, prepared2, output_folder, output_format, report, cb,
+                                 by_sheet=sheets is not None, near_matches=near_matches)
+    with SerialHistory(history) as serial_history:
+        return _compare_prepared(prepared1, prepared2, output_folder, output_format, report, cb,
+                                 by_sheet=sheets is not None, history=serial_history, near_matches=near_matches)
+
+
+def compare_prepared(prepared1, prepared2, output_folder, progress_callback=None, output_format='xlsx',
+                     report=None, cancel=None, report_prefix='desk_mismatches'):
+    """Compare two inputs that were already read and normalized (``PreparedInput``s).
+
+    Does what ``compare_excels`` does after its 'prepare' stage, for callers
+    that keep one side in memory across runs (see ``watch.FolderWatcher``);
+    the prepared inputs are not modified. The report is saved as
+    ``<report_prefix>_<timestamp>.<format>``.
+    """
+    cancel = cancel if cancel is not None else CancelToken()
+
+    def cb(percent, msg):
+        cancel.check()
+        if progress_callback:
+            progress_callback(percent, msg)
+
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format {output_format!r}; expected one of {', '.join(OUTPUT_FORMATS)}")
+    report = report if report is not None else RunReport()
+    report.summary.update(files=[prepared1.path, prepared2.path], output_format=output_format)
+    if output_folder is not None:
+        _validate_paths([], output_folder, cb)
+    return _compare_prepared(prepared1, prepared2, output_folder, output_format, report, cb,
+                             report_prefix=report_prefix)
+
+
+def _record_history(history, history_pairs, desks, serials, report):
+    """Record each file's coded (desk, serial) pairs, blank desks left out, in the serial ``history``."""
+    if history is None:
+        return
+    with report.stage('history_record', rows_in=sum(len(pairs) for _, pairs in history_pairs)) as st:
+        recorded = 0
+        for path, pairs in history_pairs:
+            recorded += history.record(path, desks[pairs['Desk_ID'].to_numpy()],
+                                       serials[pairs['Serial_Number'].to_numpy()])
+        st['rows_out'] = recorded
+
+
+def _compare_prepared(prepared1, prepared2, output_folder, output_format, report, cb, by_sheet=False,
+                      report_prefix='desk_mismatches', history=None, near_matches=False):
+    """Everything after the 'prepare' stage of ``compare_excels``; ``history`` is an open ``SerialHistory``."""
+    warnings = []
+    file1, file2 = prepared1.path, prepared2.path
+    for message in prepared1.messages + prepared2.messages:
+        cb(37, message)
+
+    serial_columns_file1 = prepared1.serial_columns
+    serial_columns_file2 = prepared2.serial_columns
+    cb(41, f'Found serial columns - File1: {serial_columns_file1} | File2: {serial_columns_file2}')
+
+    # Fail if no serial columns found
+    if not serial_columns_file1 and not serial_columns_file2:
+        cb(0, 'No serial columns found in either file')
+        raise NoSerialColumnsError("No serial columns found!\n\nSerial columns must start with 'S.N' (e.g., S.N1, S.N2)")
+
+    if not serial_columns_file1:
+        cb(41, 'Warning: No serial columns in file 1')
+        warnings.append(f"No serial columns found in file 1:\n{file1}\n\nAll serials will appear as 'Only in File 2'")
+
+    if not serial_columns_file2:
+        cb(41, 'Warning: No serial columns in file 2')
+        warnings.append(f"No serial columns found in file 2:\n{file2}\n\nAll serials will appear as 'Only in File 1'")
+
+    replaced1, replaced2 = prepared1.skan_replaced, prepared2.skan_replaced
+    if replaced1 or replaced2:
+        sample_text = '; '.join([f"{c}:{o}->{n}" for c, o, n in (prepared1.skan_samples + prepared2.skan_samples)])
+        cb(44, f'Replaced {replaced1} in file1, {replaced2} in file2. Samples: {sample_text}')
+
+    rows_file1, rows_file2 = prepared1.rows, prepared2.rows
+    prepared_sheets = (prepared1.sheets, prepared2.sheets)
+    # One shared desk/serial dictionary for both files; from here on the
+    # pairs are int32 codes and strings only come back in the report
+    with report.stage('encode', rows_in=len(prepared1.pairs) + len(prepared2.pairs)) as st:
+        desks, serials, (df1_pairs, df2_pairs) = encode_pairs(prepared1.pairs, prepared2.pairs)
+        sheet_names = None
+        if by_sheet:
+            sheet_names, (df1_pairs['Sheet'], df2_pairs['Sheet']) = encode_sheets(prepared1.pairs, prepared2.pairs)
+        st.update(rows_out=len(df1_pairs) + len(df2_pairs), desks=len(desks), serials=len(serials))
+    cb(68, f'Pairs - File1: {len(df1_pairs)} rows, File2: {len(df2_pairs)} rows')
+
+    # Diagnostic: same serial assigned to different desks across files
+    with report.stage('diagnostics', rows_in=len(df1_pairs) + len(df2_pairs)):
+        merged_serials = pd.merge(df1_pairs, df2_pairs, on='Serial_Number', how='inner', suffixes=('_1', '_2'))
+        diff_assign = merged_serials[merged_serials['Desk_ID_1'] != merged_serials['Desk_ID_2']]
+        if not diff_assign.empty:
+            sample = diff_assign[['Serial_Number', 'Desk_ID_1', 'Desk_ID_2']].drop_duplicates().head(5)
+            sample_text = '; '.join(f"{serials[r.Serial_Number]}:{desks[r.Desk_ID_1]}!={desks[r.Desk_ID_2]}"
+                                    for r in sample.itertuples())
+            cb(68, f'Serial assigned to different desks across files (sample): {sample_text}')
+        del merged_serials, diff_assign
+
+    # Build serial -> desk / serial -> room lookup tables to fill missing desk info later.
+    # Only use a serial->desk mapping if the serial maps to exactly one non-blank desk.
+    cb(69, 'Building serial lookup tables...')
+    with report.stage('build_maps', rows_in=len(df1_pairs) + len(df2_pairs)) as st:
+        blank = blank_desks(desks)
+        room_codes, rooms = desk_rooms(desks)
+        serial_to_desk_1 = unique_serial_desks(df1_pairs, blank, len(serials))
+        serial_to_desk_2 = unique_serial_desks(df2_pairs, blank, len(serials))
+        serial_to_room = common_serial_rooms(blank, room_codes, rooms, len(serials), df1_pairs, df2_pairs)
+        st['rows_out'] = int((serial_to_desk_1 >= 0).sum() + (serial_to_desk_2 >= 0).sum() + (serial_to_room >= 0).sum())
+
+    serial_to_history, history_desks, history_pairs = None, None, []
+    if history is not None:
+        # only serials at a blank desk that no room resolves can need the history
+        candidates = np.concatenate([p['Serial_Number'].to_numpy()[blank[p['Desk_ID'].to_numpy()]]
+                                     for p in (df1_pairs, df2_pairs)])
+        candidates = candidates[serial_to_room[candidates] < 0]
+        with report.stage('history_lookup', rows_in=len(candidates)) as st:
+            serial_to_history, history_desks = history_serial_desks(serials, candidates, history, len(serials))
+            st['rows_out'] = int((serial_to_history >= 0).sum())
+        cb(70, f'Serial history knows a desk for {st["rows_out"]} blank-desk serials')
+        # recorded once the report is saved (a failed run must not mark the files as seen), so this
+        # run only infers from earlier ones
+        history_pairs = [(path, pairs[~blank[pairs['Desk_ID'].to_numpy()]])
+                         for path, pairs in ((file1, df1_pairs), (file2, df2_pairs))]
+
+    cb(75, 'Computing desk-centric mismatches...')
+    pairs_file1, pairs_file2 = len(df1_pairs), len(df2_pairs)
+    desks_compared = len(pd.unique(np.concatenate([df1_pairs['Desk_ID'].to_numpy(), df2_pairs['Desk_ID'].to_numpy()])))
+    cb(77, f'Total desks to compare: {desks_compared}')
+
+    # One anti-join over all desks replaces the per-desk set differences
+    with report.stage('compare', rows_in=pairs_file1 + pairs_file2) as st:
+        only_in_1_df, only_in_2_df = desk_anti_join(df1_pairs, df2_pairs)
+        if sheet_names is not None:
+            only_in_1_df['Sheet'] = first_sheets(only_in_1_df, df1_pairs)
+            only_in_2_df['Sheet'] = first_sheets(only_in_2_df, df2_pairs)
+        st['rows_out'] = len(only_in_1_df) + len(only_in_2_df)
+    del df1_pairs, df2_pairs
+
+    # Prepare DataFrame for output: blank desks are inferred with lookups, not per row
+    cb(85, 'Preparing output...')
+    with report.stage('output_prep', rows_in=len(only_in_1_df) + len(only_in_2_df)) as st:
+        only_in_1_df['Desk_ID'] = resolve_desks(only_in_1_df, blank, serial_to_desk_2, serial_to_room, len(rooms),
+                                                serial_to_history)
+        only_in_2_df['Desk_ID'] = resolve_desks(only_in_2_df, blank, serial_to_desk_1, serial_to_room, len(rooms),
+                                                serial_to_history)
+        only_in_1, only_in_2 = len(only_in_1_df), len(only_in_2_df)
+
+        # Check for serials appearing in both lists (shouldn't happen)
+        duplicates = np.intersect1d(only_in_1_df['Serial_Number'].to_numpy(), only_in_2_df['Serial_Number'].to_numpy())
+        if len(duplicates):
+            cb(86, f'WARNING: {len(duplicates)} serials appear in BOTH lists: {list(serials[duplicates[:5]])}')
+            # This indicates the serial was assigned to different desks in the two files
+
+        only_in_1_df['Side'] = 1
+        only_in_2_df['Side'] = 2
+        long_rows = pd.concat([only_in_1_df, only_in_2_df], ignore_index=True)
+        del only_in_1_df, only_in_2_df
+
+        # Cancel serials found on both sides of the same Room/Desk_Number, then
+        # build the comma-joined cells in one groupby
+        labels = report_labels(desks, rooms, history_desks)
+        history_inferred = int((long_rows['Desk_ID'].to_numpy() > len(desks) + len(rooms)).sum())
+        serial_mismatches = mismatch_rows(long_rows, labels, serials, sheet_names)
+        del long_rows
+        near = None
+        if near_matches:
+            with report.stage('near_matches', rows_in=len(serial_mismatches)) as near_st:
+                near, matched = find_near_matches(serial_mismatches)
+                serial_mismatches = serial_mismatches[~matched].reset_index(drop=True)
+                near_st['rows_out'] = len(near)
+            cb(88, f'Likely misread serial pairs: {len(near)}')
+        result_df = aggregate_by_desk(serial_mismatches)[RESULT_COLUMNS if sheet_names is None else SHEET_RESULT_COLUMNS]
+        st['rows_out'] = len(result_df)
+
+    stats = {
+        'rows_file1': rows_file1,
+        'rows_file2': rows_file2,
+        'pairs_file1': pairs_file1,
+        'pairs_file2': pairs_file2,
+        'serial_columns_file1': list(serial_columns_file1),
+        'serial_columns_file2': list(serial_columns_file2),
+        'skan_replaced_file1': replaced1,
+        'skan_replaced_file2': replaced2,
+        'desks_compared': desks_compared,
+        'only_in_file1': only_in_1,
+        'only_in_file2': only_in_2,
+        'mismatch_rows': len(result_df),
+    }
+    if history is not None:
+        stats['history_inferred'] = history_inferred
+    if near is not None:
+        stats['near_matches'] = len(near)
+    if sheet_names is not None:
+        stats.update(sheets_file1=prepared_sheets[0], sheets_file2=prepared_sheets[1])
+    report.summary['stats'] = stats
+    result = ComparisonResult(mismatches=result_df, stats=stats, warnings=warnings,
+                              serial_mismatches=serial_mismatches, report=report, near_matches=near)
+
+    if output_folder is None:
+        _record_history(history, history_pairs, desks, serials, report)
+        cb(100, 'Done.')
+        return result
+
+    # Save results
+    cb(95, 'Saving results...')
+    with report.stage('save', rows_in=len(result_df)):
+        output_path = _save_timestamped(result_df, output_folder, report_prefix, output_format, cb)
+    result.output_path = output_path
+    if near is not None and not near.empty:
+        with report.stage('save_near_matches', rows_in=len(near)):
+            result.near_matches_path = _save_timestamped(near, output_folder, 'desk_near_matches', output_format, cb)
+        report.summary['near_matches_path'] = result.near_matches_path
+    report.summary['output_path'] = output_path
+    _record_history(history, history_pairs, desks, serials, report)
+    cb(100, f'Done. Saved to: {output_path}')
+    return result
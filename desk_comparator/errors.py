@@ -0,0 +1,42 @@
+"""Exceptions raised by the comparison engine.
+
+Every failure the engine can report is a subclass of ``ComparisonError`` so the
+GUI and the CLI can catch one type and show ``title`` / ``str(exc)`` to the user.
+This module must stay import-light: the CLI imports it before pandas is loaded.
+"""
+
+
+class ComparisonError(Exception):
+    """Base class for all errors raised by the comparison engine."""
+
+    title = 'Error'
+
+
+class InputFileError(ComparisonError):
+    """An input file does not exist or cannot be opened for reading."""
+
+
+class OutputFolderError(ComparisonError):
+    """The output folder cannot be created or is not writable."""
+
+
+class ReadError(ComparisonError):
+    """An input file exists but could not be parsed."""
+
+
+class EmptyInputError(ComparisonError):
+    """An input file contains no (MNTR) rows."""
+
+
+class NoSerialColumnsError(ComparisonError):
+    """Neither input file has a recognizable serial column."""
+
+
+class SaveError(ComparisonError):
+    """The result file could not be written."""
+
+
+class ComparisonCancelled(ComparisonError):
+    """The run was stopped through its ``CancelToken``."""
+
+    title = 'Cancelled'
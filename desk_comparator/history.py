@@ -0,0 +1,127 @@
+"""Persistent serial -> desk history (SQLite).
+
+Every input a comparison reads tells where its serials were seen, and that
+knowledge used to be thrown away after the run. A ``SerialHistory`` keeps
+it: one row per input file recorded (``sources``, once per file content),
+one row per (serial, desk, source) observation, and per serial the desk it
+was last seen at alone (``latest``), all keyed by serial so a lookup is one
+index probe. The engine uses ``latest_desks`` as the last resort for blank
+desks before 'Unassigned'; ``where`` answers "where has serial X been"
+without opening any workbook.
+
+Only the stdlib is needed, so ``python -m desk_comparator history SERIAL``
+stays instant. Serials and desks are stored normalized (as in the report).
+"""
+
+import os
+import re
+import sqlite3
+from datetime import datetime
+
+from .storage import file_digest, user_data_dir
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS sources (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL,
+    digest TEXT UNIQUE,
+    recorded_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS observations (
+    serial TEXT NOT NULL,
+    desk TEXT NOT NULL,
+    source_id INTEGER NOT NULL REFERENCES sources(id),
+    PRIMARY KEY (serial, desk, source_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS latest (
+    serial TEXT PRIMARY KEY,
+    desk TEXT NOT NULL,
+    source_id INTEGER NOT NULL REFERENCES sources(id)
+) WITHOUT ROWID;
+'''
+
+# SQLite's default limit on host parameters is 999 in older builds
+_LOOKUP_BATCH = 500
+
+
+def default_history_path():
+    """Per-user history database; DESK_COMPARATOR_HISTORY overrides it."""
+    return os.environ.get('DESK_COMPARATOR_HISTORY') or os.path.join(user_data_dir('history'), 'serials.sqlite')
+
+
+def clean_serial(val):
+    """Scalar form of ``normalize.normalize_serial_series`` (without pulling in pandas)."""
+    return re.sub(r'[^A-Za-z0-9]+', '', str(val)).upper()
+
+
+class SerialHistory:
+    """SQLite store of where each serial was seen; see the module docstring. Usable as a context manager."""
+
+    def __init__(self, path):
+        self.path = path
+        folder = os.path.dirname(os.path.abspath(path))
+        os.makedirs(folder, exist_ok=True)
+        self._db = sqlite3.connect(path)
+        self._db.executescript(_SCHEMA)
+
+    def close(self):
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def record(self, path, desks, serials):
+        """Record the (desk, serial) pairs of input ``path``; returns False if it was recorded before.
+
+        ``desks`` and ``serials`` are parallel sequences of normalized
+        strings, blank desks left out. A file is recorded once per content (by SHA-256), so
+        comparing the same master export daily does not repeat it. Serials
+        seen at exactly one desk in the file become that serial's ``latest``
+        desk; serials seen at several keep their previous one.
+        """
+        digest = file_digest(path) if os.path.exists(path) else None
+        pairs = {(serial, desk) for desk, serial in zip(desks, serials)}
+        with self._db:
+            if digest is not None and self._db.execute('SELECT 1 FROM sources WHERE digest = ?', (digest,)).fetchone():
+                return False
+            source_id = self._db.execute(
+                'INSERT INTO sources (path, digest, recorded_at) VALUES (?, ?, ?)',
+                (os.path.abspath(path), digest, datetime.now().isoformat(timespec='seconds')),
+            ).lastrowid
+            self._db.executemany('INSERT OR IGNORE INTO observations (serial, desk, source_id) VALUES (?, ?, ?)',
+                                 ((serial, desk, source_id) for serial, desk in pairs))
+            desk_of = {}
+            for serial, desk in pairs:
+                desk_of[serial] = desk if serial not in desk_of else None
+            self._db.executemany(
+                'INSERT INTO latest (serial, desk, source_id) VALUES (?, ?, ?) '
+                'ON CONFLICT (serial) DO UPDATE SET desk = excluded.desk, source_id = excluded.source_id',
+                ((serial, desk, source_id) for serial, desk in desk_of.items() if desk is not None),
+            )
+        return True
+
+    def latest_desks(self, serials):
+        """``{serial: desk}`` for the given normalized serials that have a latest desk."""
+        serials = list(serials)
+        found = {}
+        for start in range(0, len(serials), _LOOKUP_BATCH):
+            batch = serials[start:start + _LOOKUP_BATCH]
+            marks = ', '.join('?' * len(batch))
+            found.update(self._db.execute(f'SELECT serial, desk FROM latest WHERE serial IN ({marks})', batch))
+        return found
+
+    def where(self, serial):
+        """Desks ``serial`` was seen at, most recent first: dicts with desk, first_seen, last_seen, sources, last_path."""
+        rows = self._db.execute(
+            'SELECT o.desk, MIN(s.recorded_at), MAX(s.recorded_at), COUNT(*), MAX(s.id) '
+            'FROM observations o JOIN sources s ON s.id = o.source_id '
+            'WHERE o.serial = ? GROUP BY o.desk ORDER BY MAX(s.id) DESC',
+            (clean_serial(serial),),
+        ).fetchall()
+        paths = dict(self._db.execute(
+            f"SELECT id, path FROM sources WHERE id IN ({', '.join('?' * len(rows))})", [r[4] for r in rows]))
+        return [{'desk': desk, 'first_seen': first, 'last_seen': last, 'sources': count, 'last_path': paths[last_id]}
+                for desk, first, last, count, last_id in rows]
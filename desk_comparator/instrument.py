@@ -0,0 +1,134 @@
+"""Per-stage instrumentation of a comparison run.
+
+A ``RunReport`` records, for every named stage (read, fix_desk_ids,
+normalization, skan repair, melt, lookup building, comparison, output
+preparation, save, ...), its wall time, the row counts going in and out and,
+when ``memory=True``, the peak traced allocation (tracemalloc; noticeably
+slows the run down). ``to_dict``/``save`` give a JSON run report.
+
+Stages listed in ``profile`` are additionally run under cProfile and the
+stats are dumped to ``profile_dir`` as ``<stage>_<pid>_<n>.prof`` (open them
+with ``python -m pstats`` or snakeviz); profile leaf stages, as cProfile
+runs cannot nest. ``profiler`` replaces cProfile, e.g. with a sampling
+profiler: it is called with the stage name and must return a context
+manager; whatever it yields is recorded as the stage's ``profile``.
+Stages that run in worker processes use a copy of the settings (``options``),
+so a custom profiler must then be picklable (a module-level function).
+"""
+
+import cProfile
+import itertools
+import json
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+_profile_runs = itertools.count(1)
+
+
+class RunReport:
+    """Stage records of one run; see the module docstring."""
+
+    def __init__(self, memory=False, profile=(), profile_dir=None, profiler=None):
+        self.memory = memory
+        self.profile = set(profile)
+        self.profile_dir = profile_dir
+        self.profiler = profiler
+        self.stages = []
+        self.summary = {}
+        self.started = datetime.now().isoformat(timespec='seconds')
+        self._peaks = []
+        self._open = []
+
+    def options(self):
+        """An empty report with the same settings, for stages run elsewhere (worker processes)."""
+        return RunReport(self.memory, self.profile, self.profile_dir, self.profiler)
+
+    def add(self, records, **extra):
+        """Append stage records made by another report, tagged with ``extra`` keys.
+
+        Their top-level stages become children of the stage open here, if any.
+        """
+        parent = self._open[-1] if self._open else None
+        for record in records:
+            record = dict(record, **extra)
+            if record.get('parent') is None:
+                record['parent'] = parent
+            self.stages.append(record)
+
+    @contextmanager
+    def stage(self, name, rows_in=None):
+        """Time the ``with`` block as stage ``name``; set ``record['rows_out']`` inside it."""
+        record = {'name': name, 'parent': self._open[-1] if self._open else None, 'rows_in': rows_in, 'rows_out': None}
+        self.stages.append(record)
+        self._open.append(name)
+        started_tracing = self._start_memory()
+        profile_ctx = self._profile(name) if name in self.profile else None
+        start = time.perf_counter()
+        try:
+            if profile_ctx is None:
+                yield record
+            else:
+                with profile_ctx as profile_info:
+                    yield record
+                record['profile'] = profile_info
+        finally:
+            record['seconds'] = round(time.perf_counter() - start, 4)
+            self._open.pop()
+            self._stop_memory(record, started_tracing)
+
+    def _start_memory(self):
+        if not self.memory:
+            return False
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        elif self._peaks:
+            # keep the enclosing stage's peak so far before resetting it
+            self._peaks[-1] = max(self._peaks[-1], tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+        self._peaks.append(0)
+        return started
+
+    def _stop_memory(self, record, started_tracing):
+        if not self.memory:
+            return
+        peak = max(self._peaks.pop(), tracemalloc.get_traced_memory()[1])
+        record['peak_mb'] = round(peak / 2 ** 20, 2)
+        if self._peaks:
+            self._peaks[-1] = max(self._peaks[-1], peak)
+        if started_tracing:
+            tracemalloc.stop()
+
+    def _profile(self, name):
+        if self.profiler is not None:
+            return self.profiler(name)
+        return self._cprofile(name)
+
+    @contextmanager
+    def _cprofile(self, name):
+        folder = self.profile_dir or os.getcwd()
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f'{name}_{os.getpid()}_{next(_profile_runs)}.prof')
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield path
+        finally:
+            profiler.disable()
+            profiler.dump_stats(path)
+
+    def to_dict(self):
+        return {
+            'started': self.started,
+            'total_seconds': round(sum(s.get('seconds', 0) for s in self.stages if s.get('parent') is None), 4),
+            'memory_traced': self.memory,
+            'summary': self.summary,
+            'stages': self.stages,
+        }
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, indent=2, default=str)
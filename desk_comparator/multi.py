@@ -0,0 +1,192 @@
+"""N-way reconciliation of several inventory sources in one pass.
+
+Reconciling e.g. asset-management, scanner and facilities exports pairwise
+means N*(N-1)/2 runs that each re-parse their files. ``compare_many`` parses
+every file once, encodes all of them against one shared desk/serial
+dictionary and tags each (desk, serial) pair with a bit for its source; a
+single groupby then yields, per Room/Desk_Number and serial, the set of
+sources that have it. Serials found in every source are not reported.
+Blank desks are inferred before the join rather than after it, so for two
+files the result can differ from ``compare_excels`` for serials that one
+file lists both at a blank and at a real desk.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+from .cache import InputCache
+from .compare import (
+    blank_desks,
+    common_serial_rooms,
+    desk_rooms,
+    encode_pairs,
+    report_keys,
+    report_labels,
+    resolve_desks,
+    unique_serial_desks,
+)
+from .engine import ComparisonResult, _save_timestamped, _validate_paths
+from .errors import ComparisonCancelled, ComparisonError, NoSerialColumnsError
+from .instrument import RunReport
+from .prepare import prepare_inputs
+from .progress import CancelToken
+from .writer import OUTPUT_FORMATS
+
+SOURCE_COLUMNS = ['Room', 'Desk_Number', 'Serial_Number', 'Found_in', 'Missing_from']
+
+# presence is kept as a bit mask per (desk, serial)
+MAX_SOURCES = 62
+
+
+def source_labels(paths):
+    """Default source names: the file names, numbered when two are the same."""
+    names = [os.path.basename(p) for p in paths]
+    return [f'{n} ({i})' if names.count(n) > 1 else n for i, n in enumerate(names, start=1)]
+
+
+def source_presence(coded_tables, blank, serial_to_desk, serial_to_room, n_rooms, labels):
+    """Presence of every serial per report key across the coded pair tables.
+
+    Blank desks are resolved first (see ``resolve_desks``; the serial->desk
+    lookup covers all sources) so a serial reported at a blank desk in one
+    source lines up with the desk another source gives it.
+    Returns ``(rows, keys)``: Key / Serial_Number codes with the source bit
+    ``Mask``, sorted, and the (Room, Desk_Number) keys.
+    """
+    key_of_label, keys = report_keys(labels)
+    tagged = []
+    for source, pairs in enumerate(coded_tables):
+        desk = resolve_desks(pairs, blank, serial_to_desk, serial_to_room, n_rooms)
+        tagged.append(pd.DataFrame({
+            'Key': key_of_label[desk],
+            'Serial_Number': pairs['Serial_Number'].to_numpy(),
+            'Mask': np.int64(1) << source,
+        }))
+    rows = pd.concat(tagged, ignore_index=True).drop_duplicates()
+    rows = rows.groupby(['Key', 'Serial_Number'], sort=True)['Mask'].sum().reset_index()
+    return rows, keys
+
+
+def _mask_text(masks, labels, present):
+    # few distinct masks: build each source list once and map the rows to it
+    text = {m: ', '.join(label for i, label in enumerate(labels) if bool(m >> i & 1) == present)
+            for m in pd.unique(masks)}
+    return pd.Series(masks).map(text).to_numpy(dtype=object)
+
+
+def compare_many(paths, output_folder, labels=None, progress_callback=None, parallel=None, cache_dir=None,
+                 output_format='xlsx', report=None, cancel=None):
+    """Reconcile N inventory files; report which sources have each serial per desk.
+
+    ``labels`` name the sources in the report (default: the file names).
+    The other arguments are those of ``compare_excels``; the report is saved
+    as ``desk_sources_<timestamp>.<format>``. Returns a ``ComparisonResult``
+    whose ``mismatches`` has the SOURCE_COLUMNS layout; raises a
+    ``ComparisonError`` subclass on failure.
+    """
+    cancel = cancel if cancel is not None else CancelToken()
+
+    def cb(percent, msg):
+        cancel.check()
+        if progress_callback:
+            progress_callback(percent, msg)
+
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format {output_format!r}; expected one of {', '.join(OUTPUT_FORMATS)}")
+    if not 2 <= len(paths) <= MAX_SOURCES:
+        raise ValueError(f'compare_many needs between 2 and {MAX_SOURCES} files, got {len(paths)}')
+    labels = list(labels) if labels else source_labels(paths)
+    if len(labels) != len(paths):
+        raise ValueError('labels must have one entry per file')
+
+    warnings = []
+    report = report if report is not None else RunReport()
+    report.summary.update(files=list(paths), sources=labels, output_format=output_format)
+    _validate_paths(paths, output_folder, cb)
+
+    # Every file is read and normalized once (in parallel worker processes for large inputs)
+    cb(5, f'Reading and normalizing {len(paths)} files...')
+    try:
+        cache = InputCache(cache_dir) if cache_dir else None
+        with report.stage('prepare') as st:
+            prepared = prepare_inputs(list(paths), labels=labels, parallel=parallel, cache=cache, report=report,
+                                      cancel=cancel)
+            st['rows_out'] = sum(len(p.pairs) for p in prepared)
+    except ComparisonCancelled:
+        raise
+    except ComparisonError as e:
+        cb(0, str(e).splitlines()[0])
+        raise
+    for p in prepared:
+        for message in p.messages:
+            cb(37, message)
+
+    cb(41, 'Found serial columns - ' + ' | '.join(f'{label}: {p.serial_columns}' for label, p in zip(labels, prepared)))
+    if not any(p.serial_columns for p in prepared):
+        cb(0, 'No serial columns found in any file')
+        raise NoSerialColumnsError("No serial columns found!\n\nSerial columns must start with 'S.N' (e.g., S.N1, S.N2)")
+    for label, path, p in zip(labels, paths, prepared):
+        if not p.serial_columns:
+            cb(41, f'Warning: No serial columns in {label}')
+            warnings.append(f"No serial columns found in {label}:\n{path}\n\nIts serials will all be reported as missing")
+
+    with report.stage('encode', rows_in=sum(len(p.pairs) for p in prepared)) as st:
+        desks, serials, coded = encode_pairs(*(p.pairs for p in prepared))
+        st.update(rows_out=sum(len(c) for c in coded), desks=len(desks), serials=len(serials))
+    stats = {f'rows_{label}': p.rows for label, p in zip(labels, prepared)}
+    stats.update({f'pairs_{label}': len(c) for label, c in zip(labels, coded)})
+    del prepared
+
+    cb(69, 'Building serial lookup tables...')
+    with report.stage('build_maps') as st:
+        blank = blank_desks(desks)
+        room_codes, rooms = desk_rooms(desks)
+        all_pairs = pd.concat(coded, ignore_index=True)
+        st['rows_in'] = len(all_pairs)
+        serial_to_desk = unique_serial_desks(all_pairs, blank, len(serials))
+        serial_to_room = common_serial_rooms(blank, room_codes, rooms, len(serials), all_pairs)
+        desks_compared = len(pd.unique(all_pairs['Desk_ID'].to_numpy()))
+        del all_pairs
+
+    cb(75, f'Reconciling {len(paths)} sources over {desks_compared} desks...')
+    with report.stage('compare', rows_in=sum(len(c) for c in coded)) as st:
+        rows, keys = source_presence(coded, blank, serial_to_desk, serial_to_room, len(rooms),
+                                     report_labels(desks, rooms))
+        del coded
+        rows = rows[rows['Mask'] != (1 << len(paths)) - 1]
+        st['rows_out'] = len(rows)
+
+    cb(85, 'Preparing output...')
+    with report.stage('output_prep', rows_in=len(rows)) as st:
+        key_values = keys[rows['Key'].to_numpy()]
+        masks = rows['Mask'].to_numpy()
+        result_df = pd.DataFrame({
+            'Room': key_values.get_level_values(0).to_numpy(dtype=object),
+            'Desk_Number': key_values.get_level_values(1).to_numpy(dtype=object),
+            'Serial_Number': serials.to_numpy(dtype=object)[rows['Serial_Number'].to_numpy()],
+            'Found_in': _mask_text(masks, labels, True),
+            'Missing_from': _mask_text(masks, labels, False),
+        }, columns=SOURCE_COLUMNS)
+        st['rows_out'] = len(result_df)
+
+    stats.update({
+        'sources': labels,
+        'desks_compared': desks_compared,
+        'serials': len(serials),
+        'mismatch_rows': len(result_df),
+    })
+    report.summary['stats'] = stats
+    result = ComparisonResult(mismatches=result_df, stats=stats, warnings=warnings, report=report)
+
+    if output_folder is None:
+        cb(100, 'Done.')
+        return result
+
+    cb(95, 'Saving results...')
+    with report.stage('save', rows_in=len(result_df)):
+        result.output_path = _save_timestamped(result_df, output_folder, 'desk_sources', output_format, cb)
+    report.summary['output_path'] = result.output_path
+    cb(100, f'Done. Saved to: {result.output_path}')
+    return result
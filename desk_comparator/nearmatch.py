@@ -0,0 +1,141 @@
+"""Near-duplicate serials: the same device read differently by two sources.
+
+Many "only in file 1" / "only in file 2" pairs are one serial seen twice -
+a letter O scanned or typed as a zero (CONB6 / C0NB6), I as 1, a character
+dropped. ``find_near_matches`` pairs such mismatches up, first among the
+serials of the same Room/Desk_Number and then, for those left, of the same
+room. Serials without a location ('Unassigned', 'Blanks') are not paired:
+those pseudo-rooms would group serials from anywhere on the site.
+
+Nothing is compared pair by pair. Every serial gets a canonical form
+(``CONFUSABLE`` characters folded onto the digit they look like), and
+serials whose canonical forms are equal are found with one join. Serials one
+character apart are found by deletion-neighbourhood blocking: each canonical
+form is indexed under itself and under every form with one character
+deleted. Two forms within one insertion, deletion or substitution share an
+entry (with the deleted position telling substitutions apart from
+two-edit coincidences), so one more join on (block, form) finds them all.
+The work grows with the number of serials times their length, not with the
+number of serial pairs.
+"""
+
+import numpy as np
+import pandas as pd
+
+from .compare import UNASSIGNED
+
+# characters scanners and people confuse, folded onto the digit they resemble
+CONFUSABLE = str.maketrans('OQDILZSBG', '000112586')
+
+# shorter canonical forms are not matched one character off (too many chance hits)
+MIN_EDIT_LENGTH = 6
+
+# report rooms that are no place: unresolved blank desks
+PSEUDO_ROOMS = (UNASSIGNED, 'Blanks')
+
+NEAR_MATCH_COLUMNS = ['Room', 'Desk_Number_File1', 'Desk_Number_File2', 'Serial_File1', 'Serial_File2', 'Match']
+MATCH_CONFUSABLE = 'confusable characters'
+MATCH_ONE_EDIT = 'one character off'
+
+
+def canonical_serials(serials):
+    """Canonical form of each serial: upper case with ``CONFUSABLE`` characters folded."""
+    codes, uniques = pd.factorize(serials)
+    canonical = pd.Series(uniques, dtype=object).str.upper().str.translate(CONFUSABLE)
+    return canonical.to_numpy(dtype=object)[codes]
+
+
+def _neighbourhood(side, by):
+    """(row, block keys, form, deleted position) entries: each canonical form and its one-deletion forms."""
+    entries = [side[['Row'] + by + ['Canonical']].assign(Position=-1)]
+    long = side[side['Canonical'].str.len() >= MIN_EDIT_LENGTH]
+    if not long.empty:
+        canonical = long['Canonical']
+        for i in range(int(canonical.str.len().max())):
+            has = canonical.str.len() > i
+            deleted = canonical[has].str.slice(0, i) + canonical[has].str.slice(i + 1)
+            entries.append(long.loc[has, ['Row'] + by].assign(Canonical=deleted, Position=i))
+    return pd.concat(entries, ignore_index=True)
+
+
+def _candidates(rows, by):
+    """Side-1 / side-2 row pairs within one edit of each other (canonically), per block ``by``."""
+    side1 = _neighbourhood(rows[rows['Side'] == 1], by)
+    side2 = _neighbourhood(rows[rows['Side'] == 2], by)
+    pairs = side1.merge(side2, on=by + ['Canonical'], suffixes=('_1', '_2'))
+    # equal positions: same form or one substitution; one side undeleted: one insertion/deletion
+    valid = ((pairs['Position_1'] == pairs['Position_2'])
+             | (pairs['Position_1'] < 0) | (pairs['Position_2'] < 0))
+    pairs = pairs[valid][['Row_1', 'Row_2']].drop_duplicates()
+    canonical = rows['Canonical']
+    exact = canonical.loc[pairs['Row_1']].to_numpy() == canonical.loc[pairs['Row_2']].to_numpy()
+    pairs['Distance'] = np.where(exact, 0, 1)
+    # a short form can still meet a long one's deletion: one character off needs both to be long
+    length = canonical.str.len()
+    long_enough = np.minimum(length.loc[pairs['Row_1']].to_numpy(), length.loc[pairs['Row_2']].to_numpy())
+    pairs = pairs[exact | (long_enough >= MIN_EDIT_LENGTH)]
+    # the very same serial at two desks of one room is a move, not a misread
+    serial = rows['Serial_Number']
+    return pairs[serial.loc[pairs['Row_1']].to_numpy() != serial.loc[pairs['Row_2']].to_numpy()]
+
+
+def _one_to_one(pairs, rows):
+    """Pick pairs so every row is used once.
+
+    Greedy over the candidates ordered by match kind (confusable characters
+    first), then by the two serials: a pair is taken when neither of its
+    rows was taken before, so the result does not depend on row order.
+    """
+    serial = rows['Serial_Number']
+    pairs = pairs.assign(Serial_1=serial.loc[pairs['Row_1']].to_numpy(), Serial_2=serial.loc[pairs['Row_2']].to_numpy())
+    pairs = pairs.sort_values(['Distance', 'Serial_1', 'Serial_2', 'Row_1', 'Row_2'])
+    used1, used2 = set(), set()
+    take = np.zeros(len(pairs), dtype=bool)
+    for i, (row1, row2) in enumerate(zip(pairs['Row_1'].tolist(), pairs['Row_2'].tolist())):
+        if row1 not in used1 and row2 not in used2:
+            used1.add(row1)
+            used2.add(row2)
+            take[i] = True
+    return pairs[take][['Row_1', 'Row_2', 'Distance']].reset_index(drop=True)
+
+
+def find_near_matches(serial_mismatches):
+    """Pair up near-duplicate serials of the two sides of long-form mismatches.
+
+    ``serial_mismatches`` has Room, Desk_Number, Serial_Number and Side (as
+    ``ComparisonResult.serial_mismatches``). Returns ``(pairs, matched)``:
+    a NEAR_MATCH_COLUMNS frame, one row per likely pair, and a boolean array
+    marking the rows of ``serial_mismatches`` that were paired. Each row is
+    paired at most once, same desk before same room, confusable characters
+    before one character off; rows in ``PSEUDO_ROOMS`` are never paired.
+    """
+    rows = serial_mismatches[['Room', 'Desk_Number', 'Serial_Number', 'Side']].reset_index(drop=True)
+    rows.insert(0, 'Row', np.arange(len(rows)))
+    rows['Canonical'] = canonical_serials(rows['Serial_Number'])
+    matched = np.zeros(len(rows), dtype=bool)
+    # a pseudo-room's Desk_Number is always empty, so the desk pass would group it like the room pass
+    located = ~rows['Room'].isin(PSEUDO_ROOMS).to_numpy()
+    found = []
+    for by in (['Room', 'Desk_Number'], ['Room']):
+        candidates = _candidates(rows[located & ~matched], by)
+        if candidates.empty:
+            continue
+        pairs = _one_to_one(candidates, rows)
+        matched[pairs['Row_1'].to_numpy()] = True
+        matched[pairs['Row_2'].to_numpy()] = True
+        found.append(pairs)
+    if not found:
+        return pd.DataFrame(columns=NEAR_MATCH_COLUMNS), matched
+    pairs = pd.concat(found, ignore_index=True)
+    left = rows.loc[pairs['Row_1']].reset_index(drop=True)
+    right = rows.loc[pairs['Row_2']].reset_index(drop=True)
+    result = pd.DataFrame({
+        'Room': left['Room'],
+        'Desk_Number_File1': left['Desk_Number'],
+        'Desk_Number_File2': right['Desk_Number'],
+        'Serial_File1': left['Serial_Number'],
+        'Serial_File2': right['Serial_Number'],
+        'Match': np.where(pairs['Distance'].to_numpy() == 0, MATCH_CONFUSABLE, MATCH_ONE_EDIT),
+    })
+    result = result.sort_values(['Room', 'Desk_Number_File1', 'Serial_File1'], ignore_index=True)
+    return result, matched
@@ -0,0 +1,300 @@
+"""Column detection and Desk_ID / serial normalization helpers."""
+
+import re
+from functools import lru_cache
+
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+except ImportError:
+    _TEXT_DTYPE = object
+else:
+    _TEXT_DTYPE = 'string[pyarrow]'
+
+
+def clean_desk_name(val):
+    val = str(val).strip()
+    val = val.replace(',', '').replace('.', '').replace('_', '').replace(' ', '')
+    val = val.capitalize()
+    digits = re.findall(r'\d+', val)
+    if len(digits) == 1 and len(digits[0]) == 3:
+        padded = digits[0] + '0'
+        val = re.sub(r'\b' + digits[0] + r'\b', padded, val)
+    return val
+
+
+@lru_cache(maxsize=65536)
+def split_desk_parts(val):
+    """Memoized scalar split of a Desk_ID into ``(room, desk_number)``.
+
+    Desk_IDs repeat a lot, so per-item callers hit the cache almost always.
+    """
+    val = str(val).strip()
+    digits = re.findall(r'\d+', val)
+    room = re.sub(r'\d+', '', val).strip().title()
+    desk_number = digits[0] if digits else ''
+    if val.lower() == 'blanks' or val == '':
+        room = 'Blanks'
+        desk_number = ''
+    return room, desk_number
+
+
+def split_desk_id(val):
+    return pd.Series(split_desk_parts(val))
+
+
+def split_desk_series(series):
+    """Vectorized split of a Desk_ID Series into a Room / Desk_Number DataFrame.
+
+    The split runs once per distinct Desk_ID (``str.extract`` on the uniques)
+    and is mapped back to the rows through the factorized codes.
+    """
+    codes, uniques = pd.factorize(series, use_na_sentinel=False)
+    u = pd.Series([str(v) for v in uniques], dtype=object).str.strip()
+    room = u.str.replace(r'\d+', '', regex=True).str.strip().str.title()
+    desk_number = u.str.extract(r'(\d+)', expand=False).fillna('')
+    blank = u.str.lower().eq('blanks') | u.eq('')
+    room[blank] = 'Blanks'
+    desk_number[blank] = ''
+    return pd.DataFrame({
+        'Room': room.to_numpy(dtype=object)[codes],
+        'Desk_Number': desk_number.to_numpy(dtype=object)[codes],
+    }, index=series.index)
+
+
+def _distinct_text(series):
+    """Factorize ``series`` once: ``(codes, text)`` with the distinct values as strings.
+
+    The cast comes first so that e.g. 5 and 5.0 stay distinct ('5' / '5.0'),
+    as with a row-wise ``astype(str)``; missing values become ''. The text is
+    Arrow-backed when pyarrow is installed, so factorizing it and the string
+    kernels below run in Arrow compute rather than one Python call per value.
+    """
+    codes, uniques = pd.factorize(series.astype(_TEXT_DTYPE), use_na_sentinel=False)
+    return codes, pd.Series(uniques, dtype=_TEXT_DTYPE).fillna('')
+
+
+def _from_distinct(codes, normalized, index):
+    """Map normalized distinct values back to the rows as a categorical Series (NA stays missing)."""
+    value_codes, categories = pd.factorize(normalized)
+    categories = pd.Index(categories.to_numpy(dtype=object))
+    return pd.Series(pd.Categorical.from_codes(value_codes[codes], categories=categories), index=index)
+
+
+def normalize_desk_series(series):
+    """
+    Vectorized normalization for a Desk_ID pandas Series:
+    - convert to string
+    - remove commas, dots, underscores, spaces
+    - capitalize
+    - if value ends with exactly 3 digits (optionally prefixed by letters), append a '0' to the digits
+    - convert empty strings to 'Blanks'
+
+    The rows are hashed once; the rules run over the distinct Desk_IDs only
+    and the result comes back as a categorical Series.
+    """
+    codes, s = _distinct_text(series)
+
+    # remove any non-alphanumeric characters (dots, commas, spaces, etc.),
+    # then capitalize (first letter upper, rest lower) for readability
+    s = s.str.replace(r'[^A-Za-z0-9]+', '', regex=True).str.capitalize()
+
+    # whole string = letters (optional) followed by exactly 3 digits: append '0'
+    # (simple concatenation avoids regex backreference issues such as '\\10')
+    s = s.where(~s.str.match(r'^[A-Za-z]*\d{3}$'), s + '0')
+
+    # convert empty strings to 'Blanks'
+    s = s.where(s != '', 'Blanks')
+
+    return _from_distinct(codes, s, series.index)
+
+
+def normalize_serial_series(series):
+    """Normalize serial numbers: remove non-alphanumeric (whitespace included), uppercase.
+
+    Like ``normalize_desk_series`` the rules run once per distinct value;
+    empty serials become missing values of the returned categorical Series.
+    """
+    codes, s = _distinct_text(series)
+    s = s.str.replace(r'[^A-Za-z0-9]+', '', regex=True).str.upper()
+    s = s.where(s != '')
+    return _from_distinct(codes, s, series.index)
+
+
+def _derive_serial_from_skan(skan_val, skan2_val):
+    """Given skan and skan2 values, derive a replacement serial per rules:
+    - if skan/skan2 contains a 'V' (case-insensitive), return substring from 'V' to end
+    - else if skan/skan2 contains digits starting with '6' (pattern r'6\\d+'), return 'V' + that digits
+    - otherwise return None
+    """
+    for s in (skan_val, skan2_val):
+        if s is None:
+            continue
+        s = str(s).strip()
+        if not s:
+            continue
+        # look for 'V' or 'v'
+        m = re.search(r'[Vv].*', s)
+        if m:
+            return m.group(0)
+        # look for digits starting with 6
+        m2 = re.search(r'6\d+', s)
+        if m2:
+            return 'V' + m2.group(0)
+    return None
+
+
+def _skan_sources(col):
+    """Which skan column(s) repair a given serial column, in lookup order."""
+    col_lower = str(col).lower().replace(' ', '').replace('_', '').replace('.', '')
+    # If it's S.N 1 (or S.N1, S.N_1, etc.) → use skan2
+    if 'sn1' in col_lower or col_lower.endswith('1'):
+        return ['skan2']
+    # If it's S.N 2 (or S.N2, S.N_2, etc.) → use skan
+    if 'sn2' in col_lower or col_lower.endswith('2'):
+        return ['skan']
+    # Default: try both (old behavior)
+    return ['skan', 'skan2']
+
+
+def _derive_serials_from_skan(values):
+    """Vectorized ``_derive_serial_from_skan`` for one skan column; NaN where no rule applies."""
+    s = values.where(values.notna(), '').astype(str).str.strip()
+    from_v = s.str.extract(r'([Vv].*)', expand=False)
+    from_six = 'V' + s.str.extract(r'(6\d+)', expand=False)
+    return from_v.fillna(from_six)
+
+
+def _apply_skan_replacements(df, serial_columns, cb=None):
+    """For each column in serial_columns, replace values starting with '0'
+    by deriving from the CORRECT skan column based on S.N column position.
+
+    CRITICAL RULE:
+    - If serial in S.N 1 starts with '0' → use skan2 for replacement
+    - If serial in S.N 2 starts with '0' → use skan for replacement
+    - Extract substring starting from 'V' or prepend 'V' to digits starting with 6
+
+    The source column is picked once per serial column and the rules run as
+    ``str.extract`` over the affected rows only, followed by one masked assignment.
+    """
+    replaced = 0
+    samples = []
+    if df is None or len(serial_columns) == 0:
+        return replaced, samples
+    if 'skan' not in df.columns and 'skan2' not in df.columns:
+        return replaced, samples
+
+    for col in serial_columns:
+        if col not in df.columns:
+            continue
+        # Convert categorical to object to allow modifications
+        if df[col].dtype.name == 'category':
+            df[col] = df[col].astype(object)
+
+        # create boolean mask for entries starting with '0'
+        mask = df[col].astype(str).str.startswith('0', na=False)
+        if not mask.any():
+            continue
+
+        # first source with a match wins, like _derive_serial_from_skan
+        new_serials = None
+        for source in _skan_sources(col):
+            if source not in df.columns:
+                continue
+            derived = _derive_serials_from_skan(df.loc[mask, source])
+            new_serials = derived if new_serials is None else new_serials.fillna(derived)
+        if new_serials is None:
+            continue
+        new_serials = new_serials.dropna()
+        if new_serials.empty:
+            continue
+
+        old = df.loc[new_serials.index, col]
+        df.loc[new_serials.index, col] = new_serials
+        replaced += len(new_serials)
+        for o, n in zip(old.head(5 - len(samples)), new_serials.head(5 - len(samples))):
+            samples.append((col, o, n))
+
+    return replaced, samples
+
+
+def pick_usecols(cols):
+    """Select the columns the comparison needs; None means 'read all columns'."""
+    usecols = []
+    for c in cols:
+        lc = str(c).strip().lower()
+        # keep any serial columns starting with S.N
+        if str(c).startswith('S.N'):
+            usecols.append(c)
+            continue
+        # keep columns with 'serial' keyword (but not 'skan')
+        if 'serial' in lc and 'skan' not in lc:
+            usecols.append(c)
+            continue
+        # keep desk/place/room/type/skan/office columns
+        if any(k in lc for k in ('desk', 'place', 'room', 'type', 'skan', 'office')):
+            usecols.append(c)
+    # if nothing selected, return None to read all columns
+    return usecols if usecols else None
+
+
+def ensure_desk_col(df):
+    """Normalize possible Desk_ID-like column names to 'Desk_ID' for downstream code."""
+    if 'Desk_ID' not in df.columns:
+        # Check for Office Location first (most specific)
+        for c in df.columns:
+            if 'office' in str(c).lower() and 'location' in str(c).lower():
+                df = df.rename(columns={c: 'Desk_ID'})
+                return df
+        # Then check for generic 'desk' column
+        for c in df.columns:
+            if 'desk' in str(c).lower():
+                df = df.rename(columns={c: 'Desk_ID'})
+                break
+    return df
+
+
+def fix_desk_ids(df):
+    """Fill blank Desk_IDs from a Place/Room column.
+
+    Improved logic: do NOT forward-fill Desk_ID if only Place/Room is set.
+    Instead, if Desk_ID is blank and Place/Room is set, assign Desk_ID to Place/Room only.
+    """
+    if 'Desk_ID' not in df.columns:
+        df['Desk_ID'] = pd.Series([pd.NA] * len(df))
+        return df
+    # Try to find a Place/Room column (case-insensitive)
+    place_col = None
+    for col in df.columns:
+        if col.strip().lower() in ('place', 'room'):
+            place_col = col
+            break
+    # Replace empty Desk_ID with Place/Room if available, else leave blank
+    desk_ids = df['Desk_ID'].replace(r'^\s*$', pd.NA, regex=True)
+    if place_col:
+        # Only fill Desk_ID with Place/Room if Desk_ID is blank and Place/Room is not blank
+        mask = desk_ids.isna() & df[place_col].notna() & (df[place_col].astype(str).str.strip() != '')
+        desk_ids = desk_ids.where(~mask, df[place_col])
+    df['Desk_ID'] = desk_ids
+    return df
+
+
+def find_serial_columns(df):
+    """Find columns that contain serial numbers based on name patterns.
+
+    Serial columns can have different names:
+    - S.N*, S.N 1, S.N 2, etc. (standard format)
+    - Serial, Serials, Serial_Number, etc. (alternative format)
+    """
+    serial_cols = []
+    for col in df.columns:
+        col_str = str(col)
+        col_lower = col_str.lower().replace(' ', '').replace('_', '').replace('.', '')
+        # Check for S.N pattern (standard)
+        if col_str.startswith('S.N'):
+            serial_cols.append(col)
+        # Check for 'serial' keyword (alternative format)
+        elif 'serial' in col_lower and 'skan' not in col_lower:
+            serial_cols.append(col)
+    return serial_cols
@@ -0,0 +1,310 @@
+"""Out-of-core comparison for inputs larger than memory.
+
+``compare_excels`` holds both files' frames, pairs and lookup tables at once.
+``compare_partitioned`` instead streams each file in chunks (``prepare_chunks``)
+and appends the normalized pairs to TSV bucket files in a scratch folder:
+
+* pairs at a real desk go to the bucket of their report key, a hash of the
+  desk's (Room, Desk_Number), so everything that can cancel out in the report
+  lands in the same bucket;
+* pairs at a blank desk go to the bucket of their serial, together with a
+  second copy of the real-desk pairs bucketed the same way - that is all the
+  blank-desk inference (the serial's unique desk in the other file, or the
+  room its desks share) needs to look at.
+
+Blank buckets are resolved first and their rows moved into the key buckets
+under the desk they resolve to; then every key bucket is compared on its own
+with the same kernels as the in-memory engine. Peak memory is one chunk or
+one bucket plus the report itself, whatever the size of the inputs, and the
+result equals ``compare_excels``'s (apart from its diagnostic messages).
+"""
+
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from .compare import (
+    aggregate_by_desk,
+    blank_desks,
+    common_serial_rooms,
+    desk_anti_join,
+    desk_rooms,
+    encode_pairs,
+    mismatch_rows,
+    report_labels,
+    resolve_desks,
+    unique_serial_desks,
+)
+from .engine import RESULT_COLUMNS, ComparisonResult, _save_timestamped, _validate_paths
+from .errors import ComparisonCancelled, ComparisonError, NoSerialColumnsError
+from .instrument import RunReport
+from .normalize import split_desk_series
+from .prepare import CHUNK_ROWS, PAIR_COLUMNS, prepare_chunks
+from .progress import CancelToken
+from .writer import OUTPUT_FORMATS
+
+DEFAULT_PARTITIONS = 16
+
+
+def _hash_buckets(frame, partitions):
+    # object columns so str and object dtypes of the same text hash alike
+    frame = frame.astype(object)
+    return (pd.util.hash_pandas_object(frame, index=False).to_numpy() % np.uint64(partitions)).astype(np.int64)
+
+
+def key_buckets(labels, partitions):
+    """Bucket of every desk label, by its report key (Room, Desk_Number)."""
+    parts = split_desk_series(pd.Series(labels, dtype=object))
+    return _hash_buckets(parts[['Room', 'Desk_Number']], partitions)
+
+
+def serial_buckets(serials, partitions):
+    """Bucket of every serial."""
+    return _hash_buckets(pd.DataFrame({'Serial_Number': serials}), partitions)
+
+
+class BucketFiles:
+    """Append-only TSV files ``<kind>_<bucket>.tsv`` of one table layout in a folder."""
+
+    def __init__(self, directory, kind, dtypes):
+        self.directory = directory
+        self.kind = kind
+        self.dtypes = dtypes
+
+    def _path(self, bucket):
+        return os.path.join(self.directory, f'{self.kind}_{bucket:04d}.tsv')
+
+    def append(self, frame, buckets):
+        """Append the rows of ``frame`` to the files of their ``buckets`` (an array, one per row)."""
+        for bucket, part in frame.groupby(buckets, sort=False):
+            part.to_csv(self._path(bucket), sep='\t', header=False, index=False, mode='a')
+
+    def load(self, bucket):
+        path = self._path(bucket)
+        if not os.path.exists(path):
+            return pd.DataFrame({c: pd.Series(dtype=t) for c, t in self.dtypes.items()})
+        return pd.read_csv(path, sep='\t', header=None, names=list(self.dtypes), dtype=self.dtypes,
+                           keep_default_na=False)
+
+
+def _route_pairs(pairs, side, buckets, partitions):
+    """Append one chunk of prepared (categorical) pairs to the key / serial / blank buckets of ``side``."""
+    desk = pairs['Desk_ID']
+    serial = pairs['Serial_Number']
+    # bucket numbers are computed once per distinct desk / serial
+    desk_codes = desk.cat.codes.to_numpy()
+    serial_codes = serial.cat.codes.to_numpy()
+    blank = blank_desks(desk.cat.categories)[desk_codes]
+    by_key = key_buckets(desk.cat.categories, partitions)[desk_codes]
+    by_serial = serial_buckets(serial.cat.categories, partitions)[serial_codes]
+    strings = pd.DataFrame({
+        'Desk_ID': desk.to_numpy(dtype=object),
+        'Serial_Number': serial.to_numpy(dtype=object),
+    })
+    buckets[f'pairs{side}'].append(strings[~blank], by_key[~blank])
+    buckets[f'by_serial{side}'].append(strings[~blank], by_serial[~blank])
+    buckets[f'blank{side}'].append(strings[blank], by_serial[blank])
+
+
+def resolve_blank_bucket(buckets, bucket, partitions):
+    """Resolve the blank-desk mismatches of one serial bucket into the 'resolved' key buckets.
+
+    Returns ``(only_in_1, only_in_2, blank_desk_names)`` for the run's stats.
+    """
+    blank1, blank2 = buckets['blank1'].load(bucket), buckets['blank2'].load(bucket)
+    if blank1.empty and blank2.empty:
+        return 0, 0, set()
+    assigned1, assigned2 = buckets['by_serial1'].load(bucket), buckets['by_serial2'].load(bucket)
+    desks, serials, (pairs1, pairs2, blank1, blank2) = encode_pairs(assigned1, assigned2, blank1, blank2)
+    blank = blank_desks(desks)
+    room_codes, rooms = desk_rooms(desks)
+    serial_to_desk_1 = unique_serial_desks(pairs1, blank, len(serials))
+    serial_to_desk_2 = unique_serial_desks(pairs2, blank, len(serials))
+    serial_to_room = common_serial_rooms(blank, room_codes, rooms, len(serials), pairs1, pairs2)
+    only1, only2 = desk_anti_join(blank1, blank2)
+
+    labels = report_labels(desks, rooms).to_numpy(dtype=object)
+    serial_text = serials.to_numpy(dtype=object)
+    resolved = pd.concat([
+        pd.DataFrame({
+            'Desk_ID': labels[resolve_desks(only, blank, other_unique, serial_to_room, len(rooms))],
+            'Serial_Number': serial_text[only['Serial_Number'].to_numpy()],
+            'Side': side,
+        })
+        for side, only, other_unique in ((1, only1, serial_to_desk_2), (2, only2, serial_to_desk_1))
+    ], ignore_index=True)
+    labels_used = pd.unique(resolved['Desk_ID'].to_numpy())
+    bucket_of = dict(zip(labels_used, key_buckets(labels_used, partitions)))
+    buckets['resolved'].append(resolved, resolved['Desk_ID'].map(bucket_of).to_numpy())
+    blank_codes = np.concatenate([blank1['Desk_ID'].to_numpy(), blank2['Desk_ID'].to_numpy()])
+    return len(only1), len(only2), set(desks[np.unique(blank_codes)])
+
+
+def compare_key_bucket(buckets, bucket):
+    """Long-form mismatches of one key bucket, plus its counts.
+
+    Returns ``(rows, only_in_1, only_in_2, desks)`` with ``rows`` in the
+    ``mismatch_rows`` layout.
+    """
+    pairs1, pairs2 = buckets['pairs1'].load(bucket), buckets['pairs2'].load(bucket)
+    resolved = buckets['resolved'].load(bucket)
+    if pairs1.empty and pairs2.empty and resolved.empty:
+        return pd.DataFrame(columns=['Room', 'Desk_Number', 'Serial_Number', 'Side']), 0, 0, 0
+    desks, serials, (pairs1, pairs2, resolved_pairs) = encode_pairs(pairs1, pairs2, resolved[PAIR_COLUMNS])
+    desks_compared = len(pd.unique(np.concatenate([pairs1['Desk_ID'].to_numpy(), pairs2['Desk_ID'].to_numpy()])))
+    only1, only2 = desk_anti_join(pairs1, pairs2)
+    long_rows = pd.concat([
+        only1.assign(Side=1),
+        only2.assign(Side=2),
+        resolved_pairs.assign(Side=resolved['Side'].to_numpy()),
+    ], ignore_index=True)
+    # the resolved blank-desk rows are labels in the same dictionary as the desks
+    return mismatch_rows(long_rows, desks, serials), len(only1), len(only2), desks_compared
+
+
+def compare_partitioned(file1, file2, output_folder, partitions=DEFAULT_PARTITIONS, chunk_rows=CHUNK_ROWS,
+                        work_dir=None, progress_callback=None, output_format='xlsx', report=None, cancel=None):
+    """``compare_excels`` for inputs too large for memory; see the module docstring.
+
+    ``partitions`` is the number of buckets (more buckets, less memory per
+    bucket), ``chunk_rows`` the number of input rows normalized at a time and
+    ``work_dir`` the folder for the scratch files (default: the system temp
+    folder; they are removed afterwards and need about the size of the
+    normalized pairs, twice). The other arguments are those of
+    ``compare_excels``; there is no parallel reading and no input cache here.
+
+    Returns a ``ComparisonResult``; raises a ``ComparisonError`` subclass on failure.
+    """
+    cancel = cancel if cancel is not None else CancelToken()
+
+    def cb(percent, msg):
+        cancel.check()
+        if progress_callback:
+            progress_callback(percent, msg)
+
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format {output_format!r}; expected one of {', '.join(OUTPUT_FORMATS)}")
+    if partitions < 1:
+        raise ValueError('partitions must be at least 1')
+
+    warnings = []
+    report = report if report is not None else RunReport()
+    report.summary.update(files=[file1, file2], output_format=output_format, partitions=partitions)
+    _validate_paths([file1, file2], output_folder, cb)
+
+    with tempfile.TemporaryDirectory(prefix='desk_comparator_', dir=work_dir) as scratch:
+        pair_types = {'Desk_ID': object, 'Serial_Number': object}
+        buckets = {kind: BucketFiles(scratch, kind, pair_types)
+                   for kind in ('pairs1', 'pairs2', 'by_serial1', 'by_serial2', 'blank1', 'blank2')}
+        buckets['resolved'] = BucketFiles(scratch, 'resolved', dict(pair_types, Side='int64'))
+
+        # Stream both files into the buckets, one chunk in memory at a time
+        files = []
+        for side, (path, label) in enumerate(((file1, 'File 1'), (file2, 'File 2')), start=1):
+            cb(5 + 30 * (side - 1), f'Reading and normalizing {label} in chunks of {chunk_rows} rows...')
+            info = {'rows': 0, 'pairs': 0, 'serial_columns': [], 'replaced': 0, 'samples': []}
+            try:
+                with report.stage('partition') as st:
+                    st['file'] = label
+                    for number, prepared in enumerate(prepare_chunks(path, label, chunk_rows, report, cancel)):
+                        report.add(prepared.stages, file=label, chunk=number)
+                        if number == 0:
+                            info['serial_columns'] = prepared.serial_columns
+                            for message in prepared.messages:
+                                cb(6 + 30 * (side - 1), message)
+                        info['rows'] += prepared.rows
+                        info['pairs'] += len(prepared.pairs)
+                        info['replaced'] += prepared.skan_replaced
+                        info['samples'] += prepared.skan_samples[:5 - len(info['samples'])]
+                        if len(prepared.pairs):
+                            _route_pairs(prepared.pairs, side, buckets, partitions)
+                        cb(6 + 30 * (side - 1), f"{label}: {info['rows']} rows normalized")
+                    st['rows_out'] = info['pairs']
+            except ComparisonCancelled:
+                raise
+            except ComparisonError as e:
+                cb(0, str(e).splitlines()[0])
+                raise
+            files.append(info)
+        info1, info2 = files
+
+        cb(41, f"Found serial columns - File1: {info1['serial_columns']} | File2: {info2['serial_columns']}")
+        if not info1['serial_columns'] and not info2['serial_columns']:
+            cb(0, 'No serial columns found in either file')
+            raise NoSerialColumnsError("No serial columns found!\n\nSerial columns must start with 'S.N' (e.g., S.N1, S.N2)")
+        if not info1['serial_columns']:
+            cb(41, 'Warning: No serial columns in file 1')
+            warnings.append(f"No serial columns found in file 1:\n{file1}\n\nAll serials will appear as 'Only in File 2'")
+        if not info2['serial_columns']:
+            cb(41, 'Warning: No serial columns in file 2')
+            warnings.append(f"No serial columns found in file 2:\n{file2}\n\nAll serials will appear as 'Only in File 1'")
+        if info1['replaced'] or info2['replaced']:
+            sample_text = '; '.join([f"{c}:{o}->{n}" for c, o, n in (info1['samples'] + info2['samples'])])
+            cb(44, f"Replaced {info1['replaced']} in file1, {info2['replaced']} in file2. Samples: {sample_text}")
+
+        # Blank desks first: their resolved rows join the key buckets
+        cb(69, f'Resolving blank desks in {partitions} serial buckets...')
+        only_in_1 = only_in_2 = 0
+        blank_names = set()
+        with report.stage('resolve_blanks') as st:
+            for bucket in range(partitions):
+                cancel.check()
+                only1, only2, names = resolve_blank_bucket(buckets, bucket, partitions)
+                only_in_1 += only1
+                only_in_2 += only2
+                blank_names |= names
+            st['rows_out'] = only_in_1 + only_in_2
+
+        cb(75, f'Comparing {partitions} desk buckets...')
+        parts = []
+        desks_compared = len(blank_names)
+        with report.stage('compare') as st:
+            for bucket in range(partitions):
+                cb(75 + 10 * bucket // partitions, f'Comparing desk bucket {bucket + 1}/{partitions}...')
+                rows, only1, only2, desks = compare_key_bucket(buckets, bucket)
+                parts.append(rows)
+                only_in_1 += only1
+                only_in_2 += only2
+                desks_compared += desks
+            st['rows_out'] = sum(len(p) for p in parts)
+
+    cb(85, 'Preparing output...')
+    with report.stage('output_prep') as st:
+        # buckets hold disjoint report keys: sorting the union orders it like compare_excels
+        serial_mismatches = pd.concat(parts, ignore_index=True)
+        del parts
+        serial_mismatches = serial_mismatches.sort_values(['Room', 'Desk_Number', 'Serial_Number'], ignore_index=True)
+        st['rows_in'] = len(serial_mismatches)
+        result_df = aggregate_by_desk(serial_mismatches)[RESULT_COLUMNS]
+        st['rows_out'] = len(result_df)
+
+    stats = {
+        'rows_file1': info1['rows'],
+        'rows_file2': info2['rows'],
+        'pairs_file1': info1['pairs'],
+        'pairs_file2': info2['pairs'],
+        'serial_columns_file1': list(info1['serial_columns']),
+        'serial_columns_file2': list(info2['serial_columns']),
+        'skan_replaced_file1': info1['replaced'],
+        'skan_replaced_file2': info2['replaced'],
+        'desks_compared': desks_compared,
+        'only_in_file1': only_in_1,
+        'only_in_file2': only_in_2,
+        'mismatch_rows': len(result_df),
+    }
+    report.summary['stats'] = stats
+    result = ComparisonResult(mismatches=result_df, stats=stats, warnings=warnings,
+                              serial_mismatches=serial_mismatches, report=report)
+
+    if output_folder is None:
+        cb(100, 'Done.')
+        return result
+
+    cb(95, 'Saving results...')
+    with report.stage('save', rows_in=len(result_df)):
+        result.output_path = _save_timestamped(result_df, output_folder, 'desk_mismatches', output_format, cb)
+    report.summary['output_path'] = result.output_path
+    cb(100, f'Done. Saved to: {result.output_path}')
+    return result
@@ -0,0 +1,376 @@
+"""Per-file preparation: read, filter, fix/normalize Desk_IDs and serials.
+
+``prepare_input`` turns one inventory file into its normalized
+``(Desk_ID, Serial_Number)`` pairs. It only depends on the file itself, so
+``prepare_inputs`` can run it for both files at once in separate worker
+processes (Excel parsing is CPU-bound pure Python; threads would not help).
+The pairs travel back as categoricals - integer codes plus one copy of each
+distinct string - which keeps the inter-process payload small.
+"""
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from .errors import ComparisonCancelled, EmptyInputError, ReadError
+from .instrument import RunReport
+from .progress import CancelToken
+from .normalize import (
+    _apply_skan_replacements,
+    ensure_desk_col,
+    find_serial_columns,
+    fix_desk_ids,
+    normalize_desk_series,
+    normalize_serial_series,
+)
+from .reader import iter_inventory, read_inventory, sheet_names
+
+PAIR_COLUMNS = ['Desk_ID', 'Serial_Number']
+
+# Bump whenever reading or normalization changes what prepare_input returns,
+# so on-disk cache entries made by older rules are no longer used.
+NORMALIZATION_VERSION = 4
+
+# Below this combined input size, starting worker processes (each importing
+# pandas/openpyxl) costs more than it saves.
+PARALLEL_MIN_BYTES = 1_000_000
+
+# input rows per piece in prepare_chunks (the out-of-core comparison)
+CHUNK_ROWS = 100_000
+
+
+@dataclass
+class PreparedInput:
+    """Normalized content of one input file.
+
+    ``pairs`` holds one row per (Desk_ID, Serial_Number) occurrence with
+    categorical columns; ``messages`` are progress notes collected in the
+    worker, replayed by the caller since workers cannot report progress, and
+    ``stages`` are the worker's ``RunReport`` stage records. ``sheets`` lists
+    the sheets the pairs come from when several were read (see ``merge_sheets``).
+    """
+
+    path: str
+    pairs: pd.DataFrame
+    rows: int = 0
+    serial_columns: list = field(default_factory=list)
+    skan_replaced: int = 0
+    skan_samples: list = field(default_factory=list)
+    messages: list = field(default_factory=list)
+    stages: list = field(default_factory=list)
+    sheets: list = field(default_factory=list)
+
+
+@contextmanager
+def _reading():
+    try:
+        yield
+    except ComparisonCancelled:
+        raise
+    except PermissionError as e:
+        raise ReadError(f"Permission denied. Please close the Excel files if they are open:\n{e}") from e
+    except Exception as e:
+        raise ReadError(f"Failed to read input files:\n{e}\n\n"
+                        "Make sure the files are valid Excel (.xlsx or .xls), CSV or Parquet files") from e
+
+
+def prepare_input(path, label='File', report=None, cancel=None, sheet=None):
+    """Read one file (one sheet of it: default the first) and return its normalized pairs as a ``PreparedInput``.
+
+    Stages are timed into ``report`` (a ``RunReport``, or a fresh one) and
+    returned in ``PreparedInput.stages``; ``cancel`` (a ``CancelToken``) is
+    checked between them and while rows are read.
+    """
+    report = report if report is not None else RunReport()
+    cancel = cancel if cancel is not None else CancelToken()
+    with report.stage('read') as st:
+        with _reading():
+            df = read_inventory(path, cancel, sheet)
+        # the MNTR filter runs while the rows are read: rows_in counts all data rows
+        st['rows_in'] = df.attrs.get('rows_read', len(df)) if df is not None else 0
+        st['rows_out'] = len(df) if df is not None else 0
+
+    # Validate dataframe is not empty
+    if df is None or df.empty:
+        raise EmptyInputError(f"{label} contains no data:\n{path}")
+    return normalize_input(df, path, label, report, cancel)
+
+
+def prepare_chunks(path, label='File', chunk_rows=CHUNK_ROWS, report=None, cancel=None, sheet=None):
+    """Yield ``prepare_input``'s result (for one ``sheet``) in pieces of at most ``chunk_rows`` input rows.
+
+    Every normalization step is row-local, so the chunks' pairs together are
+    the pairs ``prepare_input`` returns, while only one chunk is in memory.
+    Each chunk gets its own stage records (made with ``report.options()``).
+    """
+    report = report if report is not None else RunReport()
+    cancel = cancel if cancel is not None else CancelToken()
+    chunks = iter_inventory(path, chunk_rows, cancel, sheet)
+    empty = True
+    try:
+        while True:
+            chunk_report = report.options()
+            with chunk_report.stage('read') as st:
+                with _reading():
+                    df = next(chunks, None)
+                st['rows_in'] = df.attrs.get('rows_read', len(df)) if df is not None else 0
+                st['rows_out'] = len(df) if df is not None else 0
+            if df is None:
+                break
+            if df.empty:
+                continue
+            empty = False
+            yield normalize_input(df, path, label, chunk_report, cancel)
+    finally:
+        chunks.close()
+    if empty:
+        raise EmptyInputError(f"{label} contains no data:\n{path}")
+
+
+def normalize_input(df, path, label='File', report=None, cancel=None):
+    """Normalize a frame from ``read_inventory`` into a ``PreparedInput`` (the stages after 'read')."""
+    report = report if report is not None else RunReport()
+    cancel = cancel if cancel is not None else CancelToken()
+    messages = []
+    cancel.check()
+    with report.stage('fix_desk_ids', rows_in=len(df)) as st:
+        df = ensure_desk_col(df)
+        df = fix_desk_ids(df)
+        st['rows_out'] = len(df)
+
+    cancel.check()
+    with report.stage('normalize_desks', rows_in=len(df)) as st:
+        df_desk_col = df.get('Desk_ID', pd.Series(dtype=str))
+        df['Desk_ID'] = normalize_desk_series(df_desk_col)
+        st['rows_out'] = len(df)
+    messages.append(f"{label}: {df.shape[0]} rows, Desk_ID samples: {', '.join(df['Desk_ID'].head(3).astype(str).tolist())}")
+
+    serial_columns = find_serial_columns(df)
+
+    # CRITICAL: Apply skan/skan2-based replacements BEFORE reshaping
+    # This ensures serials are corrected before building comparison maps
+    cancel.check()
+    with report.stage('skan_repair', rows_in=len(df)) as st:
+        replaced, samples = _apply_skan_replacements(df, serial_columns)
+        st['rows_out'] = replaced
+
+    # Handle empty serial columns gracefully
+    cancel.check()
+    with report.stage('melt', rows_in=len(df)) as st:
+        if serial_columns:
+            normalized = df.melt(id_vars='Desk_ID', value_vars=serial_columns, value_name='Serial_Number')
+            normalized = normalized.dropna(subset=['Serial_Number'])
+            # Free memory
+            normalized = normalized[PAIR_COLUMNS].copy()
+        else:
+            normalized = pd.DataFrame(columns=PAIR_COLUMNS)
+        st['rows_out'] = len(normalized)
+    rows = len(df)
+    del df
+
+    # Normalize serials to avoid formatting mismatches
+    cancel.check()
+    with report.stage('normalize_serials', rows_in=len(normalized)) as st:
+        normalized['Serial_Number'] = normalize_serial_series(normalized['Serial_Number'])
+        # the normalized columns are categorical already (astype is then a no-op);
+        # drop the desks/serials left without a pair
+        pairs = normalized[PAIR_COLUMNS].dropna().astype('category').reset_index(drop=True)
+        pairs = pd.DataFrame({col: pairs[col].cat.remove_unused_categories() for col in PAIR_COLUMNS})
+        st['rows_out'] = len(pairs)
+
+    # Log sample serials after normalization and check for specific serial
+    if not normalized.empty:
+        sample = normalized.head(3)[PAIR_COLUMNS].to_dict('records')
+        messages.append(f'{label} sample after normalization: {sample}')
+
+    return PreparedInput(
+        path=path,
+        pairs=pairs,
+        rows=rows,
+        serial_columns=list(serial_columns),
+        skan_replaced=replaced,
+        skan_samples=samples,
+        messages=messages,
+        stages=report.stages,
+    )
+
+
+def _should_parallelize(paths, parallel):
+    if parallel is not None:
+        return bool(parallel) and len(paths) > 1
+    if len(paths) < 2 or (os.cpu_count() or 1) < 2:
+        return False
+    # sheets of one workbook are separate jobs, but the file is only counted once
+    return sum(os.path.getsize(p) for p in set(paths)) >= PARALLEL_MIN_BYTES
+
+
+def select_sheets(path, sheets, label='File'):
+    """Names of the sheets of ``path`` to read: every sheet for ``'all'``, else ``sheets`` (which must exist).
+
+    A selection only applies to workbooks with several sheets: a single-sheet
+    master (or a CSV/Parquet export) compared with some sheets of a site
+    workbook is read whole.
+    """
+    with _reading():
+        available = sheet_names(path)
+    if sheets == 'all' or len(available) == 1:
+        return available
+    missing = [name for name in sheets if name not in available]
+    if missing:
+        raise ReadError(f"{label} has no sheet {', '.join(repr(name) for name in missing)}:\n{path}\n\n"
+                        f"Its sheets are: {', '.join(available)}")
+    return list(sheets)
+
+
+def merge_sheets(path, label, parts):
+    """One ``PreparedInput`` from the per-sheet ones in ``parts`` (``(sheet, prepared)``; None for an empty sheet).
+
+    The pairs get a categorical 'Sheet' column, with the sheets in workbook order.
+    """
+    found = [(sheet, prepared) for sheet, prepared in parts if prepared is not None]
+    if not found:
+        raise EmptyInputError(f"{label} contains no data in sheets {', '.join(sheet for sheet, _ in parts)}:\n{path}")
+    sheets = [sheet for sheet, _ in found]
+    tables = [prepared.pairs for _, prepared in found]
+    # a sheet without serial columns has no pairs (and untyped categories)
+    filled = [t for t in tables if len(t)] or tables[:1]
+    pairs = pd.DataFrame({col: union_categoricals([t[col] for t in filled]) for col in PAIR_COLUMNS})
+    pairs['Sheet'] = pd.Categorical.from_codes(np.repeat(np.arange(len(tables)), [len(t) for t in tables]),
+                                               categories=sheets)
+    serial_columns = list(dict.fromkeys(c for _, prepared in found for c in prepared.serial_columns))
+    return PreparedInput(
+        path=path,
+        pairs=pairs,
+        rows=sum(prepared.rows for _, prepared in found),
+        serial_columns=serial_columns,
+        skan_replaced=sum(prepared.skan_replaced for _, prepared in found),
+        skan_samples=[sample for _, prepared in found for sample in prepared.skan_samples][:5],
+        messages=[message for _, prepared in found for message in prepared.messages],
+        sheets=sheets,
+    )
+
+
+def prepare_inputs(paths, labels=None, parallel=None, cache=None, report=None, cancel=None, sheets=None):
+    """Prepare several files, in one worker process per file when worthwhile.
+
+    ``parallel=None`` decides by combined file size; True/False forces it.
+    With an ``InputCache``, files whose content was prepared before are loaded
+    from it instead of being parsed, and fresh results are stored in it.
+    With a ``RunReport``, the per-file stages are added to it, tagged with
+    the file's label. A ``CancelToken`` stops the work, including the
+    worker processes. Results come back in the order of ``paths``.
+
+    ``sheets`` picks the sheets of every file: None reads the first sheet
+    only, ``'all'`` every sheet, a list the sheets of those names. With
+    sheets, each sheet is a job of its own (run in parallel like files),
+    empty sheets are skipped and each file's sheets are combined by
+    ``merge_sheets``.
+    """
+    labels = labels or [f'File {i}' for i in range(1, len(paths) + 1)]
+    report = report if report is not None else RunReport()
+    cancel = cancel if cancel is not None else CancelToken()
+    # one job per file, or per selected sheet: (file index, path, label, sheet)
+    jobs = []
+    for i, (path, label) in enumerate(zip(paths, labels)):
+        if sheets is None:
+            jobs.append((i, path, label, None))
+        else:
+            jobs.extend((i, path, f'{label} [{name}]', name) for name in select_sheets(path, sheets, label))
+    results = [None] * len(jobs)
+    keys = [None] * len(jobs)
+    if cache is not None:
+        file_keys = {}
+        for j, (_, path, label, sheet) in enumerate(jobs):
+            cancel.check()
+            with report.stage('cache_lookup') as st:
+                if path not in file_keys:
+                    file_keys[path] = cache.key_for(path)
+                keys[j] = cache.sheet_key(file_keys[path], sheet)
+                results[j] = cache.load(keys[j], path)
+                st['file'] = label
+                st['hit'] = results[j] is not None
+                st['rows_out'] = len(results[j].pairs) if results[j] is not None else None
+    todo = [j for j in range(len(jobs)) if results[j] is None]
+
+    todo_jobs = [jobs[j][1:] for j in todo]
+    if _should_parallelize([path for path, _, _ in todo_jobs], parallel):
+        fresh = _prepare_in_pool(todo_jobs, report, cancel)
+    else:
+        fresh = [_prepare_job(path, label, report.options(), cancel, sheet) for path, label, sheet in todo_jobs]
+
+    for j, prepared in zip(todo, fresh):
+        results[j] = prepared
+        if prepared is None:
+            continue
+        report.add(prepared.stages, file=jobs[j][2])
+        if cache is not None:
+            try:
+                with report.stage('cache_store') as st:
+                    st['file'] = jobs[j][2]
+                    cache.store(keys[j], prepared)
+            except OSError:
+                # a full disk or read-only cache folder must not fail the comparison
+                pass
+    if sheets is None:
+        return results
+    return [
+        merge_sheets(path, label, [(job[3], prepared) for job, prepared in zip(jobs, results) if job[0] == i])
+        for i, (path, label) in enumerate(zip(paths, labels))
+    ]
+
+
+def _prepare_job(path, label, report, cancel, sheet):
+    if sheet is None:
+        return prepare_input(path, label, report, cancel)
+    try:
+        return prepare_input(path, label, report, cancel, sheet)
+    except EmptyInputError:
+        # e.g. a cover or summary sheet without monitor rows
+        return None
+
+
+# cancel token of a worker process, set up by _init_worker
+_worker_cancel = None
+
+
+def _init_worker(stop_event):
+    global _worker_cancel
+    _worker_cancel = CancelToken(stop_event)
+
+
+def _prepare_in_worker(path, label, report, sheet):
+    return _prepare_job(path, label, report, _worker_cancel, sheet)
+
+
+def _prepare_in_pool(jobs, report, cancel):
+    # 'spawn' everywhere: forking a process that runs a Tk main loop in
+    # another thread is unsafe, and Windows only supports spawn anyway.
+    ctx = multiprocessing.get_context('spawn')
+    workers = min(len(jobs), os.cpu_count() or 1)
+    # the caller's token is a thread Event; workers watch a process-shared one
+    stop = ctx.Event()
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx,
+                                 initializer=_init_worker, initargs=(stop,)) as pool:
+            futures = [pool.submit(_prepare_in_worker, path, label, report.options(), sheet)
+                       for path, label, sheet in jobs]
+            pending = set(futures)
+            while pending:
+                _, pending = wait(pending, timeout=0.1)
+                if cancel.cancelled:
+                    stop.set()
+                    for f in futures:
+                        f.cancel()
+                    cancel.check()
+            return [f.result() for f in futures]
+    except BrokenProcessPool:
+        # a worker died (e.g. killed for memory, or no usable entry point in a
+        # frozen build) - the same work still succeeds in this process
+        return [_prepare_job(path, label, report.options(), cancel, sheet) for path, label, sheet in jobs]
@@ -0,0 +1,61 @@
+"""Progress and cancellation plumbing between a running comparison and its caller.
+
+Both are stdlib-only so the GUI and the CLI can use them without importing
+the engine.
+"""
+
+import threading
+
+from .errors import ComparisonCancelled
+
+
+class CancelToken:
+    """Cooperative cancellation flag.
+
+    The caller calls ``cancel()`` from any thread; the engine calls
+    ``check()`` between stages and every few thousand rows inside its loops,
+    which raises ``ComparisonCancelled``. ``event`` lets worker processes use
+    a ``multiprocessing`` Event instead of a thread Event.
+    """
+
+    def __init__(self, event=None):
+        self._event = event if event is not None else threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def wait(self, timeout):
+        """Sleep up to ``timeout`` seconds, waking early on ``cancel()``; True if cancelled."""
+        return self._event.wait(timeout)
+
+    def check(self):
+        if self._event.is_set():
+            raise ComparisonCancelled('The comparison was cancelled.')
+
+
+class ProgressChannel:
+    """Latest-value mailbox for progress updates.
+
+    Pass ``put`` as the ``progress_callback``: the worker may call it as
+    often as it likes, it only replaces the pending update. The UI thread
+    calls ``take`` on its own timer (e.g. every 100 ms with Tk ``after``), so
+    however chatty the run, the UI handles at most one update per tick.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = None
+
+    def put(self, percent, message):
+        with self._lock:
+            self._pending = (percent, message)
+
+    def take(self):
+        """The newest ``(percent, message)`` since the last call, or None."""
+        with self._lock:
+            update, self._pending = self._pending, None
+        return update
@@ -0,0 +1,352 @@
+"""Single-pass inventory readers.
+
+``read_inventory`` parses an input file exactly once: the header row is sniffed,
+``pick_usecols`` decides which columns to keep and rows whose ``Type`` is not
+``MNTR`` are dropped while the rows are streamed, so neither the unused columns
+nor the non-monitor rows are ever materialized in a DataFrame. CSV and Parquet
+exports skip spreadsheet parsing altogether: pyarrow reads only the needed
+columns and Parquet row groups are filtered on ``Type`` during the scan.
+``iter_inventory`` yields the same rows in bounded chunks for the out-of-core
+comparison.
+"""
+
+import csv
+import os
+import zipfile
+from xml.etree import ElementTree
+
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pc = pa_csv = pq = None
+
+from .normalize import pick_usecols
+
+MNTR = 'MNTR'
+
+# how often the row loop looks at the cancel token
+CANCEL_CHECK_ROWS = 5000
+
+# placeholder text read as missing in every format (pandas.read_excel's default na_values)
+NA_STRINGS = frozenset([
+    '', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+    '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null',
+])
+
+CSV_DELIMITERS = (',', ';', '\t', '|')
+CSV_FALLBACK_ENCODING = 'cp1250'
+
+
+def _header_names(header):
+    """Column names the way pandas.read_excel would label them.
+
+    Empty header cells become 'Unnamed: <i>' and repeated names get a '.1',
+    '.2', ... suffix, so code written against read_excel frames keeps working.
+    """
+    names = []
+    seen = {}
+    for i, value in enumerate(header):
+        name = f'Unnamed: {i}' if value is None else value
+        if name in seen:
+            seen[name] += 1
+            name = f'{name}.{seen[name]}'
+        else:
+            seen[name] = 0
+        names.append(name)
+    return names
+
+
+def _cell_value(value):
+    # read_excel turns whole-number floats into ints; doing the same keeps
+    # numeric serials like 123456 from becoming '123456.0' later on
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str) and value in NA_STRINGS:
+        return None
+    return value
+
+
+def _frame_from_columns(names, columns):
+    df = pd.DataFrame({name: pd.Series(values, dtype=object) for name, values in zip(names, columns)})
+    if 'Type' in df.columns:
+        # after the MNTR pushdown every value is the same string
+        df['Type'] = df['Type'].astype('category')
+    return df
+
+
+def iter_xlsx_chunks(path, chunk_rows=None, cancel=None, sheet=None):
+    """Stream one sheet (default: the first) of an .xlsx workbook as DataFrames of at most ``chunk_rows`` kept rows.
+
+    With ``chunk_rows=None`` the whole sheet comes back as one frame. Each
+    frame's ``attrs['rows_read']`` counts the data rows read for it.
+    """
+    wb = load_workbook(path, read_only=True, data_only=True)
+    try:
+        ws = wb.worksheets[0] if sheet is None else wb[sheet]
+        rows = ws.iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        names = _header_names(header)
+        usecols = pick_usecols(names)
+        keep = [i for i, name in enumerate(names) if usecols is None or name in usecols]
+        kept_names = [names[i] for i in keep]
+        type_idx = names.index('Type') if 'Type' in kept_names else None
+
+        columns = [[] for _ in keep]
+        kept = 0
+        rows_read = 0
+        yielded = False
+        for row in rows:
+            rows_read += 1
+            if cancel is not None and rows_read % CANCEL_CHECK_ROWS == 0:
+                cancel.check()
+            width = len(row)
+            # MNTR pushdown: skip the row before touching any other cell
+            if type_idx is not None and (type_idx >= width or row[type_idx] != MNTR):
+                continue
+            values = [_cell_value(row[i]) if i < width else None for i in keep]
+            if all(v is None for v in values):
+                continue
+            for column, value in zip(columns, values):
+                column.append(value)
+            kept += 1
+            if kept == chunk_rows:
+                df = _frame_from_columns(kept_names, columns)
+                df.attrs['rows_read'] = rows_read
+                yield df
+                yielded = True
+                columns = [[] for _ in keep]
+                kept = rows_read = 0
+        if kept or not yielded:
+            df = _frame_from_columns(kept_names, columns)
+            df.attrs['rows_read'] = rows_read
+            yield df
+    finally:
+        wb.close()
+
+
+def read_xlsx_streaming(path, cancel=None, sheet=None):
+    """Read one sheet (default: the first) of an .xlsx workbook with openpyxl ``read_only``/``iter_rows``."""
+    chunks = iter_xlsx_chunks(path, None, cancel, sheet)
+    try:
+        return next(chunks, pd.DataFrame())
+    finally:
+        chunks.close()
+
+
+def read_with_pandas(path, sheet=None):
+    """Fallback for formats openpyxl cannot stream (legacy .xls): one parse, then select/filter."""
+    df = pd.read_excel(path, sheet_name=0 if sheet is None else sheet)
+    rows_read = len(df)
+    usecols = pick_usecols(df.columns.tolist())
+    if usecols:
+        df = df[usecols]
+    if 'Type' in df.columns:
+        df = df[df['Type'] == MNTR].reset_index(drop=True)
+    df.attrs['rows_read'] = rows_read
+    return df
+
+
+def detect_format(path):
+    """Input format from the file's first bytes: 'xlsx', 'excel' (other workbooks), 'parquet' or 'csv'.
+
+    The content decides, not the extension, so a CSV export saved as .txt or
+    a workbook without its extension still reads.
+    """
+    with open(path, 'rb') as f:
+        head = f.read(8)
+    if head.startswith(b'PK\x03\x04'):
+        # a zip: .xlsx/.xlsm, unless it is an OpenDocument spreadsheet
+        return 'excel' if os.path.splitext(path)[1].lower() == '.ods' else 'xlsx'
+    if head.startswith(b'\xd0\xcf\x11\xe0'):
+        # OLE2 container: legacy .xls
+        return 'excel'
+    if head.startswith(b'PAR1'):
+        return 'parquet'
+    return 'csv'
+
+
+def _csv_layout(path):
+    """``(encoding, delimiter, column names)`` of a CSV export, from its first 64 KB."""
+    with open(path, 'rb') as f:
+        sample = f.read(64 * 1024)
+    try:
+        text = sample.decode('utf-8-sig')
+        encoding = 'utf-8'
+    except UnicodeDecodeError as e:
+        if e.start >= len(sample) - 3:
+            # the sample ends in the middle of a multi-byte character
+            text = sample[:e.start].decode('utf-8-sig')
+            encoding = 'utf-8'
+        else:
+            # not UTF-8: Excel's "CSV" on Polish Windows writes cp1250
+            text = sample.decode(CSV_FALLBACK_ENCODING, errors='replace')
+            encoding = CSV_FALLBACK_ENCODING
+    first_line = text.splitlines()[0] if text else ''
+    # Excel writes ';' where ',' is the decimal separator; pick whichever the header uses most
+    delimiter = max(CSV_DELIMITERS, key=first_line.count)
+    header = next(csv.reader([first_line], delimiter=delimiter), [])
+    return encoding, delimiter, _header_names([h if h != '' else None for h in header])
+
+
+def _object_column(series):
+    """Object column with None for missing values and ints for whole floats, like the .xlsx reader.
+
+    Placeholder text (``NA_STRINGS``) counts as missing, as in every reader.
+    """
+    values = series.to_numpy(dtype=object, na_value=None)
+    if series.dtype.kind == 'f':
+        numbers = series.to_numpy(dtype=float, na_value=np.nan)
+        whole = np.isfinite(numbers) & (numbers == np.floor(numbers))
+        values[whole] = numbers[whole].astype(np.int64).astype(object)
+    else:
+        values[series.isin(NA_STRINGS).to_numpy()] = None
+    return values
+
+
+def _inventory_frame(df, rows_read):
+    """Finish a CSV/Parquet frame the way ``iter_xlsx_chunks`` builds its frames."""
+    if 'Type' in df.columns:
+        df = df[df['Type'] == MNTR]
+    columns = [_object_column(df[name]) for name in df.columns]
+    out = _frame_from_columns(list(df.columns), columns)
+    # rows with nothing in any kept column are skipped, as in the .xlsx reader
+    out = out[out.notna().any(axis=1)].reset_index(drop=True) if len(out.columns) else out
+    out.attrs['rows_read'] = rows_read
+    return out
+
+
+def read_csv_fast(path):
+    """Read a CSV export with the pyarrow CSV parser: needed columns only, all as text.
+
+    Falls back to the pandas C parser without pyarrow or for ragged rows.
+    """
+    encoding, delimiter, names = _csv_layout(path)
+    usecols = pick_usecols(names)
+    keep = [name for name in names if usecols is None or name in usecols]
+    if pa_csv is not None:
+        try:
+            table = pa_csv.read_csv(
+                path,
+                read_options=pa_csv.ReadOptions(column_names=[str(n) for n in names], skip_rows=1, encoding=encoding),
+                parse_options=pa_csv.ParseOptions(delimiter=delimiter),
+                convert_options=pa_csv.ConvertOptions(
+                    include_columns=[str(n) for n in keep],
+                    column_types={str(n): pa.string() for n in keep},
+                    null_values=sorted(NA_STRINGS),
+                    strings_can_be_null=True,
+                    quoted_strings_can_be_null=True,
+                ),
+            )
+        except pa.ArrowInvalid:
+            pass
+        else:
+            rows_read = table.num_rows
+            if 'Type' in keep:
+                table = table.filter(pc.equal(table['Type'], MNTR))
+            df = table.to_pandas()
+            df.columns = keep
+            return _inventory_frame(df, rows_read)
+    df = pd.read_csv(path, sep=delimiter, encoding=encoding, header=None, skiprows=1, names=names, usecols=keep,
+                     dtype=str, keep_default_na=False, na_values=NA_STRINGS)[keep]
+    return _inventory_frame(df, len(df))
+
+
+def _parquet_columns(path):
+    names = pq.read_schema(path).names
+    usecols = pick_usecols(names)
+    return [name for name in names if usecols is None or name in usecols]
+
+
+def read_parquet_projected(path):
+    """Read a Parquet export: only the needed columns are decoded and MNTR rows are filtered in the scan."""
+    if pq is None:
+        raise ImportError('Reading Parquet files needs pyarrow (pip install pyarrow)')
+    keep = _parquet_columns(path)
+    rows_read = pq.ParquetFile(path).metadata.num_rows
+    filters = [('Type', '=', MNTR)] if 'Type' in keep else None
+    df = pq.read_table(path, columns=keep, filters=filters).to_pandas()
+    return _inventory_frame(df, rows_read)
+
+
+def read_inventory(path, cancel=None, sheet=None):
+    """Read one inventory file: needed columns only, MNTR rows only.
+
+    The format is detected from the content (``detect_format``): .xlsx is
+    streamed, CSV and Parquet exports go through pyarrow, and other
+    workbooks through ``pandas.read_excel``.
+    ``df.attrs['rows_read']`` is the number of data rows before the MNTR filter.
+    A ``CancelToken`` is checked while .xlsx rows are streamed. ``sheet``
+    names the sheet to read (default: the first one; CSV and Parquet files
+    have a single sheet).
+    """
+    fmt = detect_format(path)
+    if fmt == 'xlsx':
+        return read_xlsx_streaming(path, cancel, sheet)
+    if fmt == 'csv':
+        return read_csv_fast(path)
+    if fmt == 'parquet':
+        return read_parquet_projected(path)
+    return read_with_pandas(path, sheet)
+
+
+def sheet_names(path):
+    """Names of the sheets of a workbook, in workbook order.
+
+    For .xlsx/.xlsm only the workbook part of the zip is parsed, so this is
+    cheap even for very large files. A CSV or Parquet file is one sheet named
+    after the file.
+    """
+    fmt = detect_format(path)
+    if fmt in ('csv', 'parquet'):
+        return [os.path.splitext(os.path.basename(path))[0]]
+    if fmt == 'excel':
+        with pd.ExcelFile(path) as book:
+            return list(book.sheet_names)
+    with zipfile.ZipFile(path) as archive:
+        root = ElementTree.fromstring(archive.read('xl/workbook.xml'))
+    # <sheets><sheet name=...>, whatever the (transitional or strict) namespace
+    return [el.get('name') for el in root.iter() if el.tag.rsplit('}', 1)[-1] == 'sheet']
+
+
+def iter_inventory(path, chunk_rows, cancel=None, sheet=None):
+    """``read_inventory`` in frames of at most ``chunk_rows`` rows, for inputs too large to hold at once.
+
+    .xlsx, CSV and Parquet are streamed; other workbooks are read whole and then sliced.
+    ``sheet`` is that of ``read_inventory``.
+    """
+    fmt = detect_format(path)
+    if fmt == 'xlsx':
+        yield from iter_xlsx_chunks(path, chunk_rows, cancel, sheet)
+        return
+    if fmt == 'csv':
+        encoding, delimiter, names = _csv_layout(path)
+        usecols = pick_usecols(names)
+        keep = [name for name in names if usecols is None or name in usecols]
+        with pd.read_csv(path, sep=delimiter, encoding=encoding, header=None, skiprows=1, names=names, usecols=keep,
+                         dtype=str, keep_default_na=False, na_values=NA_STRINGS, chunksize=chunk_rows) as reader:
+            for chunk in reader:
+                yield _inventory_frame(chunk[keep], len(chunk))
+        return
+    if fmt == 'parquet':
+        if pq is None:
+            raise ImportError('Reading Parquet files needs pyarrow (pip install pyarrow)')
+        keep = _parquet_columns(path)
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows, columns=keep):
+            yield _inventory_frame(batch.to_pandas(), batch.num_rows)
+        return
+    df = read_with_pandas(path, sheet)
+    rows_read = df.attrs['rows_read']
+    for start in range(0, max(len(df), 1), chunk_rows):
+        chunk = df.iloc[start:start + chunk_rows].reset_index(drop=True)
+        # the rows dropped by the MNTR filter are counted with the first chunk
+        chunk.attrs['rows_read'] = len(chunk) + (rows_read - len(df) if start == 0 else 0)
+        yield chunk
@@ -0,0 +1,513 @@
+"""Local HTTP comparison service: one shared process instead of a GUI per desktop.
+
+``ComparisonService`` runs every comparison on a process pool, and each
+worker process keeps the baselines (master exports) it used most recently
+parsed in memory - an LRU of ``PreparedInput``s keyed by the SHA-256 of the
+uploaded file. A job only sends that key and the file's path to the worker,
+never the parsed baseline itself, so a big master is not pickled across
+processes for every job. A worker that has not seen a baseline yet loads it
+from the on-disk ``InputCache`` (written by the first worker that parsed
+it) instead of parsing the workbook again. Progress that the GUI gets
+through ``progress_callback`` comes back from the workers over one
+``multiprocessing`` queue and is streamed to clients as Server-Sent Events.
+``serve`` puts the stdlib ``ThreadingHTTPServer`` in front of it; it only
+binds to loopback addresses.
+
+Endpoints (uploads are the raw request body, no multipart):
+
+- ``POST /baselines?name=master&filename=master.xlsx`` stores a baseline,
+  returns ``{"id": <sha256>, "name": ...}``; the name then refers to the
+  latest baseline uploaded under it
+- ``GET /baselines`` lists them, with ``"parsed"`` for those in a worker's memory
+- ``POST /jobs?baseline=<id or name>&filename=export.xlsx&format=xlsx``
+  queues the uploaded export against the baseline, returns the job
+- ``GET /jobs/<id>`` job status, stats and warnings
+- ``GET /jobs/<id>/events`` ``text/event-stream`` of ``progress`` events,
+  then one ``done`` or ``failed`` event
+- ``GET /jobs/<id>/report`` the report file once the job is done
+"""
+
+import ipaddress
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import socket
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from .cache import InputCache, file_digest
+from .engine import compare_prepared
+from .errors import ComparisonError
+from .instrument import RunReport
+from .prepare import prepare_inputs
+from .writer import OUTPUT_FORMATS
+
+DEFAULT_PORT = 8765
+DEFAULT_MAX_BASELINES = 4
+MAX_UPLOAD_BYTES = 1024 * 1024 * 1024
+# finished jobs kept for status / report downloads
+MAX_FINISHED_JOBS = 200
+# seconds between SSE keep-alive comments
+KEEPALIVE_SECONDS = 15
+
+_UPLOAD_CHUNK = 1024 * 1024
+
+
+class ServiceError(Exception):
+    """A request the service rejects; ``status`` is the HTTP status code."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+# per worker process, set up by _init_worker: the progress queue and the
+# parsed baselines (id -> PreparedInput, least recently used first)
+_worker_events = None
+_worker_baselines = OrderedDict()
+_worker_max_baselines = DEFAULT_MAX_BASELINES
+
+
+def _init_worker(events, max_baselines):
+    global _worker_events, _worker_max_baselines
+    _worker_events = events
+    _worker_max_baselines = max_baselines
+
+
+def _prepare(path, label, cache_dir):
+    prepared, = prepare_inputs([path], labels=[label], parallel=False,
+                               cache=InputCache(cache_dir) if cache_dir else None, report=RunReport())
+    return prepared
+
+
+def _worker_baseline(baseline_id, path, cache_dir):
+    """The baseline from this worker's LRU, prepared (or loaded from the cache) on a miss."""
+    prepared = _worker_baselines.get(baseline_id)
+    if prepared is None:
+        prepared = _prepare(path, 'Baseline', cache_dir)
+        _worker_baselines[baseline_id] = prepared
+        while len(_worker_baselines) > _worker_max_baselines:
+            _worker_baselines.popitem(last=False)
+    _worker_baselines.move_to_end(baseline_id)
+    return prepared
+
+
+def _run_job(job_id, baseline_id, baseline_path, export_path, output_folder, output_format, cache_dir,
+             baseline_cache_dir):
+    def progress(percent, message):
+        _worker_events.put((job_id, percent, message))
+
+    if baseline_id not in _worker_baselines:
+        progress(2, 'Loading baseline...')
+    baseline = _worker_baseline(baseline_id, baseline_path, baseline_cache_dir)
+    progress(5, 'Reading and normalizing the export...')
+    prepared = _prepare(export_path, 'Export', cache_dir)
+    result = compare_prepared(baseline, prepared, output_folder, progress_callback=progress,
+                              output_format=output_format)
+    return {'stats': result.stats, 'warnings': result.warnings, 'output_path': result.output_path,
+            'worker': os.getpid(), 'resident': list(_worker_baselines)}
+
+
+class Job:
+    """One queued comparison; ``events`` is the full progress history, guarded by ``changed``."""
+
+    def __init__(self, baseline, filename, output_format):
+        self.id = uuid.uuid4().hex
+        self.baseline = baseline
+        self.filename = filename
+        self.output_format = output_format
+        self.status = 'queued'
+        self.events = []
+        self.result = None
+        self.error = None
+        self.changed = threading.Condition()
+
+    @property
+    def finished(self):
+        return self.status in ('done', 'failed')
+
+    def add_event(self, kind, data, status=None):
+        with self.changed:
+            if self.finished:
+                # progress from the worker can arrive after the result
+                return
+            if status:
+                self.status = status
+            self.events.append((kind, data))
+            self.changed.notify_all()
+
+    def wait_events(self, start, timeout):
+        """Events from index ``start`` on, waiting up to ``timeout`` seconds for one; ``(events, finished)``."""
+        with self.changed:
+            self.changed.wait_for(lambda: len(self.events) > start or self.finished, timeout)
+            return self.events[start:], self.finished
+
+    def describe(self):
+        info = {'id': self.id, 'status': self.status, 'baseline': self.baseline, 'filename': self.filename,
+                'format': self.output_format}
+        if self.result is not None:
+            info.update(stats=self.result['stats'], warnings=self.result['warnings'])
+        if self.error is not None:
+            info['error'] = self.error
+        return info
+
+
+class ComparisonService:
+    """Baseline store, job table and worker pool behind ``serve``.
+
+    Uploads, baselines and reports live under ``work_dir`` (a temporary
+    folder removed by ``close`` when not given). Each worker keeps at most
+    ``max_baselines`` parsed baselines in memory. ``cache_dir`` enables the
+    on-disk ``InputCache`` for uploaded exports; parsed baselines are always
+    cached, in ``cache_dir`` or else under ``work_dir``.
+    """
+
+    def __init__(self, work_dir=None, workers=None, max_baselines=DEFAULT_MAX_BASELINES, cache_dir=None):
+        if max_baselines < 1:
+            # a worker must hold at least the baseline of the job it runs
+            raise ValueError('max_baselines must be at least 1')
+        self._own_work_dir = work_dir is None
+        self.work_dir = work_dir or tempfile.mkdtemp(prefix='desk_comparator_service_')
+        for sub in ('baselines', 'uploads', 'reports'):
+            os.makedirs(os.path.join(self.work_dir, sub), exist_ok=True)
+        self.cache_dir = cache_dir
+        self.baseline_cache_dir = cache_dir or os.path.join(self.work_dir, 'cache')
+        self.max_baselines = max_baselines
+        self.workers = workers or max(1, min(4, (os.cpu_count() or 1)))
+        self._lock = threading.Lock()
+        self._baselines = {}          # id -> {'id', 'name', 'filename', 'path'}
+        self._names = {}              # name -> id
+        self._resident = {}           # worker pid -> baseline ids it held after its last job
+        self.jobs = OrderedDict()
+        # 'spawn' like prepare_inputs: safe next to threads, and the only option on Windows
+        self._ctx = multiprocessing.get_context('spawn')
+        self._events = self._ctx.Queue()
+        self._pool = self._new_pool()
+        self._dispatcher = threading.Thread(target=self._dispatch_events, name='desk-comparator-events', daemon=True)
+        self._dispatcher.start()
+
+    def _new_pool(self):
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=self._ctx,
+                                   initializer=_init_worker, initargs=(self._events, self.max_baselines))
+
+    def _submit(self, fn, *args):
+        """Run ``fn`` on the pool and wait; a broken pool (e.g. a worker killed for memory) is replaced once."""
+        for attempt in (1, 2):
+            pool = self._pool
+            try:
+                return pool.submit(fn, *args).result()
+            except BrokenProcessPool:
+                with self._lock:
+                    if self._pool is pool:
+                        self._pool = self._new_pool()
+                        self._resident.clear()
+                if attempt == 2:
+                    raise
+
+    def _dispatch_events(self):
+        while True:
+            item = self._events.get()
+            if item is None:
+                return
+            job_id, percent, message = item
+            with self._lock:
+                job = self.jobs.get(job_id)
+            if job is not None:
+                job.add_event('progress', {'percent': percent, 'message': message}, status='running')
+
+    def store_upload(self, stream, length, folder, filename):
+        """Copy ``length`` bytes of ``stream`` into ``folder``; returns the new file's path."""
+        if length > MAX_UPLOAD_BYTES:
+            raise ServiceError(413, f'Upload larger than {MAX_UPLOAD_BYTES} bytes')
+        suffix = os.path.splitext(filename)[1].lower() if filename else ''
+        if not re.fullmatch(r'\.[a-z0-9]{1,8}|', suffix):
+            suffix = ''
+        path = os.path.join(self.work_dir, folder, uuid.uuid4().hex + suffix)
+        remaining = length
+        with open(path, 'wb') as f:
+            while remaining:
+                chunk = stream.read(min(_UPLOAD_CHUNK, remaining))
+                if not chunk:
+                    f.close()
+                    os.remove(path)
+                    raise ServiceError(400, 'Upload shorter than its Content-Length')
+                f.write(chunk)
+                remaining -= len(chunk)
+        return path
+
+    def add_baseline(self, upload_path, name=None, filename=None):
+        """Register an uploaded baseline under its content digest (and ``name``)."""
+        digest = file_digest(upload_path)
+        path = os.path.join(self.work_dir, 'baselines', digest + os.path.splitext(upload_path)[1])
+        with self._lock:
+            if digest in self._baselines:
+                os.remove(upload_path)
+            else:
+                os.replace(upload_path, path)
+                self._baselines[digest] = {'id': digest, 'name': name, 'filename': filename, 'path': path}
+            if name:
+                self._names[name] = digest
+                self._baselines[digest]['name'] = name
+            return dict(self._baselines[digest])
+
+    def list_baselines(self):
+        with self._lock:
+            resident = set().union(*self._resident.values())
+            return [{'id': b['id'], 'name': b['name'], 'filename': b['filename'], 'parsed': b['id'] in resident}
+                    for b in self._baselines.values()]
+
+    def baseline_id(self, ref):
+        """Baseline id for an id or a name; ServiceError 404 when unknown."""
+        with self._lock:
+            ref = self._names.get(ref, ref)
+            if ref not in self._baselines:
+                raise ServiceError(404, f'Unknown baseline: {ref}')
+            return ref
+
+    def submit(self, baseline_ref, upload_path, filename=None, output_format='xlsx'):
+        """Queue a comparison of an uploaded export against a baseline; returns the ``Job``."""
+        if output_format not in OUTPUT_FORMATS:
+            raise ServiceError(400, f"Unknown format {output_format!r}; expected one of {', '.join(OUTPUT_FORMATS)}")
+        baseline_id = self.baseline_id(baseline_ref)
+        job = Job(baseline_id, filename, output_format)
+        with self._lock:
+            self.jobs[job.id] = job
+            finished = [j.id for j in self.jobs.values() if j.finished]
+            for old in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+                del self.jobs[old]
+        threading.Thread(target=self._run, args=(job, upload_path), name=f'desk-comparator-job-{job.id[:8]}',
+                         daemon=True).start()
+        return job
+
+    def _run(self, job, upload_path):
+        output_folder = os.path.join(self.work_dir, 'reports', job.id)
+        try:
+            with self._lock:
+                baseline_path = self._baselines[job.baseline]['path']
+            job.add_event('progress', {'percent': 0, 'message': 'Waiting for a worker...'}, status='running')
+            result = self._submit(_run_job, job.id, job.baseline, baseline_path, upload_path, output_folder,
+                                  job.output_format, self.cache_dir, self.baseline_cache_dir)
+            with self._lock:
+                self._resident[result.pop('worker')] = result.pop('resident')
+        except Exception as e:
+            # ComparisonErrors carry a user-facing message; anything else is reported by type
+            job.error = str(e) if isinstance(e, ComparisonError) else f'{type(e).__name__}: {e}'
+            job.error = job.error.replace(upload_path, job.filename or 'the upload')
+            job.add_event('failed', {'error': job.error}, status='failed')
+        else:
+            job.result = result
+            job.add_event('done', {'stats': result['stats'], 'warnings': result['warnings']}, status='done')
+        finally:
+            try:
+                os.remove(upload_path)
+            except OSError:
+                pass
+
+    def report_path(self, job_id):
+        job = self.job(job_id)
+        if job.status != 'done':
+            raise ServiceError(409, f'Job {job_id} is {job.status}')
+        return job.result['output_path']
+
+    def job(self, job_id):
+        with self._lock:
+            job = self.jobs.get(job_id)
+        if job is None:
+            raise ServiceError(404, f'Unknown job: {job_id}')
+        return job
+
+    def list_jobs(self):
+        with self._lock:
+            return list(self.jobs.values())
+
+    def close(self):
+        self._pool.shutdown(cancel_futures=True)
+        self._events.put(None)
+        self._dispatcher.join()
+        if self._own_work_dir:
+            shutil.rmtree(self.work_dir, ignore_errors=True)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server_version = 'DeskComparator'
+
+    @property
+    def service(self):
+        return self.server.service
+
+    def _parse(self):
+        parts = urlsplit(self.path)
+        query = {k: v[-1] for k, v in parse_qs(parts.query).items()}
+        return [p for p in parts.path.split('/') if p], query
+
+    def _send_json(self, data, status=200):
+        body = json.dumps(data, default=str).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _check_request(self):
+        # DNS rebinding: a page on a foreign name that resolves to 127.0.0.1 sends that name as Host
+        if self.headers.get('Host', '').lower() not in self.server.allowed_hosts:
+            raise ServiceError(403, 'Unexpected Host header; use http://localhost:<port>/')
+        origin = self.headers.get('Origin')
+        if self.command == 'POST' and origin is not None and \
+                origin.lower().removeprefix('http://') not in self.server.allowed_hosts:
+            raise ServiceError(403, f'Cross-origin requests are not accepted (Origin: {origin})')
+
+    def _handle(self, route):
+        try:
+            self._check_request()
+            route()
+        except ServiceError as e:
+            self._send_json({'error': str(e)}, e.status)
+        except (BrokenPipeError, ConnectionResetError):
+            # the client went away, e.g. an SSE stream closed early
+            pass
+        except Exception as e:
+            self.log_error('%s failed: %r', self.path, e)
+            self._send_json({'error': f'{type(e).__name__}: {e}'}, 500)
+
+    def _upload(self, folder, query):
+        length = self.headers.get('Content-Length')
+        if not length or not length.isdigit() or int(length) == 0:
+            raise ServiceError(411, 'Send the file as the request body with a Content-Length')
+        return self.service.store_upload(self.rfile, int(length), folder, query.get('filename'))
+
+    def do_POST(self):
+        self._handle(self._post)
+
+    def _post(self):
+        path, query = self._parse()
+        if path == ['baselines']:
+            upload = self._upload('baselines', query)
+            baseline = self.service.add_baseline(upload, query.get('name'), query.get('filename'))
+            self._send_json({k: baseline[k] for k in ('id', 'name', 'filename')}, 201)
+        elif path == ['jobs']:
+            if 'baseline' not in query:
+                raise ServiceError(400, 'Missing baseline=<id or name>')
+            # resolve the baseline before reading a possibly large body
+            self.service.baseline_id(query['baseline'])
+            upload = self._upload('uploads', query)
+            try:
+                job = self.service.submit(query['baseline'], upload, query.get('filename'),
+                                          query.get('format', 'xlsx'))
+            except ServiceError:
+                os.remove(upload)
+                raise
+            self._send_json(job.describe(), 202)
+        else:
+            raise ServiceError(404, f'No such endpoint: POST {self.path}')
+
+    def do_GET(self):
+        self._handle(self._get)
+
+    def _get(self):
+        path, _ = self._parse()
+        if path == ['baselines']:
+            self._send_json(self.service.list_baselines())
+        elif path == ['jobs']:
+            self._send_json([job.describe() for job in self.service.list_jobs()])
+        elif len(path) == 2 and path[0] == 'jobs':
+            self._send_json(self.service.job(path[1]).describe())
+        elif len(path) == 3 and path[0] == 'jobs' and path[2] == 'events':
+            self._stream_events(self.service.job(path[1]))
+        elif len(path) == 3 and path[0] == 'jobs' and path[2] == 'report':
+            self._send_report(self.service.report_path(path[1]))
+        else:
+            raise ServiceError(404, f'No such endpoint: GET {self.path}')
+
+    def _stream_events(self, job):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.end_headers()
+        sent = 0
+        while True:
+            events, finished = job.wait_events(sent, KEEPALIVE_SECONDS)
+            for kind, data in events:
+                self.wfile.write(f'event: {kind}\ndata: {json.dumps(data, default=str)}\n\n'.encode('utf-8'))
+            sent += len(events)
+            if not events:
+                self.wfile.write(b': keep-alive\n\n')
+            self.wfile.flush()
+            if finished and sent == len(job.events):
+                return
+
+    def _send_report(self, path):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Disposition', f'attachment; filename="{os.path.basename(path)}"')
+        self.send_header('Content-Length', str(os.path.getsize(path)))
+        self.end_headers()
+        with open(path, 'rb') as f:
+            shutil.copyfileobj(f, self.wfile)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+def _check_loopback(host):
+    try:
+        address = ipaddress.ip_address(socket.gethostbyname(host))
+    except (OSError, ValueError):
+        raise ValueError(f'Cannot resolve {host!r}')
+    if not address.is_loopback:
+        raise ValueError(f'{host!r} is not a loopback address; the service only runs on localhost')
+
+
+def _allowed_hosts(host, port):
+    # the Host header values of requests made to this server by name or loopback address
+    names = {'127.0.0.1', 'localhost', '[::1]', host.lower() if ':' not in host else f'[{host.lower()}]'}
+    allowed = {f'{name}:{port}' for name in names}
+    if port == 80:
+        allowed |= names
+    return frozenset(allowed)
+
+
+def make_server(service, host='127.0.0.1', port=DEFAULT_PORT, verbose=False):
+    """A ``ThreadingHTTPServer`` serving ``service`` on a loopback ``host``; raises ValueError for other hosts.
+
+    Requests are answered only when their Host header names a loopback
+    address or localhost with the bound port, and POSTs only from no or a
+    local Origin, so a web page cannot reach the service by DNS rebinding.
+    """
+    _check_loopback(host)
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    server.service = service
+    server.verbose = verbose
+    server.allowed_hosts = _allowed_hosts(host, server.server_address[1])
+    return server
+
+
+def serve(host='127.0.0.1', port=DEFAULT_PORT, verbose=False, log=None, **service_options):
+    """Run the service until interrupted (Ctrl+C); ``service_options`` go to ``ComparisonService``."""
+    _check_loopback(host)
+    service = ComparisonService(**service_options)
+    try:
+        server = make_server(service, host, port, verbose)
+    except BaseException:
+        service.close()
+        raise
+    if log:
+        address, bound_port = server.server_address[:2]
+        log(f'Serving on http://{address}:{bound_port}/ ({service.workers} workers, work folder {service.work_dir})')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
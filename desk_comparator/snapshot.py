@@ -0,0 +1,349 @@
+"""Incremental mode: recompute and report only what changed since the previous run.
+
+The same two exports are usually compared every day and most of them is the
+same as the day before. A ``SnapshotStore`` keeps, per named comparison, the
+normalized (Desk_ID, Serial_Number) pairs of both inputs of the last run,
+its long-form mismatch set and the inputs' content digests.
+
+Everything the report says about a serial depends only on that serial's
+pairs: whether a (desk, serial) pair is in the other file, where a blank
+desk's serial is inferred to be (its unique desk in the other file, or the
+one room of all its desks) and whether it cancels out at a Room/Desk_Number.
+So ``compare_incremental`` diffs each input's new pairs against the stored
+ones, reruns the comparison on the pairs of the serials that appear in a
+changed pair only, and keeps the stored mismatch rows of every other serial.
+When neither input changed byte for byte, nothing is read at all and the
+snapshot's result and warnings are returned. New and resolved mismatches
+are reported separately from the unchanged ones; only desks with new or
+resolved serials go into the written report.
+"""
+
+import dataclasses
+import json
+import os
+import re
+import uuid
+from dataclasses import dataclass, field
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from .cache import _PAIRS_EXT, InputCache, file_digest, user_data_dir
+from .compare import aggregate_by_desk
+from .engine import RESULT_COLUMNS, _compare_prepared, _save_timestamped, _validate_paths
+from .errors import ComparisonCancelled, ComparisonError
+from .instrument import RunReport
+from .prepare import NORMALIZATION_VERSION, PAIR_COLUMNS, prepare_inputs
+from .progress import CancelToken
+from .writer import OUTPUT_FORMATS
+
+SNAPSHOT_COLUMNS = ['Room', 'Desk_Number', 'Serial_Number', 'Side']
+CHANGE_COLUMNS = ['Status'] + RESULT_COLUMNS
+# tables of a saved run: the mismatch set and each input's pairs
+_TABLES = ('rows', 'file1', 'file2')
+
+
+def default_snapshot_dir():
+    """Per-user snapshot folder; DESK_COMPARATOR_SNAPSHOTS overrides it."""
+    return os.environ.get('DESK_COMPARATOR_SNAPSHOTS') or user_data_dir('snapshots')
+
+
+def check_snapshot_name(name):
+    """Raise ValueError unless ``name`` can name a snapshot (it becomes a folder name)."""
+    if not re.fullmatch(r'[\w.-]+', name) or name in ('.', '..'):
+        raise ValueError(f'Invalid snapshot name {name!r}: use letters, digits, ".", "-" and "_"')
+
+
+class SnapshotStore:
+    """Directory with one folder per snapshot name.
+
+    A snapshot folder holds ``snapshot.json`` (metadata) and the tables of
+    one saved run: ``<run>-rows<ext>`` (the mismatch set) and
+    ``<run>-file1<ext>`` / ``<run>-file2<ext>`` (the inputs' pairs). The
+    metadata names the run its tables belong to and is replaced last, so a
+    crash while saving leaves the previous run's tables in use.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _folder(self, name):
+        check_snapshot_name(name)
+        return os.path.join(self.directory, name)
+
+    @staticmethod
+    def _table_paths(folder, run):
+        return [os.path.join(folder, f'{run}-{part}{_PAIRS_EXT}') for part in _TABLES]
+
+    @staticmethod
+    def _read(path):
+        return pd.read_parquet(path) if _PAIRS_EXT == '.parquet' else pd.read_pickle(path)
+
+    @staticmethod
+    def _write(frame, path):
+        if _PAIRS_EXT == '.parquet':
+            frame.to_parquet(path, index=False)
+        else:
+            frame.to_pickle(path)
+
+    def load(self, name):
+        """Return ``(meta, rows, pairs)`` of the snapshot called ``name``, or None if there is none.
+
+        ``pairs`` are the two inputs' pair tables.
+        """
+        folder = self._folder(name)
+        try:
+            with open(os.path.join(folder, 'snapshot.json'), encoding='utf-8') as f:
+                meta = json.load(f)
+            rows, *pairs = [self._read(path) for path in self._table_paths(folder, meta['run'])]
+        except Exception:
+            # no snapshot yet, or an unreadable one: start over as if it did not exist
+            return None
+        if meta.get('normalization_version') != NORMALIZATION_VERSION:
+            # made by other normalization rules: every serial would look changed
+            return None
+        return meta, rows, pairs
+
+    def save(self, name, rows, meta, pairs):
+        """Store the mismatch ``rows`` and both inputs' ``pairs`` (PAIR_COLUMNS tables) under ``name``."""
+        folder = self._folder(name)
+        os.makedirs(folder, exist_ok=True)
+        run = uuid.uuid4().hex[:12]
+        meta = dict(meta, normalization_version=NORMALIZATION_VERSION, run=run)
+        frames = [rows[SNAPSHOT_COLUMNS].reset_index(drop=True)] + [p[PAIR_COLUMNS].reset_index(drop=True)
+                                                                    for p in pairs]
+        for frame, path in zip(frames, self._table_paths(folder, run)):
+            self._write(frame, path)
+        meta_path = os.path.join(folder, 'snapshot.json')
+        with open(meta_path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(meta_path + '.tmp', meta_path)
+        # the previous run's tables are no longer referenced
+        for entry in os.listdir(folder):
+            if entry != 'snapshot.json' and not entry.startswith(f'{run}-'):
+                try:
+                    os.remove(os.path.join(folder, entry))
+                except OSError:
+                    pass
+
+
+@dataclass
+class IncrementalResult:
+    """Outcome of an incremental run.
+
+    ``changes`` has the CHANGE_COLUMNS layout with Status 'New' or 'Resolved';
+    ``unchanged`` has the RESULT_COLUMNS layout. ``previous_run`` is the time
+    of the snapshot compared against (None on the first run, when every
+    mismatch is new), ``output_path`` is None when nothing was written and
+    ``report`` holds the stage timings (None when the comparison was skipped).
+    ``stats['serials_recomputed']`` counts the serials compared again;
+    ``stats['only_in_file1']`` / ``['only_in_file2']`` only count those.
+    """
+
+    changes: pd.DataFrame
+    unchanged: pd.DataFrame
+    stats: dict = field(default_factory=dict)
+    output_path: str = None
+    warnings: list = field(default_factory=list)
+    previous_run: str = None
+    report: RunReport = None
+
+
+def diff_mismatches(previous, current):
+    """Split long-form mismatch rows into ``(new, resolved, unchanged)``, each sorted."""
+    merged = pd.merge(previous[SNAPSHOT_COLUMNS].drop_duplicates(), current[SNAPSHOT_COLUMNS].drop_duplicates(),
+                      on=SNAPSHOT_COLUMNS, how='outer', indicator=True, sort=False)
+    merged = merged.sort_values(['Room', 'Desk_Number', 'Serial_Number'])
+    status = merged.pop('_merge')
+    return merged[status == 'right_only'], merged[status == 'left_only'], merged[status == 'both']
+
+
+def _pair_keys(pairs, desks, serials):
+    """One int64 per pair, from the positions of its Desk_ID / serial in ``desks`` / ``serials``; -1 if either is missing."""
+    codes = []
+    for col, dictionary in (('Desk_ID', desks), ('Serial_Number', serials)):
+        column = pairs[col].astype('category')
+        if column.cat.categories is dictionary:
+            codes.append(column.cat.codes.to_numpy().astype(np.int64))
+            continue
+        # only the distinct values are hashed; rows are remapped by array indexing
+        codes.append(dictionary.get_indexer(column.cat.categories).astype(np.int64)[column.cat.codes.to_numpy()])
+    desk, serial = codes
+    return np.where((desk >= 0) & (serial >= 0), desk * len(serials) + serial, -1)
+
+
+def changed_serials(previous, current):
+    """Serial_Numbers (an Index) of the pairs that are in only one of two pair tables.
+
+    Both tables are keyed against ``current``'s own categories (no shared
+    sorted dictionary is needed just to tell equal pairs apart).
+    """
+    current = current[PAIR_COLUMNS].astype('category')
+    desks, serials = current['Desk_ID'].cat.categories, current['Serial_Number'].cat.categories
+    old_keys = _pair_keys(previous, desks, serials)
+    new_keys = _pair_keys(current, desks, serials)
+    gone = previous['Serial_Number'][~pd.Index(old_keys).isin(new_keys)]
+    added = current['Serial_Number'][~pd.Index(new_keys).isin(old_keys)]
+    return pd.Index(pd.concat([gone.astype(object), added.astype(object)]).unique(), dtype=object)
+
+
+def _only_serials(prepared, serials):
+    """``prepared`` with only the pairs of ``serials`` left."""
+    pairs = prepared.pairs[PAIR_COLUMNS]
+    pairs = pairs[pairs['Serial_Number'].isin(serials)]
+    # unused categories would put every desk of the file through the kernels again
+    pairs = pairs.apply(lambda column: column.cat.remove_unused_categories()).reset_index(drop=True)
+    return dataclasses.replace(prepared, pairs=pairs)
+
+
+def _sorted_rows(*parts):
+    rows = pd.concat(parts, ignore_index=True)[SNAPSHOT_COLUMNS]
+    # the order mismatch_rows returns (codes sort like the text)
+    return rows.sort_values(['Room', 'Desk_Number', 'Serial_Number', 'Side'], ignore_index=True)
+
+
+def _changes_frame(new, resolved):
+    parts = []
+    for status, rows in (('New', new), ('Resolved', resolved)):
+        if not rows.empty:
+            part = aggregate_by_desk(rows)
+            part.insert(0, 'Status', status)
+            parts.append(part)
+    if not parts:
+        return pd.DataFrame(columns=CHANGE_COLUMNS)
+    return pd.concat(parts, ignore_index=True)[CHANGE_COLUMNS]
+
+
+def compare_incremental(file1, file2, output_folder, name='default', snapshot_dir=None, progress_callback=None,
+                        parallel=None, cache_dir=None, output_format='xlsx', report=None, cancel=None):
+    """Compare two files and report the changes since the last run called ``name``.
+
+    Arguments are those of ``compare_excels``; the report written to
+    ``output_folder`` (``desk_changes_<timestamp>.<format>``) lists new and
+    resolved mismatches per desk and is skipped when there are none. Only
+    the serials of pairs that changed in either input since the snapshot
+    are compared again (all of them on the first run). The snapshot is
+    replaced by this run's pairs and mismatches afterwards.
+
+    Returns an ``IncrementalResult``; raises a ``ComparisonError`` subclass on failure.
+    """
+    cancel = cancel if cancel is not None else CancelToken()
+
+    def cb(percent, msg):
+        cancel.check()
+        if progress_callback:
+            progress_callback(percent, msg)
+
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format {output_format!r}; expected one of {', '.join(OUTPUT_FORMATS)}")
+
+    store = SnapshotStore(snapshot_dir or default_snapshot_dir())
+    snapshot = store.load(name)
+    if snapshot:
+        previous_meta, previous_rows, previous_pairs = snapshot
+    else:
+        previous_meta, previous_pairs = {}, None
+        previous_rows = pd.DataFrame({c: pd.Series(dtype=object) for c in SNAPSHOT_COLUMNS}).astype({'Side': 'int64'})
+
+    _validate_paths([file1, file2], output_folder, cb)
+
+    digests = [file_digest(file1), file_digest(file2)]
+    previous_run = previous_meta.get('created')
+    if snapshot and previous_meta.get('digests') == digests:
+        # neither export changed: the previous result still holds as is
+        unchanged = aggregate_by_desk(previous_rows)[RESULT_COLUMNS]
+        cb(100, f'Inputs unchanged since {previous_run}; nothing to compare.')
+        return IncrementalResult(
+            changes=pd.DataFrame(columns=CHANGE_COLUMNS),
+            unchanged=unchanged,
+            stats={'new': 0, 'resolved': 0, 'unchanged': len(previous_rows), 'changed_desks': 0, 'skipped': True},
+            warnings=list(previous_meta.get('warnings', [])),
+            previous_run=previous_run,
+        )
+
+    report = report if report is not None else RunReport()
+    report.summary.update(files=[file1, file2], output_format=output_format, snapshot=name)
+    cb(5, 'Reading and normalizing both files...')
+    try:
+        cache = InputCache(cache_dir) if cache_dir else None
+        with report.stage('prepare') as st:
+            prepared1, prepared2 = prepare_inputs([file1, file2], labels=['File 1', 'File 2'], parallel=parallel,
+                                                  cache=cache, report=report, cancel=cancel)
+            st['rows_out'] = pairs_read = len(prepared1.pairs) + len(prepared2.pairs)
+    except ComparisonCancelled:
+        raise
+    except ComparisonError as e:
+        cb(0, str(e).splitlines()[0])
+        raise
+
+    if previous_pairs is None:
+        # first run: every serial is compared
+        touched_rows = np.ones(len(previous_rows), dtype=bool)
+        part1, part2 = prepared1, prepared2
+    else:
+        with report.stage('snapshot_pairs_diff', rows_in=sum(map(len, previous_pairs)) + pairs_read) as diff_st:
+            touched = changed_serials(previous_pairs[0], prepared1.pairs).union(
+                changed_serials(previous_pairs[1], prepared2.pairs))
+            part1, part2 = _only_serials(prepared1, touched), _only_serials(prepared2, touched)
+            touched_rows = previous_rows['Serial_Number'].isin(touched).to_numpy()
+            diff_st['rows_out'] = len(part1.pairs) + len(part2.pairs)
+        cb(35, f'{len(touched)} serials changed since {previous_run}; comparing only their '
+               f'{len(part1.pairs) + len(part2.pairs)} pairs')
+
+    result = _compare_prepared(part1, part2, None, output_format, report, cb)
+    cb(96, f'Diffing against snapshot {name!r}' + (f' from {previous_run}...' if previous_run else ' (first run)...'))
+    with report.stage('snapshot_diff', rows_in=len(previous_rows) + len(result.serial_mismatches)) as st:
+        new, resolved, both = diff_mismatches(previous_rows[touched_rows], result.serial_mismatches)
+        changes = _changes_frame(new, resolved)
+        unchanged = _sorted_rows(previous_rows[~touched_rows], both)
+        current = _sorted_rows(previous_rows[~touched_rows], result.serial_mismatches)
+        st['rows_out'] = len(changes)
+    stats = dict(result.stats)
+    stats.update({
+        'rows_file1': prepared1.rows,
+        'rows_file2': prepared2.rows,
+        'pairs_file1': len(prepared1.pairs),
+        'pairs_file2': len(prepared2.pairs),
+        'serials_recomputed': int(pd.concat([part1.pairs['Serial_Number'].astype(object),
+                                             part2.pairs['Serial_Number'].astype(object)]).nunique()),
+        'mismatch_rows': len(aggregate_by_desk(current)),
+        'new': len(new),
+        'resolved': len(resolved),
+        'unchanged': len(unchanged),
+        'changed_desks': len(changes[['Room', 'Desk_Number']].drop_duplicates()),
+        'skipped': False,
+    })
+    stats.pop('desks_compared', None)
+    report.summary['stats'] = stats
+    incremental = IncrementalResult(
+        changes=changes,
+        unchanged=aggregate_by_desk(unchanged)[RESULT_COLUMNS],
+        stats=stats,
+        warnings=list(result.warnings),
+        previous_run=previous_run,
+        report=report,
+    )
+
+    if output_folder is not None and not changes.empty:
+        cb(97, 'Saving changes...')
+        with report.stage('save', rows_in=len(changes)):
+            incremental.output_path = _save_timestamped(changes, output_folder, 'desk_changes', output_format, cb)
+
+    try:
+        store.save(name, current, {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'digests': digests,
+            'files': [os.path.abspath(file1), os.path.abspath(file2)],
+            # returned again when a later run is skipped
+            'warnings': result.warnings,
+        }, [prepared1.pairs, prepared2.pairs])
+    except OSError as e:
+        incremental.warnings.append(f'Could not update snapshot {name!r}:\n{e}')
+
+    if incremental.output_path:
+        cb(100, f'Done. Saved to: {incremental.output_path}')
+    else:
+        cb(100, 'Done. No changes since the last run.' if previous_run else 'Done.')
+    return incremental
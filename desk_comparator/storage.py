@@ -0,0 +1,22 @@
+"""Stdlib-only helpers shared by the on-disk stores (input cache, snapshots, serial history).
+
+Kept apart from ``cache`` so that modules which must not import pandas (the
+serial history behind the CLI ``history`` command) can use them.
+"""
+
+import hashlib
+import os
+
+
+def user_data_dir(name):
+    """``<per-user cache base>/desk_comparator/<name>``."""
+    base = os.environ.get('LOCALAPPDATA') or os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'desk_comparator', name)
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            h.update(chunk)
+    return h.hexdigest()
@@ -0,0 +1,203 @@
+"""Watch-folder mode: compare every new export dropped into a folder against a baseline.
+
+A ``FolderWatcher`` is one long-running process. pandas and the engine are
+imported once, the baseline file is read and normalized once and kept in
+memory (it is only prepared again when the file itself changes), and every
+new export that lands in the watched folder is queued and compared against
+it. The folder is polled with ``os.scandir`` (stdlib only, so it also
+works on network shares): a file is picked up once its size and
+modification time stayed the same for one poll, so a copy still in
+progress is not read half-written. Jobs go through a bounded queue to a
+single comparison thread; while the queue is full, new files simply wait
+in the folder and are offered again on the next poll.
+"""
+
+import os
+import queue
+import threading
+from dataclasses import dataclass
+
+from .cache import InputCache
+from .engine import compare_prepared
+from .errors import ComparisonCancelled, InputFileError
+from .instrument import RunReport
+from .prepare import prepare_inputs
+from .progress import CancelToken
+
+# inputs the reader understands (see reader.detect_format)
+WATCH_EXTENSIONS = ('.xlsx', '.xlsm', '.xls', '.csv', '.txt', '.parquet')
+# partial downloads / uploads and Office lock files
+_IGNORED_SUFFIXES = ('.tmp', '.part', '.crdownload', '.partial')
+
+DEFAULT_INTERVAL = 2.0
+DEFAULT_QUEUE_SIZE = 8
+
+
+@dataclass
+class WatchJob:
+    """A queued export, identified by its path and the (size, mtime) it was queued with."""
+
+    path: str
+    signature: tuple
+
+
+def _signature(entry):
+    st = entry.stat()
+    return st.st_size, st.st_mtime_ns
+
+
+def _is_candidate(name):
+    lower = name.lower()
+    return (not name.startswith(('.', '~$'))
+            and lower.endswith(WATCH_EXTENSIONS)
+            and not lower.endswith(_IGNORED_SUFFIXES))
+
+
+class FolderWatcher:
+    """Compare each new file of ``folder`` against ``baseline``, writing one report per file.
+
+    Reports are saved in ``output_folder`` (which must not be ``folder``
+    itself) as ``desk_mismatches_<export name>_<timestamp>.<format>``.
+    Files already in the folder at start are skipped unless
+    ``process_existing``. With a ``cache_dir``, prepared exports are cached
+    like in ``compare_excels``. ``log`` receives one line per event (queued,
+    done, failed, baseline reloaded). ``cancel`` (a ``CancelToken``) stops
+    ``run``; the comparison in progress is cancelled too.
+    """
+
+    def __init__(self, folder, baseline, output_folder, interval=DEFAULT_INTERVAL, queue_size=DEFAULT_QUEUE_SIZE,
+                 output_format='xlsx', cache_dir=None, process_existing=False, log=None, cancel=None):
+        if os.path.realpath(folder) == os.path.realpath(output_folder):
+            raise ValueError('The output folder must differ from the watched folder')
+        if queue_size < 1:
+            # queue.Queue treats 0 as unbounded
+            raise ValueError('queue_size must be at least 1')
+        self.folder = folder
+        self.baseline = baseline
+        self.output_folder = output_folder
+        self.interval = interval
+        self.output_format = output_format
+        self.cache = InputCache(cache_dir) if cache_dir else None
+        self.process_existing = process_existing
+        self.log = log or (lambda message: None)
+        self.cancel = cancel if cancel is not None else CancelToken()
+        self.stats = {'queued': 0, 'done': 0, 'failed': 0}
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._seen = {}      # path -> signature already queued (or skipped at start)
+        self._pending = {}   # path -> signature at the previous poll, waiting to settle
+        self._baseline_input = None
+        self._baseline_signature = None
+
+    def _prepare(self, path, label):
+        # in this process: the watcher is the warm process, a worker pool would import everything again
+        prepared, = prepare_inputs([path], labels=[label], parallel=False, cache=self.cache,
+                                   report=RunReport(), cancel=self.cancel)
+        return prepared
+
+    def baseline_input(self):
+        """The prepared baseline, read again only when the file changed since it was loaded."""
+        try:
+            st = os.stat(self.baseline)
+        except OSError as e:
+            raise InputFileError(f'Cannot access baseline:\n{self.baseline}\n{e}')
+        signature = (st.st_size, st.st_mtime_ns)
+        if signature != self._baseline_signature:
+            reloaded = self._baseline_input is not None
+            self._baseline_input = self._prepare(self.baseline, 'Baseline')
+            self._baseline_signature = signature
+            self.log(f"Baseline {'reloaded' if reloaded else 'loaded'}: {self.baseline} "
+                     f'({len(self._baseline_input.pairs)} pairs)')
+        return self._baseline_input
+
+    def scan(self):
+        """Poll the folder once and queue the files that settled; returns how many were queued."""
+        current = {}
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if entry.is_file() and _is_candidate(entry.name):
+                    try:
+                        current[entry.path] = _signature(entry)
+                    except OSError:
+                        # removed or locked between listing and stat
+                        continue
+        queued = 0
+        for path, signature in current.items():
+            if self._seen.get(path) == signature:
+                continue
+            if self._pending.get(path) != signature:
+                # new or still growing: look again on the next poll
+                self._pending[path] = signature
+                continue
+            try:
+                self._queue.put_nowait(WatchJob(path, signature))
+            except queue.Full:
+                break
+            del self._pending[path]
+            self._seen[path] = signature
+            self.stats['queued'] += 1
+            queued += 1
+            self.log(f'Queued: {path}')
+        # forget files that disappeared, so a re-uploaded export is compared again
+        for known in (self._seen, self._pending):
+            for path in [p for p in known if p not in current]:
+                del known[path]
+        return queued
+
+    def _skip_existing(self):
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if entry.is_file() and _is_candidate(entry.name):
+                    try:
+                        self._seen[entry.path] = _signature(entry)
+                    except OSError:
+                        continue
+
+    def _compare(self, job):
+        prepared = self._prepare(job.path, 'Export')
+        name = os.path.splitext(os.path.basename(job.path))[0]
+        return compare_prepared(self.baseline_input(), prepared, self.output_folder, output_format=self.output_format,
+                                cancel=self.cancel, report_prefix=f'desk_mismatches_{name}')
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            try:
+                result = self._compare(job)
+            except ComparisonCancelled:
+                return
+            except Exception as e:
+                # one bad export must not stop the watcher
+                self.stats['failed'] += 1
+                self.log(f"Failed: {job.path}: {' '.join(str(e).split()) or type(e).__name__}")
+            else:
+                self.stats['done'] += 1
+                self.log(f"Done: {job.path}: {result.stats['mismatch_rows']} mismatch rows -> {result.output_path}")
+            finally:
+                self._queue.task_done()
+
+    def run(self):
+        """Watch until ``cancel`` is set; the queued jobs not started by then are dropped."""
+        os.makedirs(self.output_folder, exist_ok=True)
+        self.baseline_input()
+        if not self.process_existing:
+            self._skip_existing()
+        worker = threading.Thread(target=self._work, name='desk-comparator-watch', daemon=True)
+        worker.start()
+        self.log(f'Watching {self.folder} (every {self.interval:g}s); reports go to {self.output_folder}')
+        try:
+            while not self.cancel.cancelled:
+                self.scan()
+                self.cancel.wait(self.interval)
+        finally:
+            self.cancel.cancel()
+            while True:
+                try:
+                    self._queue.get_nowait()
+                    self._queue.task_done()
+                except queue.Empty:
+                    break
+            self._queue.put(None)
+            worker.join()
+        return self.stats
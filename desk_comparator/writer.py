@@ -0,0 +1,98 @@
+"""Output of the mismatch report: formatted Excel, CSV or Parquet."""
+
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Font
+from openpyxl.utils import get_column_letter
+
+OUTPUT_FORMATS = ('xlsx', 'csv', 'parquet')
+
+# CSV/Parquet use the column names of the desk_serial_mismatches.csv export
+# that downstream scripts already read.
+EXPORT_COLUMNS = {'Only_in_File1': 'Serials_File1', 'Only_in_File2': 'Serials_File2'}
+
+
+def _report_frame(dataframe):
+    """The rows that go into any report: NA as '' and no 'Dom' rows."""
+    # Make a safe copy and convert pandas NA / NaN to empty strings
+    df = dataframe.copy()
+    try:
+        df = df.fillna('')
+    except Exception:
+        # fallback: replace common NA markers
+        df = df.replace({pd.NA: '', None: ''})
+
+    # FILTER OUT 'Dom' rows completely - they will NOT appear in the output
+    if 'Room' in df.columns:
+        dom_mask = df['Room'].astype(str).str.strip().str.lower() == 'dom'
+        df = df[~dom_mask]  # Keep only non-Dom rows
+    return df
+
+
+def save_formatted_excel(dataframe, output_path):
+    """Stream the report into a write-only workbook.
+
+    Rows are written as they are produced instead of being kept as cell
+    objects; every data cell shares one centered/wrapped style and column
+    widths come from vectorized string lengths, so there is no second pass
+    over the cells.
+    """
+    df = _report_frame(dataframe)
+    headers = [str(c) for c in df.columns]
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Desk Mismatches")
+
+    # Auto-adjust column widths (must be set before the first row is written)
+    for col_idx, col in enumerate(df.columns, start=1):
+        lengths = df[col].astype(str).str.len()
+        length = max(len(headers[col_idx - 1]), int(lengths.max()) if len(lengths) else 0)
+        ws.column_dimensions[get_column_letter(col_idx)].width = length + 2
+
+    # Add headers with bold and centered formatting
+    header_cells = []
+    for name in headers:
+        cell = WriteOnlyCell(ws, value=name)
+        cell.font = Font(bold=True)
+        cell.alignment = Alignment(horizontal='center')
+        header_cells.append(cell)
+    ws.append(header_cells)
+
+    # Write-only rows are serialized on append, so one styled cell per column
+    # is reused for every row instead of styling each cell separately
+    row_cells = [WriteOnlyCell(ws) for _ in headers]
+    for cell in row_cells:
+        cell.alignment = Alignment(horizontal='center', wrap_text=True)
+    for row in df.itertuples(index=False):
+        for cell, v in zip(row_cells, row):
+            cell.value = v
+        ws.append(row_cells)
+
+    wb.save(output_path)
+
+
+def save_csv(dataframe, output_path):
+    _report_frame(dataframe).rename(columns=EXPORT_COLUMNS).to_csv(output_path, index=False)
+
+
+def save_parquet(dataframe, output_path):
+    """Parquet report (needs pyarrow); the text columns are stored as strings."""
+    df = _report_frame(dataframe).rename(columns=EXPORT_COLUMNS)
+    df.astype(str).to_parquet(output_path, index=False)
+
+
+_SAVERS = {
+    'xlsx': save_formatted_excel,
+    'csv': save_csv,
+    'parquet': save_parquet,
+}
+
+
+def save_report(dataframe, output_path, output_format='xlsx'):
+    """Save the mismatch report in one of ``OUTPUT_FORMATS``."""
+    try:
+        saver = _SAVERS[output_format]
+    except KeyError:
+        raise ValueError(f"Unknown output format {output_format!r}; expected one of {', '.join(OUTPUT_FORMATS)}") from None
+    saver(dataframe, output_path)
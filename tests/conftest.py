@@ -0,0 +1,51 @@
+"""Shared fixtures: small inventory workbooks written to ``tmp_path``."""
+
+import pytest
+from openpyxl import Workbook
+
+HEADER = ['Desk_ID', 'Place', 'Type', 'S.N1', 'S.N2', 'skan']
+
+# two exports of the same site; the comments say what each row exercises
+FILE1_ROWS = [
+    ['R100-1', 'T5', 'MNTR', 'V100001', 'V100002', None],   # V100002 only in file 1
+    ['R100-2', 'T5', 'MNTR', 'V100003', None, None],        # identical in file 2
+    ['R100-3', 'T5', 'MNTR', 'v-100004', None, None],       # moved to R100-4 in file 2
+    [None, None, 'MNTR', 'V100005', None, None],            # blank desk, file 2 knows the desk
+    [None, None, 'MNTR', 'V100006', 'V100012', None],       # blank desk: Unassigned / room only
+    ['R200-1', 'T5', 'PC', 'V100007', None, None],          # not a monitor
+    ['room 7410', 'T5', 'MNTR', 'V100008', None, None],     # desk spelled differently in file 2
+    ['K-2684', None, 'MNTR', None, None, 'XXV100009'],
+]
+FILE2_ROWS = [
+    ['R100-1', 'T5', 'MNTR', 'V100001', None, None],
+    ['R100-2', 'T5', 'MNTR', 'V100003', None, None],
+    ['R100-4', 'T5', 'MNTR', 'V100004', None, None],
+    ['R300-7', 'T5', 'MNTR', 'V100005', None, None],
+    [None, None, 'MNTR', 'V100010', None, None],            # blank desk, only in file 2
+    ['R500-1', 'T5', 'MNTR', 'V100012', None, None],
+    ['R500-2', 'T5', 'MNTR', 'V100012', None, None],
+    ['R200-1', 'T5', 'MNTR', 'V100011', None, None],
+    ['ROOM 7410', 'T5', 'MNTR', 'V100008', None, None],
+]
+
+
+def write_workbook(path, rows, header=HEADER, sheets=None):
+    """Save ``rows`` under ``header`` as an .xlsx; ``sheets`` maps sheet names to rows instead."""
+    wb = Workbook()
+    if sheets is None:
+        sheets = {'Sheet': rows}
+    wb.remove(wb.active)
+    for name, sheet_rows in sheets.items():
+        ws = wb.create_sheet(name)
+        ws.append(header)
+        for row in sheet_rows:
+            ws.append(row)
+    wb.save(path)
+    return str(path)
+
+
+@pytest.fixture
+def inventory_pair(tmp_path):
+    """Paths of the FILE1_ROWS / FILE2_ROWS workbooks."""
+    return (write_workbook(tmp_path / 'file1.xlsx', FILE1_ROWS),
+            write_workbook(tmp_path / 'file2.xlsx', FILE2_ROWS))
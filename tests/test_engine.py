@@ -0,0 +1,44 @@
+"""The engine's report must stay the one the original tkinter app wrote."""
+
+from desk_comparator.engine import RESULT_COLUMNS, compare_excels
+
+# the report of the pre-engine app.compare_excels for the conftest inventories
+EXPECTED = [
+    ('R', '', 'V100012', ''),
+    ('R', '1001', 'V100002', ''),
+    ('R', '1003', 'V100004', ''),
+    ('R', '1004', '', 'V100004'),
+    ('R', '2001', '', 'V100011'),
+    ('R', '5001', '', 'V100012'),
+    ('R', '5002', '', 'V100012'),
+    ('Unassigned', '', 'V100006', 'V100010'),
+]
+
+
+def _rows(frame):
+    return [tuple(row) for row in frame[RESULT_COLUMNS].fillna('').astype(str).itertuples(index=False)]
+
+
+def test_report_matches_original_app(inventory_pair):
+    result = compare_excels(*inventory_pair, None, parallel=False)
+    assert list(result.mismatches.columns) == RESULT_COLUMNS
+    assert _rows(result.mismatches) == EXPECTED
+    assert result.stats['mismatch_rows'] == len(EXPECTED)
+
+
+def test_long_form_rows_aggregate_to_the_report(inventory_pair):
+    result = compare_excels(*inventory_pair, None, parallel=False)
+    sides = {(r.Room, r.Desk_Number, r.Serial_Number): r.Side for r in result.serial_mismatches.itertuples()}
+    assert sides[('Unassigned', '', 'V100006')] == 1
+    assert sides[('Unassigned', '', 'V100010')] == 2
+    # the blank-desk serial file 2 places at R300-7 cancels out
+    assert not any(serial == 'V100005' for _, _, serial in sides)
+
+
+def test_saved_report(inventory_pair, tmp_path):
+    result = compare_excels(*inventory_pair, str(tmp_path / 'out'), output_format='csv', parallel=False)
+    assert result.output_path.endswith('.csv')
+    with open(result.output_path, encoding='utf-8') as f:
+        # the column names of the original desk_serial_mismatches.csv
+        assert f.readline().strip() == 'Room,Desk_Number,Serials_File1,Serials_File2'
+        assert sum(1 for _ in f) == len(EXPECTED)
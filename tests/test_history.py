@@ -0,0 +1,49 @@
+"""Serial history: each file content is recorded once, and only by runs that saved their report."""
+
+import pytest
+
+import desk_comparator.engine as engine
+from conftest import FILE1_ROWS, write_workbook
+from desk_comparator.errors import SaveError
+from desk_comparator.history import SerialHistory
+
+
+def test_record_once_per_content(tmp_path):
+    first = write_workbook(tmp_path / 'monday.xlsx', FILE1_ROWS)
+    copy = write_workbook(tmp_path / 'tuesday.xlsx', FILE1_ROWS)
+    with SerialHistory(str(tmp_path / 'history.sqlite')) as history:
+        assert history.record(first, ['R100-1'], ['V100001'])
+        # same bytes under another name: the digest was seen already
+        assert not history.record(copy, ['R200-1'], ['V100001'])
+        assert history.latest_desks(['V100001']) == {'V100001': 'R100-1'}
+        assert [seen['desk'] for seen in history.where('v-100001')] == ['R100-1']
+
+
+def test_ambiguous_serial_keeps_latest_desk(tmp_path):
+    first = write_workbook(tmp_path / 'monday.xlsx', FILE1_ROWS)
+    second = write_workbook(tmp_path / 'tuesday.xlsx', FILE1_ROWS[:2])
+    with SerialHistory(str(tmp_path / 'history.sqlite')) as history:
+        history.record(first, ['R100-1'], ['V100001'])
+        assert history.record(second, ['R100-2', 'R100-3'], ['V100001', 'V100001'])
+        assert history.latest_desks(['V100001']) == {'V100001': 'R100-1'}
+
+
+def test_failed_save_records_nothing(inventory_pair, tmp_path, monkeypatch):
+    path = str(tmp_path / 'history.sqlite')
+
+    def locked(*args):
+        raise PermissionError('locked')
+
+    with monkeypatch.context() as patch:
+        patch.setattr(engine, 'save_report', locked)
+        with pytest.raises(SaveError):
+            engine.compare_excels(*inventory_pair, str(tmp_path / 'out'), parallel=False, history=path)
+    with SerialHistory(path) as history:
+        assert history.latest_desks(['V100001', 'V100011']) == {}
+
+    # the retry records both files
+    result = engine.compare_excels(*inventory_pair, str(tmp_path / 'out'), parallel=False, history=path)
+    recorded, = [stage for stage in result.report.stages if stage['name'] == 'history_record']
+    assert recorded['rows_out'] == 2
+    with SerialHistory(path) as history:
+        assert history.latest_desks(['V100001', 'V100011']) == {'V100001': 'R1001', 'V100011': 'R2001'}
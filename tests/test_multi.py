@@ -0,0 +1,40 @@
+"""N-way reconciliation: the Found_in / Missing_from labels come from the source bit masks."""
+
+from conftest import FILE1_ROWS, FILE2_ROWS, write_workbook
+from desk_comparator.multi import SOURCE_COLUMNS, compare_many, source_labels
+
+
+def _rows(frame):
+    return [tuple(row) for row in frame[SOURCE_COLUMNS].itertuples(index=False)]
+
+
+def test_masks_name_the_sources(tmp_path):
+    paths = [
+        write_workbook(tmp_path / 'asset.xlsx', [['R100-1', 'T5', 'MNTR', 'V100001', None, None],
+                                                 ['R100-2', 'T5', 'MNTR', 'V100002', None, None]]),
+        write_workbook(tmp_path / 'scan.xlsx', [['R100-1', 'T5', 'MNTR', 'V100001', None, None],
+                                                ['R100-2', 'T5', 'MNTR', 'V100003', None, None]]),
+        write_workbook(tmp_path / 'fac.xlsx', [['R100-1', 'T5', 'MNTR', 'V100001', None, None],
+                                               ['R100-2', 'T5', 'MNTR', 'V100002', 'V100003', None]]),
+    ]
+    result = compare_many(paths, None, labels=['asset', 'scan', 'fac'], parallel=False)
+    # V100001 is in every source and is not reported
+    assert _rows(result.mismatches) == [
+        ('R', '1002', 'V100002', 'asset, fac', 'scan'),
+        ('R', '1002', 'V100003', 'scan, fac', 'asset'),
+    ]
+
+
+def test_two_sources(inventory_pair):
+    result = compare_many(list(inventory_pair), None, parallel=False)
+    found = {(r.Desk_Number, r.Serial_Number): (r.Found_in, r.Missing_from) for r in result.mismatches.itertuples()}
+    assert found[('1001', 'V100002')] == ('file1.xlsx', 'file2.xlsx')
+    assert found[('2001', 'V100011')] == ('file2.xlsx', 'file1.xlsx')
+    assert ('1002', 'V100003') not in found
+
+
+def test_default_labels_number_repeated_names(tmp_path):
+    first = write_workbook(tmp_path / 'inventory.xlsx', FILE1_ROWS)
+    (tmp_path / 'copy').mkdir()
+    second = write_workbook(tmp_path / 'copy' / 'inventory.xlsx', FILE2_ROWS)
+    assert source_labels([first, second]) == ['inventory.xlsx (1)', 'inventory.xlsx (2)']
@@ -0,0 +1,66 @@
+"""Near-match pairing rules: canonical forms, MIN_EDIT_LENGTH, one-to-one, desk before room, pseudo-rooms."""
+
+import pandas as pd
+
+from desk_comparator.nearmatch import MATCH_CONFUSABLE, MATCH_ONE_EDIT, find_near_matches
+
+
+def _mismatches(*rows):
+    return pd.DataFrame(list(rows), columns=['Room', 'Desk_Number', 'Serial_Number', 'Side'])
+
+
+def _pairs(near):
+    return [tuple(row) for row in near[['Desk_Number_File1', 'Desk_Number_File2', 'Serial_File1', 'Serial_File2',
+                                        'Match']].itertuples(index=False)]
+
+
+def test_confusable_characters():
+    near, matched = find_near_matches(_mismatches(('R', '1001', 'C0NB6', 1), ('R', '1001', 'CONB6', 2)))
+    assert _pairs(near) == [('1001', '1001', 'C0NB6', 'CONB6', MATCH_CONFUSABLE)]
+    assert matched.tolist() == [True, True]
+
+
+def test_one_edit_needs_min_length():
+    near, matched = find_near_matches(_mismatches(
+        ('R', '1001', 'AB123', 1), ('R', '1001', 'AB124', 2),        # five characters: chance
+        ('R', '1002', 'AB1234', 1), ('R', '1002', 'AB1235', 2),
+    ))
+    assert _pairs(near) == [('1002', '1002', 'AB1234', 'AB1235', MATCH_ONE_EDIT)]
+    assert matched.tolist() == [False, False, True, True]
+
+
+def test_each_serial_paired_once():
+    near, matched = find_near_matches(_mismatches(
+        ('R', '1001', 'X00001', 1), ('R', '1001', 'XO0001', 2), ('R', '1001', 'X0O001', 2),
+    ))
+    # greedy in serial order, whatever the row order
+    assert _pairs(near) == [('1001', '1001', 'X00001', 'X0O001', MATCH_CONFUSABLE)]
+    assert matched.tolist() == [True, False, True]
+
+
+def test_same_desk_before_same_room():
+    near, matched = find_near_matches(_mismatches(
+        ('R', '1001', 'ABC1234', 1),
+        ('R', '1002', 'ABC1Z34', 2),   # confusable, but at another desk
+        ('R', '1001', 'ABC1235', 2),   # one character off at the same desk
+        ('R', '2001', 'KLM9876', 1), ('R', '2002', 'KLM9B76', 2),
+    ))
+    assert _pairs(near) == [
+        ('1001', '1001', 'ABC1234', 'ABC1235', MATCH_ONE_EDIT),
+        ('2001', '2002', 'KLM9876', 'KLM9B76', MATCH_CONFUSABLE),
+    ]
+    assert matched.tolist() == [True, False, True, True, True]
+
+
+def test_moved_serial_is_not_a_misread():
+    near, _ = find_near_matches(_mismatches(('R', '1001', 'ABC1234', 1), ('R', '1002', 'ABC1234', 2)))
+    assert near.empty
+
+
+def test_pseudo_rooms_not_paired():
+    near, matched = find_near_matches(_mismatches(
+        ('Unassigned', '', 'ABC1234', 1), ('Unassigned', '', 'ABC1Z34', 2),
+        ('Blanks', '', 'QWE5678', 1), ('Blanks', '', 'QWE5679', 2),
+    ))
+    assert near.empty
+    assert not matched.any()
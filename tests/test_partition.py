@@ -0,0 +1,30 @@
+"""The out-of-core comparison must report what the in-memory engine reports."""
+
+import pytest
+
+from desk_comparator.engine import RESULT_COLUMNS, compare_excels
+from desk_comparator.partition import compare_partitioned
+
+
+def _rows(frame):
+    return [tuple(row) for row in frame[RESULT_COLUMNS].fillna('').astype(str).itertuples(index=False)]
+
+
+@pytest.mark.parametrize('partitions', [1, 7, 16])
+@pytest.mark.parametrize('chunk_rows', [2, 1000])
+def test_matches_in_memory(inventory_pair, tmp_path, partitions, chunk_rows):
+    expected = compare_excels(*inventory_pair, None, parallel=False)
+    scratch = tmp_path / 'scratch'
+    scratch.mkdir()
+    result = compare_partitioned(*inventory_pair, None, partitions=partitions, chunk_rows=chunk_rows,
+                                 work_dir=str(scratch))
+    assert _rows(result.mismatches) == _rows(expected.mismatches)
+    for key in ('only_in_file1', 'only_in_file2', 'mismatch_rows'):
+        assert result.stats[key] == expected.stats[key], key
+    # the scratch folder is removed afterwards
+    assert list(scratch.iterdir()) == []
+
+
+def test_rejects_no_partitions(inventory_pair):
+    with pytest.raises(ValueError):
+        compare_partitioned(*inventory_pair, None, partitions=0)
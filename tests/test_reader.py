@@ -0,0 +1,71 @@
+"""Regression tests for the inventory readers."""
+
+import pandas as pd
+from openpyxl import Workbook
+
+from desk_comparator.engine import compare_excels
+from desk_comparator.reader import iter_inventory, read_inventory, read_with_pandas
+
+HEADER = ['Desk_ID', 'Type', 'S.N1', 'S.N2']
+PLACEHOLDER_ROWS = [
+    ['R100-1', 'MNTR', 'V111111', 'N/A'],
+    ['N/A', 'MNTR', 'V222222', None],
+    ['NA', 'MNTR', 'NA', None],
+    ['NULL', 'MNTR', 'V333333', '#N/A'],
+    ['R100-2', 'MNTR', 'None', 'null'],
+]
+
+
+def _workbook(path, rows):
+    wb = Workbook()
+    ws = wb.active
+    ws.append(HEADER)
+    for row in rows:
+        ws.append(row)
+    wb.save(path)
+    return str(path)
+
+
+def test_placeholder_text_reads_as_missing(tmp_path):
+    path = _workbook(tmp_path / 'inventory.xlsx', PLACEHOLDER_ROWS)
+    streamed = read_inventory(path)
+    expected = read_with_pandas(path)
+    assert streamed.isna().equals(expected.isna())
+    assert streamed.fillna('').astype(str).equals(expected.fillna('').astype(str))
+
+
+def test_placeholder_text_adds_no_report_rows(tmp_path):
+    file1 = _workbook(tmp_path / 'file1.xlsx', PLACEHOLDER_ROWS)
+    file2 = _workbook(tmp_path / 'file2.xlsx', [['R100-1', 'MNTR', 'V111111', None]])
+    report = compare_excels(file1, file2, None).mismatches.fillna('').astype(str)
+    text = pd.concat([report[c] for c in report.columns])
+    assert not text.str.upper().isin(['NA', 'N/A', 'NULL', 'NONE', '#N/A']).any()
+    assert not text.str.upper().str.contains('NULL').any()
+
+
+def test_placeholder_text_same_in_every_format(tmp_path):
+    path = _workbook(tmp_path / 'inventory.xlsx', PLACEHOLDER_ROWS)
+    frame = pd.DataFrame(PLACEHOLDER_ROWS, columns=HEADER).fillna('')
+    frame.to_csv(tmp_path / 'inventory.csv', index=False)
+    frame.to_parquet(tmp_path / 'inventory.parquet', index=False)
+    expected = read_inventory(path).fillna('<missing>').astype(str)
+    for other in ('inventory.csv', 'inventory.parquet'):
+        got = read_inventory(str(tmp_path / other)).fillna('<missing>').astype(str)
+        assert got.equals(expected), other
+
+
+def test_chunks_read_the_selected_sheet(tmp_path):
+    wb = Workbook()
+    wb.active.title = 'North'
+    wb.active.append(HEADER)
+    wb.active.append(['R100-1', 'MNTR', 'V111111', None])
+    south = wb.create_sheet('South')
+    south.append(HEADER)
+    for number in range(5):
+        south.append([f'R200-{number}', 'MNTR', f'V20000{number}', None])
+    wb.save(tmp_path / 'site.xlsx')
+    path = str(tmp_path / 'site.xlsx')
+    chunks = list(iter_inventory(path, 2, sheet='South'))
+    assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+    streamed = pd.concat(chunks, ignore_index=True)
+    assert streamed.equals(read_inventory(path, sheet='South'))
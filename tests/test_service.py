@@ -0,0 +1,66 @@
+"""The HTTP service only answers requests addressed to localhost (no DNS rebinding)."""
+
+import http.client
+import json
+import threading
+
+import pytest
+
+from desk_comparator.service import ComparisonService, make_server
+
+
+@pytest.fixture
+def server(tmp_path):
+    service = ComparisonService(work_dir=str(tmp_path), workers=1)
+    server = make_server(service, '127.0.0.1', 0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+    service.close()
+
+
+def _request(server, method, path, headers):
+    connection = http.client.HTTPConnection('127.0.0.1', server.server_address[1], timeout=10)
+    try:
+        # skip_host: send the Host header of the test, or none at all
+        connection.putrequest(method, path, skip_host=True)
+        for name, value in headers.items():
+            connection.putheader(name, value)
+        connection.putheader('Content-Length', '0')
+        connection.endheaders()
+        response = connection.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        connection.close()
+
+
+def test_local_hosts_are_answered(server):
+    port = server.server_address[1]
+    for host in ('127.0.0.1', 'localhost', '[::1]', 'LOCALHOST'):
+        status, body = _request(server, 'GET', '/baselines', {'Host': f'{host}:{port}'})
+        assert (status, body) == (200, []), host
+
+
+def test_foreign_host_is_rejected(server):
+    port = server.server_address[1]
+    for headers in ({'Host': f'attacker.example:{port}'}, {'Host': 'localhost:1'}, {}):
+        status, _ = _request(server, 'GET', '/baselines', headers)
+        assert status == 403, headers
+
+
+def test_foreign_origin_post_is_rejected(server):
+    port = server.server_address[1]
+    host = f'localhost:{port}'
+    status, _ = _request(server, 'POST', '/baselines', {'Host': host, 'Origin': 'http://attacker.example'})
+    assert status == 403
+    # a local page, or a client without an Origin, reaches the endpoint (and fails on the empty body)
+    for headers in ({'Host': host, 'Origin': f'http://{host}'}, {'Host': host}):
+        status, _ = _request(server, 'POST', '/baselines', headers)
+        assert status == 411, headers
+
+
+def test_max_baselines_must_be_positive(tmp_path):
+    with pytest.raises(ValueError):
+        ComparisonService(work_dir=str(tmp_path), max_baselines=0)
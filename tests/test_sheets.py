@@ -0,0 +1,43 @@
+"""Sheet selection: a selection applies to multi-sheet workbooks, a single-sheet one is read whole."""
+
+import pytest
+
+from conftest import FILE1_ROWS, FILE2_ROWS, write_workbook
+from desk_comparator.cli import main
+from desk_comparator.engine import compare_excels
+from desk_comparator.errors import ReadError
+
+SOUTH_ROWS = [['R900-1', 'T5', 'MNTR', 'V900001', None, None]]
+
+
+def _serials(result):
+    return sorted((r.Room, r.Desk_Number, r.Serial_Number, r.Side) for r in result.serial_mismatches.itertuples())
+
+
+@pytest.fixture
+def site_and_master(tmp_path):
+    """A site workbook with North / South sheets and a single-sheet master of the North building."""
+    site = write_workbook(tmp_path / 'site.xlsx', None, sheets={'North': FILE1_ROWS, 'South': SOUTH_ROWS})
+    master = write_workbook(tmp_path / 'master.xlsx', FILE2_ROWS)
+    return site, master
+
+
+def test_selection_skips_single_sheet_workbook(site_and_master, inventory_pair):
+    result = compare_excels(*site_and_master, None, parallel=False, sheets=['North'])
+    # the mismatches of the plain files, each listed on the sheet it came from
+    expected = compare_excels(*inventory_pair, None, parallel=False)
+    assert _serials(result) == _serials(expected)
+    assert set(result.mismatches['Sheet']) == {'North', 'Sheet'}
+    assert result.stats['sheets_file1'] == ['North']
+    assert result.stats['sheets_file2'] == ['Sheet']
+
+
+def test_missing_sheet_of_multi_sheet_workbook(site_and_master):
+    with pytest.raises(ReadError):
+        compare_excels(*site_and_master, None, parallel=False, sheets=['West'])
+
+
+def test_cli_sheet_with_single_sheet_master(site_and_master, tmp_path):
+    argv = [*site_and_master, '-o', str(tmp_path / 'out'), '-q', '--no-cache', '--no-parallel', '--sheet', 'North']
+    assert main(['compare', *argv]) == 0
+    assert len(list((tmp_path / 'out').iterdir())) == 1
@@ -0,0 +1,62 @@
+"""Incremental (snapshot) mode: new/resolved/unchanged, skipping, and equality with a full run."""
+
+from conftest import FILE2_ROWS, write_workbook
+from desk_comparator.engine import compare_excels
+from desk_comparator.snapshot import SnapshotStore, compare_incremental
+
+
+def _run(tmp_path, file1, file2):
+    return compare_incremental(file1, file2, None, name='daily', snapshot_dir=str(tmp_path / 'snapshots'),
+                               parallel=False)
+
+
+def _stored_rows(tmp_path):
+    _, rows, _ = SnapshotStore(str(tmp_path / 'snapshots')).load('daily')
+    return rows
+
+
+def test_first_run_reports_everything_as_new(inventory_pair, tmp_path):
+    result = _run(tmp_path, *inventory_pair)
+    full = compare_excels(*inventory_pair, None, parallel=False)
+    assert result.previous_run is None
+    assert result.stats['new'] == len(full.serial_mismatches)
+    assert set(result.changes['Status']) == {'New'}
+
+
+def test_unchanged_inputs_are_skipped(inventory_pair, tmp_path):
+    _run(tmp_path, *inventory_pair)
+    result = _run(tmp_path, *inventory_pair)
+    assert result.stats['skipped'] is True
+    assert result.changes.empty
+    assert result.stats['unchanged'] == len(_stored_rows(tmp_path))
+
+
+def test_changed_serials_only_are_recomputed(inventory_pair, tmp_path):
+    file1, file2 = inventory_pair
+    _run(tmp_path, file1, file2)
+    # next day: V100002 is found in file 2 and V100013 goes missing from file 1
+    day2 = write_workbook(tmp_path / 'file2_day2.xlsx',
+                          FILE2_ROWS + [['R100-1', 'T5', 'MNTR', 'V100002', None, None],
+                                        ['R600-1', 'T5', 'MNTR', 'V100013', None, None]])
+    result = _run(tmp_path, file1, day2)
+    assert result.stats['skipped'] is False
+    assert result.stats['serials_recomputed'] == 2
+    changes = {(r.Status, r.Room, r.Desk_Number, r.Only_in_File1, r.Only_in_File2)
+               for r in result.changes.itertuples()}
+    assert changes == {('Resolved', 'R', '1001', 'V100002', ''), ('New', 'R', '6001', '', 'V100013')}
+    # the merged snapshot is exactly what a full comparison gives
+    full = compare_excels(file1, day2, None, parallel=False).serial_mismatches
+    assert _stored_rows(tmp_path).astype(str).equals(full.astype(str).reset_index(drop=True))
+
+
+def test_blank_desk_inference_follows_a_changed_serial(inventory_pair, tmp_path):
+    file1, file2 = inventory_pair
+    _run(tmp_path, file1, file2)
+    # V100006 (blank desk in file 1, Unassigned so far) now has a desk in file 2
+    day2 = write_workbook(tmp_path / 'file2_day2.xlsx', FILE2_ROWS + [['R700-1', 'T5', 'MNTR', 'V100006', None, None]])
+    result = _run(tmp_path, file1, day2)
+    resolved = result.changes[result.changes['Status'] == 'Resolved']
+    assert list(resolved['Only_in_File1']) == ['V100006']
+    full = compare_excels(file1, day2, None, parallel=False).serial_mismatches
+    assert _stored_rows(tmp_path).astype(str).equals(full.astype(str).reset_index(drop=True))
+